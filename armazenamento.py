@@ -0,0 +1,909 @@
+import os
+import time
+import random
+import sqlite3
+import threading
+from datetime import datetime
+import pandas as pd
+from campos import limpar_data_sem_ano
+from metricas import medir, contar
+
+# Escritas deste processo invalidam na hora; o TTL cobre escritas de outros servidores
+TTL_GUIAS = 60
+
+# Backend dos dados: "local+sheets" (SQLite local + Sheets em segundo plano), "local" (offline) ou "sheets"
+MODO_ARMAZENAMENTO = os.environ.get("FUSEX_BACKEND", "local+sheets")
+CAMINHO_DB = os.environ.get("FUSEX_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados", "fusex.sqlite3"))
+
+COLUNAS_GUIAS = ["fatura_ref", "mes_competencia", "ano_competencia", "tipo_usuario", "servicos_fatura", "paciente_nome", "nr_guia", "prec_cp", "data_atend", "cod_proced", "valor", "data_lancamento"]
+COLUNAS_USUARIOS = ["username", "name", "password_hash", "created_at"]
+# Cubo do dashboard: uma linha por fatura (competência, convênio, serviço) com nº de guias e valor
+COLUNAS_AGREGADOS = ["ano", "mes", "tipo_usuario", "servico", "fatura_ref", "guias", "valor"]
+MESES = ["Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho", "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"]
+# Filtros aceitos por consultar(): busca parcial em paciente, prefixo em nr_guia/prec_cp, igualdade no resto
+FILTROS_GUIAS = ["paciente", "nr_guia", "prec_cp", "ano", "mes", "tipo_usuario", "fatura_ref"]
+# Colunas que o editor da fatura altera (o resto é da fatura, não da guia)
+CAMPOS_EDITAVEIS = ["paciente_nome", "nr_guia", "prec_cp", "data_atend", "cod_proced", "valor"]
+
+# ==========================================
+# 🧾 LINHAS DA ABA "guias"
+# ==========================================
+
+def montar_registros(df_editado, fatura_ref, meta_dados):
+    """Converte as linhas do editor (colunas do DOCX) em registros da aba 'guias'.
+
+    Se o editor trouxer a coluna 'id' (linha do banco local), ela segue no
+    registro para o merge por linha de ArmazenamentoLocal.editar_fatura.
+    """
+    data_hoje = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    fatura_ref_safe = f"'{fatura_ref}"
+    lista_novos = []
+    for _, row in df_editado.iterrows():
+        try: val = float(row['VALOR (R$)'])
+        except: val = 0.0
+
+        prec_valor = row.get('PREC-CP/SIAPE', '')
+        if pd.isna(prec_valor): prec_valor = ""
+        if not prec_valor and 'prec_cp' in row: prec_valor = row['prec_cp']
+
+        lista_novos.append({
+            "fatura_ref": fatura_ref_safe,
+            "mes_competencia": meta_dados['mes'],
+            "ano_competencia": meta_dados['ano'],
+            "tipo_usuario": meta_dados['usuario'],
+            "servicos_fatura": meta_dados['servico'],
+            "paciente_nome": row['NOME DO PACIENTE'],
+            "nr_guia": row['NR DA GUIA'],
+            "prec_cp": str(prec_valor),
+            "data_atend": limpar_data_sem_ano(row['DATA ATEND.']),
+            "cod_proced": row['CÓDIGO PROCED.'],
+            "valor": val,
+            "data_lancamento": data_hoje
+        })
+        if _inteiro(row.get('id')) is not None: lista_novos[-1]["id"] = _inteiro(row['id'])
+    return lista_novos
+
+def _celula(v):
+    """Valor pronto para a API do Sheets (sem NaN nem tipos do numpy)."""
+    if v is None: return ""
+    try:
+        if pd.isna(v): return ""
+    except (TypeError, ValueError): pass
+    if hasattr(v, "item"): return v.item()
+    return v
+
+def _blocos_contiguos(linhas):
+    """[5, 6, 7, 10, 11] -> [(5, 7), (10, 11)]"""
+    blocos = []
+    for n in sorted(linhas):
+        if blocos and n == blocos[-1][1] + 1: blocos[-1][1] = n
+        else: blocos.append([n, n])
+    return [tuple(b) for b in blocos]
+
+def guias_vazias():
+    return pd.DataFrame(columns=COLUNAS_GUIAS)
+
+def normalizar_guias(df):
+    """Tipagem feita uma vez por carga: fatura_ref sem apóstrofo e valor numérico."""
+    if df.empty: return df
+    if 'fatura_ref' in df.columns:
+        df['fatura_ref'] = df['fatura_ref'].astype(str).str.replace("'", "", regex=False)
+    if 'valor' in df.columns:
+        df['valor'] = pd.to_numeric(df['valor'], errors='coerce')
+    return df
+
+def agregar_guias(df):
+    """Monta o cubo do dashboard a partir das guias (usado quando não há banco local)."""
+    if df.empty or 'fatura_ref' not in df.columns: return pd.DataFrame(columns=COLUNAS_AGREGADOS)
+    cubo = (df.rename(columns={"ano_competencia": "ano", "mes_competencia": "mes", "servicos_fatura": "servico"})
+              .groupby(["ano", "mes", "tipo_usuario", "servico", "fatura_ref"], dropna=False)
+              .agg(guias=("fatura_ref", "size"), valor=("valor", "sum")).reset_index())
+    return cubo[COLUNAS_AGREGADOS]
+
+def _ocorrencia(fatura_ref, mes, ano, valor):
+    return {"fatura_ref": _texto(fatura_ref), "mes": _texto(mes), "ano": _texto(ano), "valor": valor}
+
+def indexar_guias(df):
+    indice = {}
+    if df.empty or 'nr_guia' not in df.columns: return indice
+    for nr, ref, mes, ano, valor in zip(df["nr_guia"], df["fatura_ref"], df["mes_competencia"], df["ano_competencia"], df["valor"]):
+        nr = _texto(nr)
+        if nr: indice.setdefault(nr, []).append(_ocorrencia(ref, mes, ano, valor))
+    return indice
+
+def avisos_duplicidade(nrs, achadas, fatura_atual=None):
+    """Aviso por linha: guia repetida na própria tabela e/ou já lançada em outra fatura."""
+    nrs = [_texto(n).strip() for n in nrs]
+    contagem = {}
+    for n in nrs: contagem[n] = contagem.get(n, 0) + 1
+    avisos = []
+    for n in nrs:
+        partes = []
+        if n and contagem[n] > 1: partes.append("repetida na tabela")
+        outras = [h for h in achadas.get(n, []) if fatura_atual is None or h["fatura_ref"] != str(fatura_atual)] if n else []
+        if outras: partes.append("já na fatura " + ", ".join(f"{h['fatura_ref']} ({h['mes']}/{h['ano']})" for h in outras[:3]))
+        avisos.append(("⚠️ " + "; ".join(partes)) if partes else "")
+    return avisos
+
+# ==========================================
+# 🗃 CACHE DOS DADOS (compartilhado entre abas e sessões)
+# ==========================================
+
+class CacheGuias:
+    """Guarda a aba 'guias' já tipada para todas as abas e sessões do processo.
+
+    `carregar` faz a leitura remota; só é chamada na primeira vez, depois de
+    `invalidar()` (toda escrita) ou quando passa o TTL. O DataFrame devolvido é
+    compartilhado: quem precisar alterar deve fazer .copy().
+    """
+
+    def __init__(self, carregar, ttl=TTL_GUIAS):
+        self._carregar = carregar
+        self.ttl = ttl
+        self._df = None
+        self._cubo = None
+        self._indice_nr = None
+        self._carregado_em = 0.0
+        self._lock = threading.Lock()
+
+    def obter(self):
+        with self._lock:
+            if self._df is None or time.monotonic() - self._carregado_em > self.ttl:
+                try: df = self._carregar()
+                except Exception: return guias_vazias()  # falha não fica no cache
+                self._df = normalizar_guias(df); self._cubo = self._indice_nr = None; self._carregado_em = time.monotonic()
+            return self._df
+
+    def agregados(self):
+        """Cubo calculado uma vez por carga das guias."""
+        df = self.obter()
+        with self._lock:
+            if self._cubo is None or self._cubo[0] is not df: self._cubo = (df, agregar_guias(df))
+            return self._cubo[1]
+
+    def indice_guias(self):
+        """nr_guia -> [{fatura_ref, mes, ano, valor}], montado uma vez por carga das guias."""
+        df = self.obter()
+        with self._lock:
+            if self._indice_nr is None or self._indice_nr[0] is not df: self._indice_nr = (df, indexar_guias(df))
+            return self._indice_nr[1]
+
+    def invalidar(self):
+        with self._lock: self._df = None; self._cubo = None; self._indice_nr = None
+
+# ==========================================
+# 🔎 CONSULTAS (paginadas, filtradas no servidor)
+# ==========================================
+# consultar(filtros, pagina, por_pagina) -> (página como DataFrame, total de guias)
+# faturas(busca, limite) -> fatura_ref mais recentes primeiro
+# fatura_existe(ref) -> se já há guias nessa fatura_ref (exata, não busca)
+# guias_das_faturas(refs) -> guias só dessas faturas
+# localizar_guias(nrs) -> {nr_guia: [{fatura_ref, mes, ano, valor}, ...]} (checagem de duplicidade)
+
+def _contendo(texto):
+    """Padrão LIKE de "contém `texto`" com %, _ e \\ literais (usar com ESCAPE '\\')."""
+    texto = str(texto).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{texto}%"
+
+def _filtros_ativos(filtros):
+    return {k: str(v).strip() for k, v in (filtros or {}).items() if k in FILTROS_GUIAS and v not in (None, "") and str(v).strip()}
+
+class ConsultaMemoria:
+    """Consultas sobre as guias em memória (backend só com Sheets, sem banco local)."""
+
+    def __init__(self, cache):
+        self._cache = cache
+        self._obter = cache.obter
+
+    def _filtrar(self, df, filtros):
+        m = pd.Series(True, index=df.index)
+        for campo, valor in _filtros_ativos(filtros).items():
+            if campo == "paciente": m &= df["paciente_nome"].astype(str).str.contains(valor, case=False, regex=False)
+            elif campo in ("nr_guia", "prec_cp"): m &= df[campo].astype(str).str.startswith(valor)
+            elif campo == "ano": m &= pd.to_numeric(df["ano_competencia"], errors="coerce") == _inteiro(valor)
+            elif campo == "mes": m &= df["mes_competencia"].astype(str) == valor
+            else: m &= df[campo].astype(str) == valor
+        return df[m]
+
+    def consultar(self, filtros=None, pagina=1, por_pagina=50):
+        df = self._obter()
+        if df.empty: return df, 0
+        achadas = self._filtrar(df, filtros).iloc[::-1]
+        ini = (max(1, pagina) - 1) * por_pagina
+        return achadas.iloc[ini:ini + por_pagina], len(achadas)
+
+    def faturas(self, busca="", limite=100):
+        df = self._obter()
+        if df.empty: return []
+        refs = pd.Series(df["fatura_ref"].astype(str).unique()[::-1])
+        if busca: refs = refs[refs.str.contains(str(busca).strip(), regex=False)]
+        return refs.head(limite).tolist()
+
+    def fatura_existe(self, fatura_ref):
+        df = self._obter()
+        return not df.empty and (df["fatura_ref"].astype(str) == str(fatura_ref).strip()).any()
+
+    def guias_das_faturas(self, refs):
+        df = self._obter()
+        if df.empty: return df
+        return df[df["fatura_ref"].astype(str).isin([str(r) for r in refs])]
+
+    def localizar_guias(self, nrs):
+        indice = self._cache.indice_guias()
+        return {n: indice[n] for n in {_texto(n) for n in nrs} if n in indice}
+
+# ==========================================
+# ☁️ ESCRITA INCREMENTAL NO GOOGLE SHEETS
+# ==========================================
+
+def _aba(conn, nome):
+    """Worksheet do gspread, pelo cliente de conta de serviço da st-gsheets-connection (versão fixada no
+    requirements.txt: _select_worksheet não é API pública). Planilha pública não tem esse cliente."""
+    selecionar = getattr(conn.client, "_select_worksheet", None)
+    if selecionar is None:
+        raise ValueError("A conexão 'gsheets' é de planilha pública (só leitura): para gravar, use type = \"service_account\" no .streamlit/secrets.toml")
+    return selecionar(worksheet=nome)
+
+class PlanilhaGuias:
+    """Escrita incremental na aba 'guias'.
+
+    Salvar uma fatura nova só faz append das linhas dela; atualizar reescreve só as
+    linhas daquela fatura. As posições vêm de um índice fatura_ref -> linhas da planilha,
+    montado lendo apenas a coluna fatura_ref e conferido na faixa antes de cada escrita.
+    O gspread só é importado aqui dentro: o modo "local" não carrega nada do Sheets.
+    """
+
+    def __init__(self, conn, aba="guias"):
+        self.conn = conn
+        self.aba = aba
+        self._ws = None
+        self._cabecalho = None
+        self._indice = None
+        self._lock = threading.Lock()
+
+    # --- ACESSO À ABA ---
+    def _worksheet(self):
+        from gspread.exceptions import WorksheetNotFound
+        if self._ws is None:
+            try: self._ws = _aba(self.conn, self.aba)
+            except WorksheetNotFound: self._ws = _aba(self.conn, 0)
+        return self._ws
+
+    def _colunas(self):
+        if self._cabecalho is None:
+            ws = self._worksheet()
+            cabecalho = ws.row_values(1)
+            if not cabecalho:
+                ws.update(range_name="A1", values=[COLUNAS_GUIAS])
+                cabecalho = list(COLUNAS_GUIAS)
+            self._cabecalho = cabecalho
+        return self._cabecalho
+
+    def _valores(self, registros):
+        return [[_celula(r.get(c, "")) for c in self._colunas()] for r in registros]
+
+    def _letra_fatura(self):
+        from gspread.utils import rowcol_to_a1
+        return rowcol_to_a1(1, self._colunas().index("fatura_ref") + 1)[:-1]
+
+    # --- ÍNDICE fatura_ref -> LINHAS ---
+    def _carregar_indice(self):
+        contar("leituras_remotas")
+        with medir("sheets.indice_faturas"):
+            col = self._worksheet().col_values(self._colunas().index("fatura_ref") + 1)
+        indice = {}
+        for n, ref in enumerate(col[1:], start=2):
+            ref = str(ref).replace("'", "")
+            if ref: indice.setdefault(ref, []).append(n)
+        self._indice = indice
+
+    def linhas_da_fatura(self, fatura_ref):
+        if self._indice is None: self._carregar_indice()
+        return list(self._indice.get(str(fatura_ref), []))
+
+    def _confere(self, fatura_ref, linhas):
+        """Confere na planilha se as linhas do índice ainda são dessa fatura (outro usuário pode ter escrito)."""
+        if not linhas: return True
+        letra = self._letra_fatura()
+        ini, fim = min(linhas), max(linhas)
+        col = self._worksheet().get(f"{letra}{ini}:{letra}{fim}")
+        valores = [str(c[0]).replace("'", "") if c else "" for c in col]
+        valores += [""] * (fim - ini + 1 - len(valores))
+        return all(valores[n - ini] == str(fatura_ref) for n in linhas)
+
+    # --- ESCRITA ---
+    def anexar(self, registros):
+        """Append só das linhas novas, no fim da aba."""
+        if not registros: return
+        from gspread.utils import a1_range_to_grid_range
+        with self._lock:
+            resp = self._worksheet().append_rows(self._valores(registros), value_input_option="USER_ENTERED")
+            if self._indice is None: return
+            try:
+                faixa = a1_range_to_grid_range(resp["updates"]["updatedRange"].split("!")[-1])
+                primeira = faixa["startRowIndex"] + 1
+            except (KeyError, TypeError): self._indice = None; return
+            for n, r in enumerate(registros, start=primeira):
+                self._indice.setdefault(str(r["fatura_ref"]).replace("'", ""), []).append(n)
+
+    def atualizar_fatura(self, fatura_ref, registros):
+        """Reescreve só as linhas da fatura: sobrescreve no lugar, apaga sobras e insere o excedente logo abaixo."""
+        from gspread.utils import rowcol_to_a1
+        with self._lock:
+            linhas = self.linhas_da_fatura(fatura_ref)
+            if not self._confere(fatura_ref, linhas):
+                self._carregar_indice(); linhas = self.linhas_da_fatura(fatura_ref)
+            ws = self._worksheet(); valores = self._valores(registros)
+            ultima_col = rowcol_to_a1(1, len(self._colunas()))[:-1]
+
+            reaproveitadas = linhas[:len(valores)]
+            atualizacoes = []; k = 0
+            for ini, fim in _blocos_contiguos(reaproveitadas):
+                n = fim - ini + 1
+                atualizacoes.append({"range": f"A{ini}:{ultima_col}{fim}", "values": valores[k:k + n]}); k += n
+            if atualizacoes: ws.batch_update(atualizacoes, value_input_option="USER_ENTERED")
+
+            estrutura_mudou = False
+            sobras = linhas[len(valores):]
+            for ini, fim in reversed(_blocos_contiguos(sobras)):
+                ws.delete_rows(ini, fim); estrutura_mudou = True
+
+            excedente = valores[len(linhas):]
+            if excedente:
+                if reaproveitadas:
+                    ws.insert_rows(excedente, row=max(reaproveitadas) + 1, value_input_option="USER_ENTERED")
+                else:
+                    ws.append_rows(excedente, value_input_option="USER_ENTERED")
+                estrutura_mudou = True
+
+            # Inserir/apagar desloca as linhas abaixo: o índice é remontado na próxima operação
+            if estrutura_mudou: self._indice = None
+
+    def sincronizar(self, faturas):
+        """Deixa cada fatura da planilha igual a faturas[ref] (lista de registros).
+
+        Idempotente: o índice é relido antes, então repetir depois de uma falha no meio
+        (ou de uma resposta perdida) não duplica linhas. As faturas que a planilha ainda
+        não tem vão todas num append só; as outras são reescritas no lugar.
+        """
+        with self._lock: self._carregar_indice()
+        novas = [ref for ref, registros in faturas.items() if registros and not self.linhas_da_fatura(ref)]
+        self.anexar([r for ref in novas for r in faturas[ref]])
+        for ref, registros in faturas.items():
+            if ref not in novas: self.atualizar_fatura(ref, registros)
+
+# ==========================================
+# 🔌 BACKENDS DE ARMAZENAMENTO
+# ==========================================
+# Todos expõem a mesma interface: carregar(), anexar(registros),
+# atualizar_fatura(fatura_ref, registros), carregar_usuarios(), anexar_usuario(registro).
+# Os que têm banco local também têm agregados() (cubo mantido a cada escrita) e as
+# consultas indexadas (consultar, faturas, guias_das_faturas).
+
+class ArmazenamentoSheets:
+    """Google Sheets direto (cada operação paga a latência da API)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.planilha = PlanilhaGuias(conn)
+
+    def carregar(self):
+        contar("leituras_remotas")
+        with medir("sheets.carregar"): return self.conn.read(worksheet="guias", ttl=0)
+
+    def anexar(self, registros):
+        with medir("sheets.anexar", linhas=len(registros)): self.planilha.anexar(registros)
+
+    def atualizar_fatura(self, fatura_ref, registros):
+        with medir("sheets.atualizar_fatura", linhas=len(registros)): self.planilha.atualizar_fatura(fatura_ref, registros)
+
+    def sincronizar_faturas(self, faturas):
+        with medir("sheets.sincronizar", faturas=len(faturas)): self.planilha.sincronizar(faturas)
+
+    def carregar_usuarios(self):
+        contar("leituras_remotas")
+        with medir("sheets.carregar_usuarios"): return self.conn.read(worksheet="usuarios", ttl=0)
+
+    def anexar_usuario(self, registro):
+        """Append de uma linha na aba 'usuarios' (sem reler nem reescrever as outras)."""
+        with medir("sheets.anexar_usuario"):
+            ws = _aba(self.conn, "usuarios")
+            colunas = ws.row_values(1) or COLUNAS_USUARIOS
+            ws.append_row([_celula(registro.get(c, "")) for c in colunas], value_input_option="RAW")
+
+def _texto(v):
+    """Normaliza números lidos do Sheets como float (12345.0 -> '12345')."""
+    v = _celula(v)
+    if isinstance(v, float) and v.is_integer(): v = int(v)
+    return str(v).replace("'", "") if v != "" else ""
+
+def _inteiro(v):
+    try: return int(float(v))
+    except (TypeError, ValueError): return None
+
+def _sequencial(fatura_ref, mes):
+    """Sequencial de uma fatura_ref "mes.seq" (0 se for de outro mês ou fora do padrão)."""
+    prefixo, _, seq = str(fatura_ref).partition(".")
+    return int(seq) if prefixo == str(mes) and seq.isdigit() else 0
+
+def _editaveis(r):
+    """Campos editáveis normalizados: é o que conta para "a linha mudou"."""
+    return tuple(_texto(r.get(c, "")) for c in CAMPOS_EDITAVEIS[:-1]) + (round(float(_celula(r.get("valor")) or 0.0), 2),)
+
+def _conflito(r, motivo):
+    return {"NR DA GUIA": _texto(r.get("nr_guia", "")), "NOME DO PACIENTE": _texto(r.get("paciente_nome", "")), "CONFLITO": motivo}
+
+class ArmazenamentoLocal:
+    """Banco SQLite local: caminho rápido e fonte da verdade do app.
+
+    Indexado por fatura_ref, nr_guia e competência (ano, mês). Sem Sheets
+    configurado ("local") também guarda os usuários, para rodar offline. Com
+    `replicar`, cada escrita deixa na mesma transação uma pendência por fatura
+    (tabela pendencias_sheets), que o SincronizadorSheets leva para o Sheets.
+
+    Concorrência entre sessões (e processos) no mesmo banco: o número da fatura
+    nova sai de um sequencial por competência (tabela sequencias) reservado na
+    mesma transação que grava as guias, e cada fatura tem uma versão
+    (versoes_fatura) que a edição confere antes de gravar (compare-and-swap),
+    resolvendo conflito linha a linha.
+    """
+
+    def __init__(self, caminho=CAMINHO_DB, replicar=False):
+        self.replicar = replicar
+        if caminho != ":memory:": os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(caminho, timeout=30, check_same_thread=False)
+        with self._db:
+            if caminho != ":memory:": self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS guias (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, fatura_ref TEXT NOT NULL, mes_competencia TEXT,
+                ano_competencia INTEGER, tipo_usuario TEXT, servicos_fatura TEXT, paciente_nome TEXT,
+                nr_guia TEXT, prec_cp TEXT, data_atend TEXT, cod_proced TEXT, valor REAL, data_lancamento TEXT)""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_guias_fatura ON guias(fatura_ref)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_guias_nr ON guias(nr_guia)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_guias_competencia ON guias(ano_competencia, mes_competencia)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_guias_prec ON guias(prec_cp)")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS usuarios (
+                username TEXT PRIMARY KEY, name TEXT, password_hash TEXT, created_at TEXT)""")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS agregados (
+                ano INTEGER, mes TEXT, tipo_usuario TEXT, servico TEXT, fatura_ref TEXT, guias INTEGER, valor REAL)""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_agregados_fatura ON agregados(fatura_ref)")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS pendencias_sheets (
+                fatura_ref TEXT PRIMARY KEY, versao INTEGER NOT NULL DEFAULT 1, tentativas INTEGER NOT NULL DEFAULT 0,
+                proxima REAL NOT NULL DEFAULT 0, erro TEXT, criada_em REAL NOT NULL, reservada_ate REAL NOT NULL DEFAULT 0)""")
+            # Fila de antes da reserva de envio
+            if "reservada_ate" not in {c[1] for c in self._db.execute("PRAGMA table_info(pendencias_sheets)")}:
+                self._db.execute("ALTER TABLE pendencias_sheets ADD COLUMN reservada_ate REAL NOT NULL DEFAULT 0")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS sequencias (
+                ano INTEGER NOT NULL, mes TEXT NOT NULL, ultimo INTEGER NOT NULL, PRIMARY KEY (ano, mes))""")
+            self._db.execute("CREATE TABLE IF NOT EXISTS versoes_fatura (fatura_ref TEXT PRIMARY KEY, versao INTEGER NOT NULL)")
+            # Banco de antes do cubo: monta uma vez a partir das guias
+            if self._db.execute("SELECT 1 FROM agregados LIMIT 1").fetchone() is None: self._agregar()
+
+    def _linha(self, r):
+        return (_texto(r.get("fatura_ref", "")), _texto(r.get("mes_competencia", "")), _inteiro(r.get("ano_competencia")),
+                _texto(r.get("tipo_usuario", "")), _texto(r.get("servicos_fatura", "")), _texto(r.get("paciente_nome", "")),
+                _texto(r.get("nr_guia", "")), _texto(r.get("prec_cp", "")), _texto(r.get("data_atend", "")),
+                _texto(r.get("cod_proced", "")), float(_celula(r.get("valor")) or 0.0), _texto(r.get("data_lancamento", "")))
+
+    def _inserir(self, registros):
+        self._db.executemany(f"INSERT INTO guias ({', '.join(COLUNAS_GUIAS)}) VALUES ({', '.join('?' * len(COLUNAS_GUIAS))})",
+                             [self._linha(r) for r in registros])
+
+    def _agregar(self, refs=None):
+        """Recalcula o cubo das faturas `refs` (todas, se None), na mesma transação da escrita."""
+        if refs is None:
+            self._db.execute("DELETE FROM agregados"); filtro, params = "", []
+        else:
+            params = sorted({str(r) for r in refs})
+            if not params: return
+            filtro = f"WHERE fatura_ref IN ({', '.join('?' * len(params))})"
+            self._db.execute(f"DELETE FROM agregados {filtro}", params)
+        self._db.execute(f"""INSERT INTO agregados SELECT ano_competencia, mes_competencia, tipo_usuario, servicos_fatura,
+            fatura_ref, COUNT(*), COALESCE(SUM(valor), 0) FROM guias {filtro}
+            GROUP BY fatura_ref, ano_competencia, mes_competencia, tipo_usuario, servicos_fatura""", params)
+
+    def _refs(self, registros):
+        return {_texto(r.get("fatura_ref", "")) for r in registros}
+
+    def vazio(self):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM guias LIMIT 1").fetchone() is None
+
+    def carregar(self):
+        with self._lock, medir("local.carregar"):
+            return pd.read_sql_query(f"SELECT {', '.join(COLUNAS_GUIAS)} FROM guias ORDER BY id", self._db)
+
+    def anexar(self, registros):
+        with self._lock, self._db, medir("local.anexar", linhas=len(registros)):
+            self._inserir(registros)
+            self._gravado(self._refs(registros))
+
+    def atualizar_fatura(self, fatura_ref, registros):
+        """Substitui a fatura inteira, sem conferir versão (edição concorrente usa editar_fatura)."""
+        with self._lock, self._db, medir("local.atualizar_fatura", linhas=len(registros)):
+            self._db.execute("DELETE FROM guias WHERE fatura_ref = ?", (str(fatura_ref),))
+            self._inserir(registros)
+            self._gravado(self._refs(registros) | {str(fatura_ref)})
+
+    def _gravado(self, refs):
+        """Depois de mexer nas guias de `refs`: cubo, versão e pendência do Sheets, na mesma transação."""
+        self._agregar(refs)
+        self._db.executemany("""INSERT INTO versoes_fatura (fatura_ref, versao) VALUES (?, 1)
+            ON CONFLICT(fatura_ref) DO UPDATE SET versao = versao + 1""", [(r,) for r in sorted(refs) if r])
+        self._pendencia(refs)
+
+    def _versao(self, fatura_ref):
+        linha = self._db.execute("SELECT versao FROM versoes_fatura WHERE fatura_ref = ?", (str(fatura_ref),)).fetchone()
+        return linha[0] if linha else 0
+
+    # --- NUMERAÇÃO DAS FATURAS ---
+    def _proximo_sequencial(self, ano, mes):
+        """Próximo número livre da competência: depois do último reservado e do maior já gravado.
+        A fatura_ref não leva o ano, então também pula números que existem em outro ano."""
+        m = MESES.index(mes) + 1
+        reservado = self._db.execute("SELECT ultimo FROM sequencias WHERE ano = ? AND mes = ?", (_inteiro(ano), mes)).fetchone()
+        gravados = self._db.execute("SELECT fatura_ref FROM agregados WHERE ano = ? AND mes = ?", (_inteiro(ano), mes)).fetchall()
+        seq = max([reservado[0] if reservado else 0] + [_sequencial(r, m) for (r,) in gravados]) + 1
+        while self._db.execute("SELECT 1 FROM agregados WHERE fatura_ref = ? LIMIT 1", (f"{m}.{seq}",)).fetchone(): seq += 1
+        return m, seq
+
+    def proxima_fatura(self, ano, mes):
+        """Número que a próxima fatura da competência deve receber (só prévia: quem vale é nova_fatura)."""
+        with self._lock:
+            m, seq = self._proximo_sequencial(ano, mes)
+        return f"{m}.{seq}"
+
+    def nova_fatura(self, ano, mes, registros):
+        """Reserva o próximo número da competência e grava as guias nele, numa transação só. Devolve a fatura_ref."""
+        with self._lock, self._db, medir("local.nova_fatura", linhas=len(registros)):
+            # Trava de escrita antes de ler o sequencial: outro processo no mesmo banco espera a vez
+            self._db.execute("BEGIN IMMEDIATE")
+            m, seq = self._proximo_sequencial(ano, mes)
+            self._db.execute("""INSERT INTO sequencias (ano, mes, ultimo) VALUES (?, ?, ?)
+                ON CONFLICT(ano, mes) DO UPDATE SET ultimo = excluded.ultimo""", (_inteiro(ano), mes, seq))
+            ref = f"{m}.{seq}"
+            self._inserir([dict(r, fatura_ref=f"'{ref}") for r in registros])
+            self._gravado({ref})
+        return ref
+
+    # --- EDIÇÃO COM VERSÃO (compare-and-swap por fatura, merge por linha) ---
+    def fatura_para_edicao(self, fatura_ref):
+        """(guias da fatura com o id de cada linha, versão atual): a versão volta em editar_fatura."""
+        with self._lock:
+            df = pd.read_sql_query(f"SELECT id, {', '.join(COLUNAS_GUIAS)} FROM guias WHERE fatura_ref = ? ORDER BY id",
+                                   self._db, params=(str(fatura_ref),))
+            return df, self._versao(fatura_ref)
+
+    def editar_fatura(self, fatura_ref, versao, base, registros):
+        """Grava a edição de uma fatura aberta na `versao`, linha a linha.
+
+        base = linhas como foram abertas (com id); registros = como ficaram no
+        editor (com o id das que já existiam, sem id as novas). Se a versão não
+        mudou, tudo entra. Se outra sessão salvou nesse meio-tempo, entram as
+        linhas que ela não tocou; as que as duas mudaram ficam como a outra
+        deixou e voltam em `conflitos`. Devolve (versão nova, conflitos).
+        """
+        ref = str(fatura_ref)
+        base = {_inteiro(r["id"]): r for r in base}
+        conflitos, mantidas, inserir, alterar, apagar = [], set(), [], [], []
+        with self._lock, self._db, medir("local.editar_fatura", linhas=len(registros)):
+            self._db.execute("BEGIN IMMEDIATE")
+            mudou = self._versao(ref) != versao
+            atual = {}
+            if mudou:
+                cur = self._db.execute(f"SELECT id, {', '.join(CAMPOS_EDITAVEIS)} FROM guias WHERE fatura_ref = ?", (ref,))
+                atual = {linha[0]: dict(zip(CAMPOS_EDITAVEIS, linha[1:])) for linha in cur.fetchall()}
+            incluidas_por_outra = {_texto(a["nr_guia"]) for i, a in atual.items() if i not in base} - {""}
+            for r in registros:
+                i = _inteiro(r.get("id"))
+                if i not in base:
+                    if _texto(r.get("nr_guia", "")) in incluidas_por_outra:
+                        conflitos.append(_conflito(r, "guia já incluída por outra sessão")); continue
+                    inserir.append(dict(r, fatura_ref=f"'{ref}")); continue
+                mantidas.add(i)
+                if _editaveis(r) == _editaveis(base[i]): continue
+                if mudou and i not in atual: conflitos.append(_conflito(r, "linha apagada por outra sessão")); continue
+                if mudou and _editaveis(atual[i]) not in (_editaveis(base[i]), _editaveis(r)):
+                    conflitos.append(_conflito(atual[i], "linha alterada por outra sessão")); continue
+                alterar.append(_editaveis(r) + (_texto(r.get("data_lancamento", "")), i))
+            for i in base.keys() - mantidas:
+                if mudou and i in atual and _editaveis(atual[i]) != _editaveis(base[i]):
+                    conflitos.append(_conflito(atual[i], "linha alterada por outra sessão (não foi apagada)")); continue
+                apagar.append((i,))
+            self._db.executemany(f"UPDATE guias SET {', '.join(c + ' = ?' for c in CAMPOS_EDITAVEIS)}, data_lancamento = ? WHERE id = ?", alterar)
+            self._db.executemany("DELETE FROM guias WHERE id = ?", apagar)
+            self._inserir(inserir)
+            self._gravado({ref})
+            return self._versao(ref), conflitos
+
+    # --- PENDÊNCIAS DE REPLICAÇÃO (fila durável do SincronizadorSheets) ---
+    def _pendencia(self, refs):
+        """Uma pendência por fatura: salvar de novo antes do envio só sobe a versão (e zera o backoff)."""
+        if not self.replicar: return
+        agora = time.time()
+        self._db.executemany("""INSERT INTO pendencias_sheets (fatura_ref, criada_em) VALUES (?, ?)
+            ON CONFLICT(fatura_ref) DO UPDATE SET versao = versao + 1, tentativas = 0, proxima = 0""",
+            [(r, agora) for r in sorted(refs) if r])
+
+    def _ler_pendencias(self, filtro="", params=(), limite=-1):
+        cur = self._db.execute(f"""SELECT fatura_ref, versao, tentativas, proxima, erro, criada_em FROM pendencias_sheets
+            {filtro} ORDER BY criada_em, fatura_ref LIMIT ?""", list(params) + [limite])
+        colunas = [c[0] for c in cur.description]
+        return [dict(zip(colunas, linha)) for linha in cur.fetchall()]
+
+    def pendencias(self):
+        """Faturas ainda não replicadas, mais antigas primeiro."""
+        with self._lock:
+            return self._ler_pendencias()
+
+    def reservar_pendencias(self, limite, prazo):
+        """Reserva por `prazo` segundos as pendências vencidas e devolve as reservadas.
+
+        Dois envios (dois processos do app, ou o app e o fusex_cli) nunca pegam a mesma
+        fatura: a leitura e a reserva acontecem sob a trava de escrita do banco. Se o
+        processo cair no meio do envio, a reserva vence e a fatura volta para a fila.
+        """
+        agora = time.time()
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            prontas = self._ler_pendencias("WHERE proxima <= ? AND reservada_ate <= ?", (agora, agora), limite)
+            # Fatura que já falhou vai sozinha (em qualquer posição): não derruba o lote das outras
+            falhadas = [p for p in prontas if p["tentativas"]]
+            if falhadas: prontas = falhadas[:1]
+            self._db.executemany("UPDATE pendencias_sheets SET reservada_ate = ? WHERE fatura_ref = ?",
+                                 [(agora + prazo, p["fatura_ref"]) for p in prontas])
+            return prontas
+
+    def proxima_pendencia(self):
+        """Quando (time.time()) vence a próxima tentativa ou reserva; None sem pendências."""
+        with self._lock:
+            return self._db.execute("SELECT MIN(MAX(proxima, reservada_ate)) FROM pendencias_sheets").fetchone()[0]
+
+    def registros_das_faturas(self, refs):
+        """{fatura_ref: registros no formato da aba 'guias'} com o estado atual de cada fatura (lista vazia se apagada)."""
+        faturas = {str(r): [] for r in refs}
+        if not faturas: return faturas
+        with self._lock:
+            cur = self._db.execute(f"""SELECT {', '.join(COLUNAS_GUIAS)} FROM guias
+                WHERE fatura_ref IN ({', '.join('?' * len(faturas))}) ORDER BY id""", list(faturas))
+            for linha in cur.fetchall():
+                r = {c: ("" if v is None else v) for c, v in zip(COLUNAS_GUIAS, linha)}
+                faturas[r["fatura_ref"]].append(dict(r, fatura_ref=f"'{r['fatura_ref']}"))  # como montar_registros
+        return faturas
+
+    def concluir_pendencias(self, versoes):
+        """Tira da fila as faturas enviadas, se não foram salvas de novo durante o envio (essas só perdem a reserva)."""
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM pendencias_sheets WHERE fatura_ref = ? AND versao = ?", list(versoes.items()))
+            self._db.executemany("UPDATE pendencias_sheets SET reservada_ate = 0 WHERE fatura_ref = ?", [(r,) for r in versoes])
+
+    def adiar_pendencias(self, esperas, erro):
+        """esperas = {fatura_ref: segundos até a próxima tentativa}."""
+        agora = time.time()
+        with self._lock, self._db:
+            self._db.executemany("""UPDATE pendencias_sheets SET tentativas = tentativas + 1, proxima = ?, erro = ?,
+                reservada_ate = 0 WHERE fatura_ref = ?""",
+                                 [(agora + s, erro, ref) for ref, s in esperas.items()])
+
+    def antecipar_pendencias(self):
+        with self._lock, self._db:
+            self._db.execute("UPDATE pendencias_sheets SET proxima = 0")
+
+    def agregados(self):
+        with self._lock:
+            return pd.read_sql_query(f"SELECT {', '.join(COLUNAS_AGREGADOS)} FROM agregados", self._db)
+
+    # --- CONSULTAS ---
+    def _where(self, filtros):
+        clausulas, params = [], []
+        for campo, valor in _filtros_ativos(filtros).items():
+            if campo == "paciente":
+                clausulas.append("paciente_nome LIKE ? ESCAPE '\\'"); params.append(_contendo(valor))
+            elif campo in ("nr_guia", "prec_cp"):
+                # Prefixo como faixa: usa o índice (LIKE 'x%' não usaria)
+                clausulas.append(f"{campo} >= ? AND {campo} < ?"); params += [valor, valor + "\uffff"]
+            elif campo == "ano":
+                clausulas.append("ano_competencia = ?"); params.append(_inteiro(valor))
+            elif campo == "mes":
+                clausulas.append("mes_competencia = ?"); params.append(valor)
+            else:
+                clausulas.append(f"{campo} = ?"); params.append(valor)
+        return (" WHERE " + " AND ".join(clausulas)) if clausulas else "", params
+
+    def consultar(self, filtros=None, pagina=1, por_pagina=50):
+        where, params = self._where(filtros)
+        with self._lock, medir("local.consultar"):
+            total = self._db.execute(f"SELECT COUNT(*) FROM guias{where}", params).fetchone()[0]
+            pagina_df = pd.read_sql_query(f"SELECT {', '.join(COLUNAS_GUIAS)} FROM guias{where} ORDER BY id DESC LIMIT ? OFFSET ?",
+                                          self._db, params=params + [por_pagina, (max(1, pagina) - 1) * por_pagina])
+        return pagina_df, total
+
+    def faturas(self, busca="", limite=100):
+        """fatura_ref da competência mais recente para a mais antiga (lê o cubo, não as guias)."""
+        ordem_mes = "CASE mes " + " ".join(f"WHEN '{m}' THEN {i}" for i, m in enumerate(MESES, start=1)) + " ELSE 0 END"
+        with self._lock:
+            rows = self._db.execute(f"""SELECT fatura_ref FROM agregados WHERE fatura_ref LIKE ? ESCAPE '\\'
+                GROUP BY fatura_ref ORDER BY MAX(ano) DESC, MAX({ordem_mes}) DESC, fatura_ref DESC LIMIT ?""",
+                (_contendo(str(busca or '').strip()), limite)).fetchall()
+        return [r[0] for r in rows]
+
+    def fatura_existe(self, fatura_ref):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM agregados WHERE fatura_ref = ? LIMIT 1", (str(fatura_ref).strip(),)).fetchone() is not None
+
+    def guias_das_faturas(self, refs):
+        refs = [str(r) for r in refs]
+        if not refs: return guias_vazias()
+        with self._lock:
+            return pd.read_sql_query(f"SELECT {', '.join(COLUNAS_GUIAS)} FROM guias WHERE fatura_ref IN ({', '.join('?' * len(refs))}) ORDER BY id",
+                                     self._db, params=refs)
+
+    def localizar_guias(self, nrs):
+        """Busca pelo índice de nr_guia, em blocos (limite de parâmetros do SQLite)."""
+        nrs = sorted({_texto(n) for n in nrs} - {""})
+        achadas = {}
+        with self._lock:
+            for i in range(0, len(nrs), 500):
+                bloco = nrs[i:i + 500]
+                for nr, ref, mes, ano, valor in self._db.execute(
+                        f"SELECT nr_guia, fatura_ref, mes_competencia, ano_competencia, valor FROM guias WHERE nr_guia IN ({', '.join('?' * len(bloco))})", bloco):
+                    achadas.setdefault(nr, []).append(_ocorrencia(ref, mes, ano, valor))
+        return achadas
+
+    def importar(self, df):
+        """Carga inicial a partir de um DataFrame no formato da aba 'guias'."""
+        if df is None or df.empty: return
+        registros = df.dropna(how="all").to_dict("records")
+        with self._lock, self._db:
+            self._inserir(registros)
+            self._agregar()
+
+    def carregar_usuarios(self):
+        with self._lock:
+            return pd.read_sql_query(f"SELECT {', '.join(COLUNAS_USUARIOS)} FROM usuarios", self._db)
+
+    def anexar_usuario(self, registro):
+        with self._lock, self._db:
+            self._db.execute("INSERT INTO usuarios VALUES (?, ?, ?, ?)", tuple(_texto(registro.get(c, "")) for c in COLUNAS_USUARIOS))
+
+class SincronizadorSheets:
+    """Leva para o Google Sheets, em segundo plano, as pendências gravadas pelo banco local.
+
+    A fila é a tabela pendencias_sheets: sobrevive a reinícios e a gravação nunca espera
+    a rede. A chave de cada pendência é a fatura, não a operação: o envio manda o estado
+    atual da fatura no banco (sincronizar_faturas reescreve as linhas dela), então reenviar
+    depois de uma falha não duplica nada. Faturas prontas vão em lote; erro (rede, cota)
+    adia a fatura com backoff exponencial e, na volta, ela vai sozinha. Cada lote é
+    reservado no banco antes do envio, então vários sincronizadores podem rodar juntos.
+    """
+
+    LOTE = 20
+    PRAZO_RESERVA = 600   # segundos até um envio interrompido (processo que caiu) ser retomado por outro
+    ESPERA_BASE = 2       # segundos na 1ª falha, dobrando a cada tentativa
+    ESPERA_MAX = 300
+
+    def __init__(self, local, remoto):
+        self.local = local
+        self.remoto = remoto
+        self.ultimo_erro = None
+        self._acordar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, daemon=True)
+        self._thread.start()
+
+    def avisar(self):
+        """Chamado depois de cada gravação local: acorda o envio."""
+        self._acordar.set()
+
+    def pendencias(self):
+        return self.local.pendencias()
+
+    def pendentes(self):
+        return len(self.pendencias())
+
+    def sincronizar_agora(self):
+        """Ignora o backoff e tenta todas as pendências já."""
+        self.local.antecipar_pendencias(); self._acordar.set()
+
+    def _espera(self, tentativas):
+        return min(self.ESPERA_MAX, self.ESPERA_BASE * 2 ** tentativas) * random.uniform(0.5, 1.0)
+
+    def enviar_lote(self):
+        """Manda as pendências vencidas; devolve quantos segundos esperar (None = fila vazia)."""
+        prontas = self.local.reservar_pendencias(self.LOTE, self.PRAZO_RESERVA)
+        if prontas:
+            versoes = {p["fatura_ref"]: p["versao"] for p in prontas}
+            try:
+                self.remoto.sincronizar_faturas(self.local.registros_das_faturas(list(versoes)))
+            except Exception as e:
+                self.ultimo_erro = str(e)
+                self.local.adiar_pendencias({p["fatura_ref"]: self._espera(p["tentativas"]) for p in prontas}, str(e))
+            else:
+                self.local.concluir_pendencias(versoes)
+                self.ultimo_erro = None
+                return 0
+        proxima = self.local.proxima_pendencia()
+        return None if proxima is None else max(0.0, proxima - time.time())
+
+    def _executar(self):
+        falhas = 0
+        while True:
+            self._acordar.clear()
+            try:
+                espera = self.enviar_lote(); falhas = 0
+            except Exception as e:
+                # Erro fora do envio (banco, dado inesperado): a thread não morre; o erro aparece na barra lateral
+                self.ultimo_erro = str(e); espera = self._espera(falhas); falhas += 1
+            # Fila vazia: confere de tempos em tempos, outro processo (fusex_cli) pode ter gravado no banco
+            self._acordar.wait(self.ESPERA_MAX if espera is None else espera)
+
+class ArmazenamentoSincronizado:
+    """Banco local como caminho rápido; o Google Sheets recebe as escritas em segundo plano."""
+
+    def __init__(self, local, remoto):
+        self.local = local
+        self.remoto = remoto
+        # Primeira execução nesta máquina: traz o histórico do Sheets para o banco local
+        if local.vazio(): local.importar(normalizar_guias(remoto.carregar()))
+        # Pendências de uma execução anterior (servidor reiniciado) saem na primeira volta
+        self.sincronizador = SincronizadorSheets(local, remoto)
+
+    def carregar(self):
+        return self.local.carregar()
+
+    # Gravação local + pendência na mesma transação; o Sheets recebe em segundo plano
+    def anexar(self, registros):
+        self.local.anexar(registros)
+        self.sincronizador.avisar()
+
+    def atualizar_fatura(self, fatura_ref, registros):
+        self.local.atualizar_fatura(fatura_ref, registros)
+        self.sincronizador.avisar()
+
+    def nova_fatura(self, ano, mes, registros):
+        ref = self.local.nova_fatura(ano, mes, registros)
+        self.sincronizador.avisar()
+        return ref
+
+    def proxima_fatura(self, ano, mes):
+        return self.local.proxima_fatura(ano, mes)
+
+    def fatura_para_edicao(self, fatura_ref):
+        return self.local.fatura_para_edicao(fatura_ref)
+
+    def editar_fatura(self, fatura_ref, versao, base, registros):
+        resultado = self.local.editar_fatura(fatura_ref, versao, base, registros)
+        self.sincronizador.avisar()
+        return resultado
+
+    def agregados(self):
+        return self.local.agregados()
+
+    def consultar(self, filtros=None, pagina=1, por_pagina=50):
+        return self.local.consultar(filtros, pagina, por_pagina)
+
+    def faturas(self, busca="", limite=100):
+        return self.local.faturas(busca, limite)
+
+    def fatura_existe(self, fatura_ref):
+        return self.local.fatura_existe(fatura_ref)
+
+    def guias_das_faturas(self, refs):
+        return self.local.guias_das_faturas(refs)
+
+    def localizar_guias(self, nrs):
+        return self.local.localizar_guias(nrs)
+
+    # Usuários continuam no Sheets: login vale para todas as máquinas
+    def carregar_usuarios(self):
+        return self.remoto.carregar_usuarios()
+
+    def anexar_usuario(self, registro):
+        self.remoto.anexar_usuario(registro)
+
+def criar_armazenamento(modo=MODO_ARMAZENAMENTO, conn=None, caminho_db=CAMINHO_DB):
+    """Monta o backend pedido; `conn` (GSheetsConnection) só é usado nos modos com Sheets."""
+    if modo == "sheets": return ArmazenamentoSheets(conn)
+    if modo == "local": return ArmazenamentoLocal(caminho_db)
+    if modo == "local+sheets": return ArmazenamentoSincronizado(ArmazenamentoLocal(caminho_db, replicar=True), ArmazenamentoSheets(conn))
+    raise ValueError(f"FUSEX_BACKEND inválido: {modo}")
@@ -0,0 +1,112 @@
+"""Vazão (guias/s) da extração de campos sobre um corpus de textos de guia.
+
+Uso:
+    python benchmarks/bench_campos.py                 # corpus sintético
+    python benchmarks/bench_campos.py --corpus pasta  # arquivos .txt (texto já extraído das guias)
+
+Compara o motor de layouts (campos.py, padrões pré-compilados e parada no
+primeiro padrão que acha cada campo) com a extração antiga, que fazia oito
+buscas sobre o texto inteiro, e confere se os dois concordam.
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from campos import limpar_data_sem_ano, dados_vazios, extrair_campos_com_confianca
+
+def extrair_campos_legado(text):
+    """Extração anterior ao motor de layouts (oito buscas sobre o texto inteiro)."""
+    dados = dados_vazios()
+    match_guia = re.search(r'(?:Nr|Numero)[:\.]?\s*(\d+)', text, flags=re.IGNORECASE)
+    if match_guia: dados["NR DA GUIA"] = match_guia.group(1)
+    match_data = re.search(r'Data:\s*(\d{2}/\d{2}/\d{4})', text, flags=re.IGNORECASE)
+    if match_data: dados["DATA ATEND."] = limpar_data_sem_ano(match_data.group(1))
+    else:
+        datas = re.findall(r'\d{2}/\d{2}/\d{4}', text)
+        if datas: dados["DATA ATEND."] = limpar_data_sem_ano(datas[0])
+    match_titular = re.search(r'Titular:\s*\(.*?\)\s*\n?(.+)', text, flags=re.IGNORECASE)
+    match_dependente = re.search(r'Dependente:\s*\(.*?\)\s*\n?(.+)', text, flags=re.IGNORECASE)
+    if match_dependente: dados["NOME DO PACIENTE"] = match_dependente.group(1).strip()
+    elif match_titular: dados["NOME DO PACIENTE"] = match_titular.group(1).strip()
+    if "UG Origem" in dados["NOME DO PACIENTE"]: dados["NOME DO PACIENTE"] = dados["NOME DO PACIENTE"].split("UG Origem")[0].strip()
+    match_idt = re.search(r'Idt:\s*([\d-]+)', text, flags=re.IGNORECASE)
+    if match_idt: dados["PREC-CP/SIAPE"] = match_idt.group(1)
+    else:
+        match_prec = re.search(r'Prec CP:\s*(\d+)', text, flags=re.IGNORECASE)
+        if match_prec: dados["PREC-CP/SIAPE"] = match_prec.group(1)
+    codigos = re.findall(r'(?<!\d)(\d{8})(?!\d)', text)
+    if codigos:
+        codigos_validos = [c for c in codigos if not c.startswith("202")]
+        dados["CÓDIGO PROCED."] = ", ".join(sorted(set(codigos_validos)))
+    match_total = re.search(r'Total\s*:?\s*([\d\.,]+)', text, flags=re.IGNORECASE)
+    if match_total:
+        try: dados["VALOR (R$)"] = float(match_total.group(1).replace('.', '').replace(',', '.'))
+        except: pass
+    return dados
+
+NOMES = ["MARIA APARECIDA SOUZA", "JOSE CARLOS PEREIRA", "ANA LUIZA FERREIRA", "PEDRO HENRIQUE ALVES", "LUCAS GABRIEL COSTA"]
+
+def guia_sintetica(rnd):
+    """Texto no formato da guia FUSEX, com o cabeçalho/rodapé que a extração procura."""
+    dependente = rnd.random() < 0.5
+    linhas = [
+        "MINISTÉRIO DA DEFESA - EXÉRCITO BRASILEIRO", "FUNDO DE SAÚDE DO EXÉRCITO - FUSEX",
+        f"GUIA DE ENCAMINHAMENTO Nr: {rnd.randint(100000, 999999)}",
+        f"Data: {rnd.randint(1, 28):02d}/{rnd.randint(1, 12):02d}/2025",
+        "Titular: (3º SGT) ", f"{rnd.choice(NOMES)} UG Origem HGeJF",
+    ]
+    if dependente: linhas += ["Dependente: (FILHO) ", f"{rnd.choice(NOMES)} UG Origem HGeJF"]
+    linhas += [f"Idt: {rnd.randint(10**9, 10**10 - 1)}", f"Prec CP: {rnd.randint(10**8, 10**9 - 1)}"]
+    linhas += ["Observações: " + "paciente encaminhado para tratamento conforme avaliação médica. " * rnd.randint(2, 8)]
+    for _ in range(rnd.randint(1, 4)):
+        linhas.append(f"{rnd.choice(['50000470', '50000489', '50001213', '20104430'])} SESSÃO DE FISIOTERAPIA {rnd.randint(1, 10)} x")
+    linhas.append(f"Total: {rnd.randint(1, 9)}.{rnd.randint(100, 999)},{rnd.randint(10, 99)}")
+    return "\n".join(linhas)
+
+def carregar_corpus(pasta, n, semente):
+    if pasta:
+        textos = []
+        for nome in sorted(os.listdir(pasta)):
+            if nome.endswith(".txt"):
+                with open(os.path.join(pasta, nome), encoding="utf-8") as f: textos.append(f.read())
+        return textos
+    rnd = random.Random(semente)
+    return [guia_sintetica(rnd) for _ in range(n)]
+
+def medir(funcao, textos, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        for t in textos: funcao(t)
+        melhor = min(melhor, time.perf_counter() - t0)
+    return len(textos) / melhor
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--corpus", help="pasta com .txt de guias (padrão: corpus sintético)")
+    ap.add_argument("-n", type=int, default=2000, help="tamanho do corpus sintético")
+    ap.add_argument("--repeticoes", type=int, default=5)
+    ap.add_argument("--semente", type=int, default=42)
+    args = ap.parse_args()
+
+    textos = carregar_corpus(args.corpus, args.n, args.semente)
+    if not textos: sys.exit("Corpus vazio.")
+
+    legado = medir(extrair_campos_legado, textos, args.repeticoes)
+    motor = medir(lambda t: extrair_campos_com_confianca(t), textos, args.repeticoes)
+    divergentes = 0
+    for t in textos:
+        a = extrair_campos_legado(t); b = extrair_campos_com_confianca(t)[0]
+        if a != b: divergentes += 1
+
+    print(f"Corpus: {len(textos)} guias ({'sintético' if not args.corpus else args.corpus})")
+    print(f"  legado (8 buscas)   : {legado:10.0f} guias/s")
+    print(f"  motor de layouts    : {motor:10.0f} guias/s  ({motor / legado:.2f}x)")
+    print(f"  guias com resultado diferente do legado: {divergentes}")
+
+if __name__ == "__main__":
+    main()
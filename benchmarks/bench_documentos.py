@@ -0,0 +1,90 @@
+"""Tempo de geração do DOCX da fatura conforme o número de guias.
+
+Uso:
+    python benchmarks/bench_documentos.py                     # 10 / 100 / 1000 linhas
+    python benchmarks/bench_documentos.py --linhas 50 500     # outros tamanhos
+    python benchmarks/bench_documentos.py --modelo fatura.docx
+
+Compara o modelo compilado (documentos.TemplateFatura) com a geração antiga,
+que trocava as tags parágrafo a parágrafo e montava a tabela com add_row().
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from io import BytesIO
+import pandas as pd
+from docx import Document
+from docx.shared import Pt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from documentos import criar_template_padrao, TemplateFatura, texto_referente, _rodape
+
+def gerar_doc_word_legado(doc, df_dados, tags, tipo_usuario):
+    """Geração anterior ao modelo compilado."""
+    for p in doc.paragraphs:
+        for key, val in tags.items():
+            if key in p.text: p.text = p.text.replace(key, str(val))
+        if "REFERENTE A USUÁRIO" in p.text: p.text = texto_referente(tipo_usuario)
+    if doc.tables:
+        tabela = doc.tables[0]
+        for _, row in df_dados.iterrows():
+            cells = tabela.add_row().cells
+            valor_fmt = f"{row.get('VALOR (R$)', 0.0):,.2f}".replace('.', 'X').replace(',', '.').replace('X', ',')
+            vals = [row.get("NOME DO PACIENTE", ""), row.get("NR DA GUIA", ""), row.get("DATA ATEND.", ""), row.get("PREC-CP/SIAPE", ""), row.get("CÓDIGO PROCED.", ""), valor_fmt]
+            for i, v in enumerate(vals):
+                cells[i].text = str(v)
+                if cells[i].paragraphs: cells[i].paragraphs[0].runs[0].font.size = Pt(9)
+        row_total = tabela.add_row().cells
+        row_total[4].text = "TOTAL"; row_total[5].text = tags["{{TOTAL}}"]
+    _rodape(doc)
+    return doc
+
+def guias(n, semente=42):
+    rnd = random.Random(semente)
+    return pd.DataFrame([{
+        "NOME DO PACIENTE": f"PACIENTE {i:04d} DA SILVA", "NR DA GUIA": str(rnd.randint(100000, 999999)),
+        "DATA ATEND.": f"{rnd.randint(1, 28):02d}/{rnd.randint(1, 12):02d}", "PREC-CP/SIAPE": str(rnd.randint(10**8, 10**9 - 1)),
+        "CÓDIGO PROCED.": "50000470", "VALOR (R$)": round(rnd.uniform(30, 900), 2)} for i in range(n)])
+
+TAGS = {"{{NUM_FATURA}}": "11.1", "{{MES_ANO}}": "Novembro/2025", "{{SERVICO}}": "Fisioterapia",
+        "{{TOTAL}}": "R$ 1.234,56", "{{EXTENSO}}": "MIL, DUZENTOS E TRINTA E QUATRO REAIS"}
+
+def medir(funcao, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        t0 = time.perf_counter(); funcao()
+        melhor = min(melhor, time.perf_counter() - t0)
+    return melhor
+
+def salvar(doc):
+    buf = BytesIO(); doc.save(buf); return buf.getvalue()
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--linhas", type=int, nargs="+", default=[10, 100, 1000])
+    ap.add_argument("--modelo", help=".docx de modelo (padrão: criar_template_padrao)")
+    ap.add_argument("--repeticoes", type=int, default=3)
+    args = ap.parse_args()
+
+    if args.modelo:
+        with open(args.modelo, "rb") as f: modelo = f.read()
+        novo_modelo = lambda: Document(BytesIO(modelo))
+    else:
+        novo_modelo = criar_template_padrao
+
+    t0 = time.perf_counter(); template = TemplateFatura(novo_modelo())
+    print(f"Compilação do modelo: {(time.perf_counter() - t0) * 1000:.1f} ms (uma vez por processo)")
+    print(f"{'linhas':>7} | {'legado (s)':>10} | {'compilado (s)':>13} | {'ganho':>6}")
+    for n in args.linhas:
+        df = guias(n)
+        legado = medir(lambda: salvar(gerar_doc_word_legado(novo_modelo(), df, TAGS, "FUSEX")), args.repeticoes)
+        compilado = medir(lambda: salvar(template.renderizar(df, TAGS, "FUSEX")), args.repeticoes)
+        a = Document(BytesIO(salvar(gerar_doc_word_legado(novo_modelo(), df, TAGS, "FUSEX"))))
+        b = template.renderizar(df, TAGS, "FUSEX")
+        iguais = [[c.text for c in r.cells] for r in a.tables[0].rows] == [[c.text for c in r.cells] for r in b.tables[0].rows]
+        print(f"{n:>7} | {legado:>10.3f} | {compilado:>13.3f} | {legado / compilado:>5.1f}x{'' if iguais else '  (tabela diferente!)'}")
+
+if __name__ == "__main__":
+    main()
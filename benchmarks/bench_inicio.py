@@ -0,0 +1,100 @@
+"""Relatório de partida a frio: quanto a tela de login e o sistema levam num processo novo.
+
+Uso:
+    python benchmarks/bench_inicio.py                  # 3 processos novos, backend local
+    python benchmarks/bench_inicio.py --importtime 15  # + os 15 imports mais caros até a tela de login
+    python benchmarks/bench_inicio.py --limite 1.0     # sai com 1 se a tela de login passar de 1 s
+
+Cada medição roda o fusex2.py (AppTest do Streamlit) num interpretador novo,
+com o Streamlit já importado, como num servidor recém-subido: mede a 1ª
+renderização da tela de login, depois o login de um usuário de teste até o
+sistema aparecer, e lista quais dependências pesadas (metricas.MODULOS_PESADOS)
+já estavam carregadas em cada ponto. A tela de login não deve carregar nenhuma.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+USUARIO, SENHA = "bench", "bench123"
+
+FILHO = r"""
+import sys, json, time
+sys.path.insert(0, {raiz!r})
+import streamlit
+from streamlit.testing.v1 import AppTest
+import metricas
+at = AppTest.from_file({app!r}, default_timeout=300)
+t0 = time.perf_counter(); at.run(); login = time.perf_counter() - t0
+modulos_login = metricas.modulos_pesados()
+at.text_input[0].set_value({usuario!r}); at.text_input[1].set_value({senha!r})
+t0 = time.perf_counter(); at.button[0].click().run(); sistema = time.perf_counter() - t0
+print(json.dumps({{"login": login, "modulos_login": modulos_login, "sistema": sistema, "modulos_sistema": metricas.modulos_pesados(),
+                  "logado": bool(at.session_state["logado"]), "erros": [str(e.value) for e in at.exception]}}))
+"""
+
+def preparar(pasta):
+    """Banco local com um usuário de teste (o processo medido não paga por isso)."""
+    from armazenamento import ArmazenamentoLocal
+    from usuarios import gerar_hash
+    local = ArmazenamentoLocal(os.path.join(pasta, "fusex.sqlite3"))
+    local.anexar_usuario({"username": USUARIO, "name": "Benchmark", "password_hash": gerar_hash(SENHA), "created_at": ""})
+
+def medir(ambiente, importtime=False):
+    codigo = FILHO.format(raiz=RAIZ, app=os.path.join(RAIZ, "fusex2.py"), usuario=USUARIO, senha=SENHA)
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", codigo]
+    r = subprocess.run(cmd, env=ambiente, capture_output=True, text=True, cwd=RAIZ)
+    if r.returncode != 0: raise RuntimeError(r.stderr[-2000:])
+    return json.loads(r.stdout.strip().splitlines()[-1]), r.stderr
+
+def imports_caros(stderr, n):
+    """Os n imports de maior tempo acumulado (saída do -X importtime), sem o próprio Streamlit."""
+    linhas = []
+    for linha in stderr.splitlines():
+        if not linha.startswith("import time:") or "|" not in linha: continue
+        try: _, acumulado, nome = [p.strip() for p in linha.split(":", 1)[1].split("|")]
+        except ValueError: continue
+        if acumulado.isdigit() and not nome.startswith("streamlit"): linhas.append((int(acumulado) / 1e6, nome))
+    return sorted(linhas, reverse=True)[:n]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeticoes", type=int, default=3, help="processos novos medidos")
+    ap.add_argument("--limite", type=float, default=1.0, help="tempo máximo (s) da tela de login")
+    ap.add_argument("--importtime", type=int, default=0, help="mostra os N imports mais caros")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="fusex_inicio_") as pasta:
+        preparar(pasta)
+        ambiente = dict(os.environ, FUSEX_BACKEND="local", FUSEX_DB=os.path.join(pasta, "fusex.sqlite3"),
+                        FUSEX_CACHE_DIR=os.path.join(pasta, "cache"), FUSEX_METRICAS_LOG="", FUSEX_OCR_NO_BOOT="0")
+        medidas = [medir(ambiente)[0] for _ in range(args.repeticoes)]
+        if args.importtime: _, stderr = medir(ambiente, importtime=True)
+
+    ultima = medidas[-1]
+    login = statistics.median(m["login"] for m in medidas)
+    sistema = statistics.median(m["sistema"] for m in medidas)
+    print(f"Tela de login (1ª renderização): {login:.3f}s (mediana de {len(medidas)} processos)")
+    print(f"  pesados carregados: {', '.join(ultima['modulos_login']) or 'nenhum'}")
+    print(f"Login até o sistema aparecer:    {sistema:.3f}s {'(ok)' if ultima['logado'] else '(login FALHOU)'}")
+    print(f"  pesados carregados: {', '.join(ultima['modulos_sistema']) or 'nenhum'}")
+    for erro in ultima["erros"]: print(f"  ❌ {erro}")
+    if args.importtime:
+        print("\nImports mais caros (processo inteiro, sem o Streamlit):")
+        for segundos, nome in imports_caros(stderr, args.importtime): print(f"  {segundos:8.3f}s  {nome}")
+
+    problemas = []
+    if login > args.limite: problemas.append(f"tela de login em {login:.3f}s (limite {args.limite}s)")
+    if ultima["modulos_login"]: problemas.append(f"tela de login carregou {', '.join(ultima['modulos_login'])}")
+    if not ultima["logado"] or ultima["erros"]: problemas.append("login do usuário de teste falhou")
+    for p in problemas: print(f"❌ {p}")
+    if problemas: sys.exit(1)
+
+if __name__ == "__main__":
+    main()
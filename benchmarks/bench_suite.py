@@ -0,0 +1,236 @@
+"""Suíte de desempenho offline: extração, armazenamento e documentos.
+
+Uso:
+    python benchmarks/bench_suite.py                                  # histórico 1k / 10k / 50k guias
+    python benchmarks/bench_suite.py --historico 1000 5000 --guias 20 --escaneadas 3
+    python benchmarks/bench_suite.py --json base.json                 # grava a linha de base
+    python benchmarks/bench_suite.py --baseline base.json --tolerancia 1.5   # sai com 1 se piorar
+
+Roda sem rede e sem Google Sheets: as guias são PDFs sintéticos
+(benchmarks/sinteticos.py, com camada de texto e só imagem) e o Sheets é a
+ConexaoMemoria (benchmarks/sheets_memoria.py). Mede:
+
+- extração: extrair_dados_pdf ponta a ponta (cache desligado) e a precisão
+  por campo contra o gabarito; as guias gravadas na planilha em memória
+  são relidas e conferidas também. Guias escaneadas só com OCR disponível
+  (serviço da máquina ou easyocr).
+- armazenamento, para cada tamanho de histórico, nos backends "sheets" e
+  "local": salvar uma fatura, atualizar uma fatura, montar o relatório
+  (cubo + 1ª página da base), checar duplicidade e buscar uma fatura.
+- documentos: DOCX e PDF da fatura (30, 300 e 1000 guias) e PDF do protocolo.
+
+Com --baseline, uma etapa regride quando fica mais que `tolerancia` vezes
+mais lenta (e pelo menos --folga segundos); a precisão não pode cair.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import importlib.util
+
+# Cache de extração e log de métricas desligados: cada medição faz o trabalho todo
+os.environ["FUSEX_CACHE_MB"] = "0"
+os.environ.setdefault("FUSEX_METRICAS_LOG", "")
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pandas as pd
+import servico_ocr
+from extracao import extrair_dados_pdf
+from armazenamento import (COLUNAS_GUIAS, MESES, ArmazenamentoLocal, ArmazenamentoSheets, CacheGuias,
+                           ConsultaMemoria, montar_registros, normalizar_guias)
+from documentos import tabela_fatura, tags_fatura, template_padrao, gerar_pdf_protocolo, gerar_pdf_fatura_base
+from sinteticos import corpus, confere, NOMES
+from sheets_memoria import ConexaoMemoria
+
+GUIAS_POR_FATURA = 30
+META = {"mes": "Novembro", "ano": 2025, "usuario": "TITULAR", "servico": "Fisioterapia"}
+
+def medir(funcao, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        t0 = time.perf_counter(); funcao()
+        melhor = min(melhor, time.perf_counter() - t0)
+    return melhor
+
+def ocr_disponivel():
+    return servico_ocr.disponivel() or importlib.util.find_spec("easyocr") is not None
+
+# ==========================================
+# 🔍 EXTRAÇÃO + PRECISÃO
+# ==========================================
+
+def _precisao(acertos):
+    campos = [ok for r in acertos for ok in r.values()]
+    return sum(campos) / len(campos) if campos else None
+
+def bench_extracao(n_texto, n_escaneadas, semente):
+    tempos, precisao, erros = {}, {}, []
+    if n_escaneadas and not ocr_disponivel():
+        print(f"  (sem OCR nesta máquina: {n_escaneadas} guia(s) escaneada(s) ficam de fora)")
+        n_escaneadas = 0
+    guias = corpus(n_texto, n_escaneadas, semente)
+    conn = ConexaoMemoria({"guias": COLUNAS_GUIAS})
+    sheets = ArmazenamentoSheets(conn)
+
+    for tipo, escaneada in (("texto", False), ("escaneada", True)):
+        lote = [g for g in guias if g[3] == escaneada]
+        if not lote: continue
+        extraidos, t0 = [], time.perf_counter()
+        for nome, pdf, _, _ in lote: extraidos.append(extrair_dados_pdf(pdf))
+        tempos[f"extracao.{tipo} (s/guia)"] = (time.perf_counter() - t0) / len(lote)
+        acertos = [confere(d, esperado) for d, (_, _, esperado, _) in zip(extraidos, lote)]
+        precisao[tipo] = _precisao(acertos)
+        erros += [(nome, campo, d.get(campo), esperado[campo]) for d, a, (nome, _, esperado, _) in zip(extraidos, acertos, lote)
+                  for campo, ok in a.items() if not ok]
+
+        # Ponta a ponta: o que foi extraído vai para a planilha (como no botão Salvar) e volta igual
+        ref = f"11.{len(precisao)}"
+        sheets.anexar(montar_registros(pd.DataFrame(extraidos), ref, META))
+        gravadas = normalizar_guias(sheets.carregar())
+        gravadas = gravadas[gravadas["fatura_ref"].astype(str) == ref]
+        relidas = [{"NOME DO PACIENTE": r["paciente_nome"], "NR DA GUIA": str(r["nr_guia"]), "DATA ATEND.": str(r["data_atend"]),
+                    "PREC-CP/SIAPE": str(r["prec_cp"]), "CÓDIGO PROCED.": str(r["cod_proced"]), "VALOR (R$)": r["valor"]}
+                   for _, r in gravadas.iterrows()]
+        precisao[f"{tipo}.planilha"] = _precisao([confere(r, esperado) for r, (_, _, esperado, _) in zip(relidas, lote)])
+    return tempos, precisao, erros
+
+# ==========================================
+# 🗄 ARMAZENAMENTO
+# ==========================================
+
+def historico(n, semente):
+    """n guias em faturas de GUIAS_POR_FATURA, espalhadas por competência (formato da aba 'guias')."""
+    rnd = random.Random(semente)
+    linhas, seq = [], {}
+    n_faturas = max(1, -(-n // GUIAS_POR_FATURA))
+    for f in range(n_faturas):
+        ano, mes = 2021 + (f * 5) // n_faturas, rnd.randint(1, 12)
+        seq[mes] = seq.get(mes, 0) + 1
+        ref, usuario = f"{mes}.{seq[mes]}", rnd.choice(["TITULAR", "DEPENDENTE", "PENSIONISTA"])
+        servico = rnd.choice(["Fisioterapia", "Fonoaudiologia", "Psicologia"])
+        for _ in range(GUIAS_POR_FATURA):
+            linhas.append([ref, MESES[mes - 1], ano, usuario, servico, rnd.choice(NOMES), str(rnd.randint(10**6, 10**7 - 1)),
+                           str(rnd.randint(10**8, 10**9 - 1)), f"{rnd.randint(1, 28):02d}/{mes:02d}", "50000470",
+                           round(rnd.uniform(30, 900), 2), "2025-01-01 08:00:00"])
+    return pd.DataFrame(linhas[:n], columns=COLUNAS_GUIAS)
+
+def fatura_editor(rnd):
+    """Uma fatura nova como sai do editor (colunas do DOCX)."""
+    return pd.DataFrame([{"NOME DO PACIENTE": rnd.choice(NOMES), "NR DA GUIA": str(rnd.randint(10**6, 10**7 - 1)),
+                          "DATA ATEND.": "05/11/2025", "PREC-CP/SIAPE": str(rnd.randint(10**8, 10**9 - 1)),
+                          "CÓDIGO PROCED.": "50000470", "VALOR (R$)": round(rnd.uniform(30, 900), 2)} for _ in range(GUIAS_POR_FATURA)])
+
+def backend_sheets(df):
+    conn = ConexaoMemoria({"guias": COLUNAS_GUIAS})
+    conn.abas["guias"].linhas += df.astype(object).values.tolist()
+    sheets = ArmazenamentoSheets(conn)
+    cache = CacheGuias(sheets.carregar)
+    # Mesmo caminho do app sem banco local: escrita invalida o cache, leitura vem da ConsultaMemoria
+    return sheets, ConsultaMemoria(cache), cache.agregados, cache.invalidar
+
+def backend_local(df):
+    local = ArmazenamentoLocal(":memory:")
+    local.importar(df)
+    return local, local, local.agregados, lambda: None
+
+def bench_armazenamento(tamanhos, repeticoes, semente):
+    tempos = {}
+    for n in tamanhos:
+        df = historico(n, semente)
+        alvo = str(df["fatura_ref"].iloc[len(df) // 2])
+        for nome, montar in (("sheets", backend_sheets), ("local", backend_local)):
+            rnd = random.Random(semente)
+            backend, consulta, agregados, invalidar = montar(df)
+            seq = iter(range(1, 10**6))
+
+            def salvar():
+                backend.anexar(montar_registros(fatura_editor(rnd), f"12.{900 + next(seq)}", META)); invalidar()
+            def atualizar():
+                backend.atualizar_fatura(alvo, montar_registros(fatura_editor(rnd), alvo, META)); invalidar()
+            def relatorio():
+                invalidar(); agregados(); consulta.consultar({}, 1, 50)
+            def duplicidade():
+                consulta.localizar_guias(fatura_editor(rnd)["NR DA GUIA"].tolist())
+            def buscar_fatura():
+                consulta.faturas(alvo[:2]); consulta.guias_das_faturas([alvo])
+
+            for etapa, funcao in (("salvar", salvar), ("atualizar", atualizar), ("relatorio", relatorio),
+                                  ("duplicidade", duplicidade), ("buscar_fatura", buscar_fatura)):
+                tempos[f"{nome}.{etapa}@{n}"] = medir(funcao, repeticoes)
+    return tempos
+
+# ==========================================
+# 📄 DOCUMENTOS
+# ==========================================
+
+def bench_documentos(repeticoes, semente):
+    tempos = {}
+    df = historico(1000, semente)
+    for n in (GUIAS_POR_FATURA, 300, 1000):
+        df_fat = df.head(n).assign(fatura_ref="11.1")
+        def docx():
+            df_tabela, meta = tabela_fatura(df_fat)
+            template_padrao().gerar_bytes(df_tabela, tags_fatura("11.1", meta, df_tabela["VALOR (R$)"].sum()), meta["usuario"])
+        tempos[f"docx.fatura@{n}"] = medir(docx, repeticoes)
+        tempos[f"pdf.fatura@{n}"] = medir(lambda: gerar_pdf_fatura_base("11.1", df_fat), repeticoes)
+    faturas = [f"{m}.{s}" for m in range(1, 13) for s in range(1, 4)]
+    tempos["pdf.protocolo@36"] = medir(lambda: gerar_pdf_protocolo(faturas, 36 * GUIAS_POR_FATURA, 123456.78), repeticoes)
+    return tempos
+
+# ==========================================
+# 🚦 COMPARAÇÃO COM A LINHA DE BASE
+# ==========================================
+
+def regressoes(atual, base, tolerancia, folga):
+    achadas = []
+    for etapa, antes in base.get("tempos", {}).items():
+        agora = atual["tempos"].get(etapa)
+        if agora is not None and agora > antes * tolerancia and agora - antes > folga:
+            achadas.append(f"{etapa}: {antes:.4f}s -> {agora:.4f}s ({agora / antes:.1f}x)")
+    for tipo, antes in base.get("precisao", {}).items():
+        agora = atual["precisao"].get(tipo)
+        if antes is not None and agora is not None and agora < antes:
+            achadas.append(f"precisão {tipo}: {antes:.1%} -> {agora:.1%}")
+    return achadas
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--historico", type=int, nargs="+", default=[1000, 10000, 50000], help="guias já gravadas na base")
+    ap.add_argument("--guias", type=int, default=30, help="guias sintéticas com camada de texto")
+    ap.add_argument("--escaneadas", type=int, default=5, help="guias sintéticas só imagem (precisam de OCR)")
+    ap.add_argument("--repeticoes", type=int, default=3)
+    ap.add_argument("--semente", type=int, default=42)
+    ap.add_argument("--json", help="grava o resultado (serve de linha de base)")
+    ap.add_argument("--baseline", help="resultado anterior para comparar")
+    ap.add_argument("--tolerancia", type=float, default=1.5, help="quantas vezes mais lento ainda passa")
+    ap.add_argument("--folga", type=float, default=0.005, help="diferença mínima (s) para contar como regressão")
+    args = ap.parse_args()
+
+    print("🔍 Extração")
+    tempos, precisao, erros = bench_extracao(args.guias, args.escaneadas, args.semente)
+    print("🗄  Armazenamento")
+    tempos.update(bench_armazenamento(args.historico, args.repeticoes, args.semente))
+    print("📄 Documentos")
+    tempos.update(bench_documentos(args.repeticoes, args.semente))
+
+    print(f"\n{'etapa':<40}{'segundos':>12}")
+    for etapa, s in tempos.items(): print(f"{etapa:<40}{s:>12.4f}")
+    print()
+    for tipo, p in precisao.items(): print(f"precisão {tipo:<31}{p:>12.1%}")
+    for nome, campo, obtido, esperado in erros[:10]: print(f"  {nome} {campo}: {obtido!r} != {esperado!r}")
+
+    resultado = {"tempos": tempos, "precisao": precisao}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(resultado, f, ensure_ascii=False, indent=1)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f: base = json.load(f)
+        achadas = regressoes(resultado, base, args.tolerancia, args.folga)
+        for r in achadas: print(f"❌ {r}")
+        if achadas: sys.exit(1)
+        print("✅ Sem regressões em relação à linha de base")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""GSheetsConnection em memória, para rodar os benchmarks sem Google Sheets.
+
+Implementa só o que o app usa: conn.read / conn.update e, via
+conn.client._select_worksheet, as chamadas do gspread feitas por
+armazenamento.PlanilhaGuias e ArmazenamentoSheets. Como no Sheets com
+USER_ENTERED, o apóstrofo inicial é tirado do valor gravado.
+"""
+import time
+import pandas as pd
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import a1_range_to_grid_range
+
+class AbaMemoria:
+    def __init__(self, nome, cabecalho=None):
+        self.nome = nome
+        self.linhas = [list(cabecalho)] if cabecalho else []
+        self.chamadas = 0
+
+    def _valor(self, v):
+        return v[1:] if isinstance(v, str) and v.startswith("'") else v
+
+    def _linha(self, valores):
+        return [self._valor(v) for v in valores]
+
+    def row_values(self, n):
+        self.chamadas += 1
+        return list(self.linhas[n - 1]) if len(self.linhas) >= n else []
+
+    def col_values(self, c):
+        self.chamadas += 1
+        col = ["" if len(r) < c else r[c - 1] for r in self.linhas]
+        while col and col[-1] == "": col.pop()
+        return [str(v) for v in col]
+
+    def get(self, faixa):
+        self.chamadas += 1
+        g = a1_range_to_grid_range(faixa)
+        c0 = g.get("startColumnIndex", 0)
+        c1 = g.get("endColumnIndex", c0 + 1)
+        return [r[c0:c1] for r in self.linhas[g["startRowIndex"]:g["endRowIndex"]]]
+
+    def update(self, range_name=None, values=None, **_):
+        self.chamadas += 1
+        self._escrever(range_name, values)
+
+    def _escrever(self, faixa, valores):
+        g = a1_range_to_grid_range(faixa)
+        r0, c0 = g["startRowIndex"], g.get("startColumnIndex", 0)
+        for i, row in enumerate(valores):
+            while len(self.linhas) <= r0 + i: self.linhas.append([])
+            destino = self.linhas[r0 + i]
+            while len(destino) < c0 + len(row): destino.append("")
+            destino[c0:c0 + len(row)] = self._linha(row)
+
+    def batch_update(self, dados, **_):
+        self.chamadas += 1
+        for d in dados: self._escrever(d["range"], d["values"])
+
+    def append_rows(self, valores, **_):
+        self.chamadas += 1
+        inicio = len(self.linhas) + 1
+        self.linhas.extend(self._linha(r) for r in valores)
+        return {"updates": {"updatedRange": f"{self.nome}!A{inicio}:Z{len(self.linhas)}"}}
+
+    def append_row(self, valores, **kw):
+        return self.append_rows([valores], **kw)
+
+    def insert_rows(self, valores, row=1, **_):
+        self.chamadas += 1
+        self.linhas[row - 1:row - 1] = [self._linha(r) for r in valores]
+
+    def delete_rows(self, inicio, fim=None):
+        self.chamadas += 1
+        del self.linhas[inicio - 1:(fim or inicio)]
+
+    def como_dataframe(self):
+        if not self.linhas: return pd.DataFrame()
+        cabecalho = self.linhas[0]
+        return pd.DataFrame([r + [""] * (len(cabecalho) - len(r)) for r in self.linhas[1:]], columns=cabecalho).replace("", None)
+
+class ClienteMemoria:
+    def __init__(self, conexao):
+        self._conexao = conexao
+
+    def _select_worksheet(self, worksheet=None):
+        if isinstance(worksheet, int): return list(self._conexao.abas.values())[worksheet]
+        if worksheet not in self._conexao.abas: raise WorksheetNotFound(worksheet)
+        return self._conexao.abas[worksheet]
+
+class ConexaoMemoria:
+    """Substituto de st.connection("gsheets", type=GSheetsConnection). `latencia` simula a ida à API (s)."""
+
+    def __init__(self, abas=None, latencia=0.0):
+        self.abas = {nome: AbaMemoria(nome, cab) for nome, cab in (abas or {}).items()}
+        self.latencia = latencia
+        self.leituras = 0
+        self.client = ClienteMemoria(self)
+
+    def read(self, worksheet=None, ttl=None, **_):
+        self.leituras += 1
+        if self.latencia: time.sleep(self.latencia)
+        return self.client._select_worksheet(worksheet).como_dataframe()
+
+    def update(self, worksheet=None, data=None, **_):
+        if self.latencia: time.sleep(self.latencia)
+        aba = self.abas.setdefault(worksheet, AbaMemoria(worksheet))
+        aba.linhas = [list(data.columns)] + data.astype(object).where(data.notna(), "").values.tolist()
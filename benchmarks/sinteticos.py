@@ -0,0 +1,86 @@
+"""Guias FUSEX sintéticas em PDF, com o gabarito dos campos.
+
+guia_pdf(rnd) desenha a guia com reportlab (camada de texto); com
+escaneada=True a página é rasterizada pelo PyMuPDF e volta como PDF só
+imagem, como sai do scanner, e precisa passar pelo OCR.
+"""
+import random
+from io import BytesIO
+import fitz  # PyMuPDF
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+NOMES = ["MARIA APARECIDA SOUZA", "JOSE CARLOS PEREIRA", "ANA LUIZA FERREIRA", "PEDRO HENRIQUE ALVES", "LUCAS GABRIEL COSTA"]
+CODIGOS = ["50000470", "50000489", "50001213", "20104430"]
+DPI_ESCANEADA = 150
+
+def _moeda(v):
+    return f"{v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+def gabarito_e_linhas(rnd):
+    """(campos esperados, linhas da guia) no layout que a extração procura."""
+    nr = str(rnd.randint(100000, 999999))
+    dia, mes = rnd.randint(1, 28), rnd.randint(1, 12)
+    titular, dependente = rnd.choice(NOMES), rnd.choice(NOMES) if rnd.random() < 0.5 else None
+    idt = f"{rnd.randint(10**8, 10**9 - 1)}-{rnd.randint(0, 9)}"
+    codigos = rnd.sample(CODIGOS, rnd.randint(1, 3))
+    valor = round(rnd.uniform(30, 9000), 2)
+
+    linhas = ["MINISTÉRIO DA DEFESA - EXÉRCITO BRASILEIRO", "FUNDO DE SAÚDE DO EXÉRCITO - FUSEX",
+              f"GUIA DE ENCAMINHAMENTO Nr: {nr}", f"Data: {dia:02d}/{mes:02d}/2025",
+              "Titular: (3º SGT)", f"{titular} UG Origem HGeJF"]
+    if dependente: linhas += ["Dependente: (FILHO)", f"{dependente} UG Origem HGeJF"]
+    linhas += [f"Idt: {idt}", f"Prec CP: {rnd.randint(10**8, 10**9 - 1)}", ""]
+    linhas += [f"{c} SESSÃO DE FISIOTERAPIA {rnd.randint(1, 10)} x" for c in codigos]
+    linhas += ["", f"Total: {_moeda(valor)}"]
+
+    esperado = {"NOME DO PACIENTE": dependente or titular, "NR DA GUIA": nr, "DATA ATEND.": f"{dia:02d}/{mes:02d}",
+                "PREC-CP/SIAPE": idt, "CÓDIGO PROCED.": ", ".join(sorted(codigos)), "VALOR (R$)": valor}
+    return esperado, linhas
+
+def _desenhar(linhas):
+    buf = BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    y = 800
+    for linha in linhas:
+        c.drawString(50, y, linha); y -= 18
+    c.save()
+    return buf.getvalue()
+
+def _rasterizar(pdf):
+    """Mesmo conteúdo, mas só imagem (sem camada de texto)."""
+    with fitz.open(stream=pdf, filetype="pdf") as origem:
+        pagina = origem[0]
+        pix = pagina.get_pixmap(dpi=DPI_ESCANEADA, colorspace=fitz.csGRAY)
+        saida = fitz.open()
+        nova = saida.new_page(width=pagina.rect.width, height=pagina.rect.height)
+        nova.insert_image(nova.rect, stream=pix.tobytes("png"))
+        conteudo = saida.tobytes(deflate=True); saida.close()
+    return conteudo
+
+def guia_pdf(rnd, escaneada=False):
+    """(bytes do PDF, campos esperados)."""
+    esperado, linhas = gabarito_e_linhas(rnd)
+    pdf = _desenhar(linhas)
+    return (_rasterizar(pdf) if escaneada else pdf), esperado
+
+def corpus(n_texto, n_escaneadas, semente=42):
+    """Lista de (nome, bytes, esperado, escaneada)."""
+    rnd = random.Random(semente)
+    guias = []
+    for i in range(n_texto + n_escaneadas):
+        escaneada = i >= n_texto
+        pdf, esperado = guia_pdf(rnd, escaneada)
+        guias.append((f"{'scan' if escaneada else 'texto'}_{i:03d}.pdf", pdf, esperado, escaneada))
+    return guias
+
+def confere(extraido, esperado):
+    """Campos que bateram com o gabarito ({campo: bool})."""
+    resultado = {}
+    for campo, certo in esperado.items():
+        valor = extraido.get(campo, "")
+        if isinstance(certo, float):
+            try: resultado[campo] = abs(float(valor) - certo) < 0.005
+            except (TypeError, ValueError): resultado[campo] = False
+        else: resultado[campo] = str(valor).strip() == certo
+    return resultado
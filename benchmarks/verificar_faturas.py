@@ -0,0 +1,109 @@
+"""Confere a numeração e a edição com versão das faturas no banco local.
+
+Uso:
+    python benchmarks/verificar_faturas.py                       # 6 processos x 10 faturas
+    python benchmarks/verificar_faturas.py --processos 12 --faturas 20
+
+Quatro cenários, cada um num banco novo numa pasta temporária:
+  - numeração concorrente: vários processos chamam nova_fatura na mesma
+    competência; nenhum número se repete nem reaproveita um já gravado;
+  - edição sem conflito: a versão lida é a atual, tudo entra;
+  - edição com conflito: duas sessões abrem a mesma versão; a segunda só
+    perde as linhas que a primeira também mexeu (e recebe os conflitos);
+  - busca literal: % e _ digitados na busca de faturas e de paciente
+    valem como texto, não como curinga do LIKE.
+Sai com 1 se algum cenário falhar.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing as mp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("FUSEX_METRICAS_LOG", "")
+from armazenamento import ArmazenamentoLocal
+
+def guia(nr, nome="PACIENTE", valor=10.0, ano=2025, mes="Março"):
+    return {"mes_competencia": mes, "ano_competencia": ano, "tipo_usuario": "FUSEX", "servicos_fatura": "Fisioterapia",
+            "paciente_nome": nome, "nr_guia": nr, "prec_cp": "1", "data_atend": "01/03", "cod_proced": "50000470", "valor": valor}
+
+def _numerar(args):
+    caminho, k, n = args
+    arm = ArmazenamentoLocal(caminho)
+    return [arm.nova_fatura(2025, "Março", [guia(f"{k}-{j}")]) for j in range(n)]
+
+def numeracao_concorrente(pasta, processos, faturas):
+    caminho = os.path.join(pasta, "numeracao.sqlite3")
+    arm = ArmazenamentoLocal(caminho)
+    arm.anexar([dict(guia("manual"), fatura_ref="'3.2")])                  # número digitado à mão
+    arm.anexar([dict(guia("outro_ano", ano=2024), fatura_ref="'3.5")])     # mesma série, outro ano
+    t0 = time.perf_counter()
+    with mp.Pool(processos) as pool:
+        refs = sum(pool.map(_numerar, [(caminho, k, faturas) for k in range(processos)]), [])
+    total = processos * faturas
+    # Continua depois do maior número já gravado (3.2) e pula o que existe em outro ano (3.5)
+    esperados = {f"3.{i}" for i in range(3, total + 4)} - {"3.5"}
+    ok = len(refs) == len(set(refs)) == total and set(refs) == esperados
+    return ok, f"{total} faturas em {time.perf_counter() - t0:.2f}s, {len(set(refs))} números únicos, próximo {arm.proxima_fatura(2025, 'Março')}"
+
+def edicao_sem_conflito(pasta):
+    arm = ArmazenamentoLocal(os.path.join(pasta, "edicao.sqlite3"))
+    ref = arm.nova_fatura(2025, "Abril", [guia("g1", "ANA"), guia("g2", "BIA")])
+    df, versao = arm.fatura_para_edicao(ref)
+    base = df.to_dict("records")
+    nova = [dict(r) for r in base]; nova[0]["valor"] = 1.5; nova.append(guia("g3", "CAU"))
+    nova_versao, conflitos = arm.editar_fatura(ref, versao, base, nova)
+    final = arm.fatura_para_edicao(ref)[0]
+    ok = not conflitos and nova_versao == versao + 1 and len(final) == 3 and final["valor"].tolist()[0] == 1.5
+    return ok, f"versão {versao} -> {nova_versao}, {len(final)} guias, sem conflitos"
+
+def edicao_com_conflito(pasta):
+    arm = ArmazenamentoLocal(os.path.join(pasta, "conflito.sqlite3"))
+    ref = arm.nova_fatura(2025, "Abril", [guia("g1", "ANA"), guia("g2", "BIA"), guia("g3", "CAU"), guia("g4", "DUD")])
+    df, versao = arm.fatura_para_edicao(ref)
+    base = df.to_dict("records")
+    # Sessão B salva primeiro: altera g1, apaga g2, inclui g9
+    b = [dict(r) for r in base]; b[0]["paciente_nome"] = "ANA B"; del b[1]; b.append(guia("g9", "NOVA B"))
+    arm.editar_fatura(ref, versao, base, b)
+    # Sessão A, com a versão velha: g1 e g2 batem com B; g3, g4 e g7 não
+    a = [dict(r) for r in base]; a[0]["paciente_nome"] = "ANA A"; a[1]["valor"] = 99; a[2]["paciente_nome"] = "CAU A"; del a[3]
+    a += [guia("g9", "NOVA A"), guia("g7", "SETE")]
+    _, conflitos = arm.editar_fatura(ref, versao, base, a)
+    df_final = arm.fatura_para_edicao(ref)[0]
+    final = dict(zip(df_final["nr_guia"], df_final["paciente_nome"]))
+    em_conflito = sorted(c["NR DA GUIA"] for c in conflitos)
+    ok = (em_conflito == ["g1", "g2", "g9"] and final.get("g1") == "ANA B" and "g2" not in final
+          and final.get("g3") == "CAU A" and "g4" not in final and final.get("g7") == "SETE" and final.get("g9") == "NOVA B")
+    return ok, f"conflitos em {', '.join(em_conflito) or 'nenhuma'}; guias finais {sorted(final)}"
+
+def busca_literal(pasta):
+    arm = ArmazenamentoLocal(os.path.join(pasta, "busca.sqlite3"))
+    for ref, nome in [("11.1", "ANA"), ("11.2", "BIA 100%"), ("A_1", "CAU_X"), ("AB1", "DUDX"), ("A%2", "EVA")]:
+        arm.anexar([dict(guia(ref, nome), fatura_ref=f"'{ref}")])
+    achados = {b: sorted(arm.faturas(b)) for b in ["_", "%", "A_", "11.1"]}
+    pacientes = {b: sorted(arm.consultar({"paciente": b})[0]["paciente_nome"]) for b in ["%", "_X"]}
+    ok = (achados == {"_": ["A_1"], "%": ["A%2"], "A_": ["A_1"], "11.1": ["11.1"]}
+          and pacientes == {"%": ["BIA 100%"], "_X": ["CAU_X"]})
+    return ok, f"faturas {achados}; pacientes {pacientes}"
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--processos", type=int, default=6)
+    ap.add_argument("--faturas", type=int, default=10, help="faturas numeradas por processo")
+    args = ap.parse_args()
+
+    falhas = 0
+    with tempfile.TemporaryDirectory(prefix="fusex_faturas_") as pasta:
+        for nome, cenario in [("numeração concorrente", lambda: numeracao_concorrente(pasta, args.processos, args.faturas)),
+                              ("edição sem conflito", lambda: edicao_sem_conflito(pasta)),
+                              ("edição com conflito", lambda: edicao_com_conflito(pasta)),
+                              ("busca literal", lambda: busca_literal(pasta))]:
+            ok, detalhe = cenario()
+            falhas += not ok
+            print(f"{'✅' if ok else '❌'} {nome}: {detalhe}")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == "__main__":
+    main()
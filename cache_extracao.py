@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+DIR_CACHE = os.environ.get("FUSEX_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "fusex"))
+# Tamanho máximo do cache em disco (0 desliga o cache)
+LIMITE_MB = float(os.environ.get("FUSEX_CACHE_MB", "256"))
+
+def sha256_bytes(conteudo):
+    return hashlib.sha256(conteudo).hexdigest()
+
+class CacheExtracao:
+    """Cache persistente da extração de guias, indexado pelo SHA-256 do PDF.
+
+    Guarda duas camadas independentes:
+      - texto: texto extraído (pdfplumber ou OCR) + se usou OCR, versionado por `versao_texto`;
+      - dados: dict `dados` já parseado pelas regex, versionado por `versao_campos`.
+    Mudar só as regex invalida apenas a camada de dados; o OCR (caro) é reaproveitado.
+    Quando passa do limite, remove os PDFs acessados há mais tempo (LRU).
+    """
+
+    def __init__(self, caminho=None, limite_bytes=None):
+        if caminho is None:
+            os.makedirs(DIR_CACHE, exist_ok=True)
+            caminho = os.path.join(DIR_CACHE, "extracao.sqlite3")
+        self.caminho = caminho
+        self.limite_bytes = int(LIMITE_MB * 1024 * 1024) if limite_bytes is None else limite_bytes
+        self._lock = threading.Lock()
+        # Vários processos do pool usam o mesmo arquivo: WAL + timeout para esperar o lock
+        self._db = sqlite3.connect(caminho, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS textos (
+            sha TEXT PRIMARY KEY, versao TEXT, texto TEXT, usou_ocr INTEGER, tamanho INTEGER, acesso REAL)""")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS dados (
+            sha TEXT PRIMARY KEY, versao TEXT, dados TEXT, tamanho INTEGER, acesso REAL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_textos_acesso ON textos(acesso)")
+
+    # --- CAMADA DE TEXTO ---
+    def obter_texto(self, sha, versao):
+        with self._lock:
+            row = self._db.execute("SELECT texto, usou_ocr FROM textos WHERE sha=? AND versao=?", (sha, versao)).fetchone()
+            if row is None: return None
+            self._db.execute("UPDATE textos SET acesso=? WHERE sha=?", (time.time(), sha))
+        return row[0], bool(row[1])
+
+    def salvar_texto(self, sha, versao, texto, usou_ocr):
+        tamanho = len(texto.encode("utf-8"))
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO textos VALUES (?, ?, ?, ?, ?, ?)", (sha, versao, texto, int(usou_ocr), tamanho, time.time()))
+        self._evict()
+
+    # --- CAMADA DE DADOS ---
+    def obter_dados(self, sha, versao):
+        with self._lock:
+            row = self._db.execute("SELECT dados FROM dados WHERE sha=? AND versao=?", (sha, versao)).fetchone()
+            if row is None: return None
+            self._db.execute("UPDATE textos SET acesso=? WHERE sha=?", (time.time(), sha))
+        return json.loads(row[0])
+
+    def salvar_dados(self, sha, versao, dados):
+        payload = json.dumps(dados, ensure_ascii=False)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO dados VALUES (?, ?, ?, ?, ?)", (sha, versao, payload, len(payload), time.time()))
+
+    # --- EVICÇÃO LRU ---
+    def tamanho_total(self):
+        with self._lock:
+            t = self._db.execute("SELECT COALESCE(SUM(tamanho), 0) FROM textos").fetchone()[0]
+            d = self._db.execute("SELECT COALESCE(SUM(tamanho), 0) FROM dados").fetchone()[0]
+        return t + d
+
+    def _evict(self):
+        excesso = self.tamanho_total() - self.limite_bytes
+        if excesso <= 0: return
+        with self._lock:
+            # Remove os PDFs menos usados (as duas camadas juntas) até caber no limite
+            for sha, tamanho in self._db.execute("SELECT sha, tamanho FROM textos ORDER BY acesso").fetchall():
+                if excesso <= 0: break
+                d = self._db.execute("SELECT COALESCE(SUM(tamanho), 0) FROM dados WHERE sha=?", (sha,)).fetchone()[0]
+                self._db.execute("DELETE FROM textos WHERE sha=?", (sha,))
+                self._db.execute("DELETE FROM dados WHERE sha=?", (sha,))
+                excesso -= tamanho + d
+
+# ==========================================
+# 📦 INSTÂNCIA DO PROCESSO
+# ==========================================
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def obter_cache():
+    """Cache compartilhado do processo; None se desligado ou se o disco não estiver disponível."""
+    global _cache
+    if LIMITE_MB <= 0: return None
+    with _cache_lock:
+        if _cache is None:
+            try: _cache = CacheExtracao()
+            except (OSError, sqlite3.Error): return None
+        return _cache
@@ -0,0 +1,104 @@
+import re
+import pandas as pd
+
+# ==========================================
+# 🛠 FUNÇÕES UTILITÁRIAS
+# ==========================================
+
+def limpar_data_sem_ano(texto):
+    """Remove o ano de datas, mantendo dd/mm ou intervalos."""
+    if pd.isna(texto): return ""
+    texto = str(texto)
+    # Só tira o terceiro pedaço (dd/mm/aaaa ou dd/mm/aa): "19/02" já sem ano fica como está
+    texto = re.sub(r'(?<!\d)(\d{1,2}/\d{1,2})/(?:\d{4}|\d{2})(?!\d)', r'\1', texto)
+    return texto.strip()
+
+def dados_vazios():
+    return {"NOME DO PACIENTE": "", "NR DA GUIA": "", "DATA ATEND.": "", "PREC-CP/SIAPE": "", "CÓDIGO PROCED.": "", "VALOR (R$)": 0.0}
+
+def _nome_paciente(v):
+    v = v.strip()
+    if "UG Origem" in v: v = v.split("UG Origem")[0].strip()
+    return v
+
+def _valor_br(v):
+    return float(v.replace('.', '').replace(',', '.'))
+
+# ==========================================
+# 🧩 LAYOUTS DE GUIA
+# ==========================================
+
+class Padrao:
+    """Um jeito de achar um campo no texto.
+
+    `regex` deve marcar o valor com o grupo nomeado (?P<valor>...). Os padrões de um
+    mesmo campo são tentados em ordem de `confianca`; o primeiro que achar encerra o
+    campo. `multiplo` junta todas as ocorrências (ex.: códigos de procedimento).
+    """
+
+    def __init__(self, campo, regex, confianca, converter=None, filtro=None, multiplo=False):
+        self.campo = campo
+        self.regex = regex
+        self.confianca = confianca
+        self.converter = converter
+        self.filtro = filtro
+        self.multiplo = multiplo
+
+class LayoutGuia:
+    """Conjunto de padrões de um convênio, compilados uma vez só na carga do módulo."""
+
+    def __init__(self, nome, padroes, assinatura=None, flags=re.IGNORECASE):
+        self.nome = nome
+        self.padroes = padroes
+        self.assinatura = re.compile(assinatura, flags) if assinatura else None
+        self._por_campo = {}
+        for p in sorted(padroes, key=lambda p: -p.confianca):
+            self._por_campo.setdefault(p.campo, []).append((p, re.compile(p.regex, flags)))
+
+    def extrair(self, texto):
+        """Devolve (dados, confianca) com uma confiança de 0 a 1 por campo."""
+        dados = dados_vazios(); confianca = {c: 0.0 for c in dados}
+        for campo, alternativas in self._por_campo.items():
+            for p, rx in alternativas:
+                if p.multiplo:
+                    valores = {m.group("valor") for m in rx.finditer(texto)}
+                    if p.filtro: valores = {v for v in valores if p.filtro(v)}
+                    if not valores: continue
+                    dados[campo] = ", ".join(sorted(valores)); confianca[campo] = p.confianca
+                    break
+                m = rx.search(texto)
+                if m is None or (p.filtro and not p.filtro(m.group("valor"))): continue
+                try: valor = p.converter(m.group("valor")) if p.converter else m.group("valor")
+                except (ValueError, TypeError): break
+                dados[campo] = valor
+                if valor != "": confianca[campo] = p.confianca
+                break
+        return dados, confianca
+
+# Guia de encaminhamento FUSEX (layout atual de todas as guias)
+LAYOUT_FUSEX = LayoutGuia("FUSEX", [
+    Padrao("NR DA GUIA", r'(?:Nr|Numero)[:\.]?\s*(?P<valor>\d+)', 0.9),
+    Padrao("DATA ATEND.", r'Data:\s*(?P<valor>\d{2}/\d{2}/\d{4})', 0.95, limpar_data_sem_ano),
+    Padrao("NOME DO PACIENTE", r'Dependente:\s*\(.*?\)\s*\n?(?P<valor>.+)', 0.95, _nome_paciente),
+    Padrao("NOME DO PACIENTE", r'Titular:\s*\(.*?\)\s*\n?(?P<valor>.+)', 0.9, _nome_paciente),
+    Padrao("PREC-CP/SIAPE", r'Idt:\s*(?P<valor>[\d-]+)', 0.95),
+    Padrao("PREC-CP/SIAPE", r'Prec CP:\s*(?P<valor>\d+)', 0.9),
+    Padrao("VALOR (R$)", r'Total\s*:?\s*(?P<valor>[\d\.,]+)', 0.9, _valor_br),
+    # Qualquer data solta: só vale se não houver "Data:"
+    Padrao("DATA ATEND.", r'(?P<valor>\d{2}/\d{2}/\d{4})', 0.6, limpar_data_sem_ano),
+    # Códigos de exatamente 8 dígitos; os que começam com 202 são anos/datas coladas.
+    # Equivale a (?<!\d)\d{8}(?!\d), mas começar por \d deixa a busca bem mais rápida
+    Padrao("CÓDIGO PROCED.", r'(?P<valor>\d(?<!\d\d)\d{7})(?!\d)', 0.8, filtro=lambda c: not c.startswith("202"), multiplo=True),
+])
+
+# Registro de layouts: convênios novos (PASS, S.CIVIL) entram aqui com uma `assinatura`
+# que identifica a guia. Sem assinatura reconhecida vale o layout FUSEX.
+LAYOUTS = [LAYOUT_FUSEX]
+
+def detectar_layout(texto):
+    for layout in LAYOUTS:
+        if layout.assinatura is not None and layout.assinatura.search(texto): return layout
+    return LAYOUT_FUSEX
+
+def extrair_campos_com_confianca(texto, layout=None):
+    return (layout or detectar_layout(texto)).extrair(texto)
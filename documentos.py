@@ -0,0 +1,406 @@
+import os
+import copy
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from datetime import datetime
+import pytz
+import pandas as pd
+from cache_extracao import DIR_CACHE
+from metricas import medir
+
+MIME_DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+MIME_PDF = "application/pdf"
+TAGS_FATURA = ["{{NUM_FATURA}}", "{{MES_ANO}}", "{{SERVICO}}", "{{TOTAL}}", "{{EXTENSO}}"]
+OPCOES_USUARIO = ["FUSEX", "PASS (S.CIVIL)", "FATOR DE CUSTO", "Ex-Combatente"]
+
+# Documentos já gerados: quantos ficam em memória e quanto ocupam no disco (0 desliga o disco)
+ARTEFATOS_MEMORIA = 16
+ARTEFATOS_MB = float(os.environ.get("FUSEX_ARTEFATOS_MB", "64"))
+# Suba a cada mudança no modelo DOCX ou no desenho dos PDFs: entra na chave do cache de documentos
+VERSAO_DOCUMENTOS = 1
+
+# ==========================================
+# 📄 MODELO DA FATURA (DOCX)
+# ==========================================
+# python-docx, reportlab e num2words são importados na primeira geração,
+# não no import do módulo: a tela de login não paga por eles.
+
+def criar_template_padrao():
+    from docx import Document
+    from docx.shared import Pt
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    doc = Document()
+    style = doc.styles['Normal']; style.font.name = 'Arial'; style.font.size = Pt(10)
+    p = doc.add_paragraph('Corpore Centro de Saúde Ltda - CNPJ 15.259.434/0001-88')
+    p.alignment = WD_ALIGN_PARAGRAPH.CENTER; p.runs[0].bold = True
+    doc.add_paragraph('')
+    p_fat = doc.add_paragraph(); p_fat.add_run('FATURA Nº: ').bold = True; p_fat.add_run('{{NUM_FATURA}} – {{SERVICO}} – {{MES_ANO}}')
+    doc.add_paragraph('REFERENTE A USUÁRIO:   FUSEX( ) ...')
+    table = doc.add_table(rows=1, cols=6); table.style = 'Table Grid'
+    hdr = ["NOME DO PACIENTE", "NR DA GUIA", "DATA ATEND.", "PREC-CP/SIAPE", "CÓD PROCED.", "VALOR R$"]
+    for i, h in enumerate(hdr): table.rows[0].cells[i].text = h
+    doc.add_paragraph(''); p_ext = doc.add_paragraph(); p_ext.add_run('VALOR POR EXTENSO: ').bold = True; p_ext.add_run('{{EXTENSO}} ({{TOTAL}})')
+    return doc
+
+def texto_referente(tipo_usuario):
+    texto_base = "REFERENTE A USUÁRIO:   "
+    for op in OPCOES_USUARIO:
+        marcador = "( X )" if tipo_usuario == op else "( )"
+        if tipo_usuario in ("PASS", "S.CIVIL") and op == "PASS (S.CIVIL)": marcador = "( X )"
+        texto_base += f"{op} {marcador}    "
+    return texto_base
+
+def formatar_moeda_br(valor):
+    try:
+        return f"R$ {float(valor):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    except:
+        return "R$ 0,00"
+
+def tabela_fatura(df_fat):
+    """Linhas de uma fatura da base ('guias') -> (tabela no formato do DOCX, meta da fatura)."""
+    meta = {
+        'mes': df_fat.iloc[0]['mes_competencia'],
+        'ano': df_fat.iloc[0]['ano_competencia'],
+        'usuario': df_fat.iloc[0]['tipo_usuario'],
+        'servico': df_fat.iloc[0]['servicos_fatura']
+    }
+    df_tabela = df_fat[["paciente_nome", "nr_guia", "data_atend", "prec_cp", "cod_proced", "valor"]].copy()
+    df_tabela.columns = ["NOME DO PACIENTE", "NR DA GUIA", "DATA ATEND.", "PREC-CP/SIAPE", "CÓDIGO PROCED.", "VALOR (R$)"]
+    return df_tabela, meta
+
+def tags_fatura(fatura_ref, meta, total):
+    from num2words import num2words
+    extenso = num2words(total, lang='pt_BR', to='currency').upper()
+    return {"{{NUM_FATURA}}": fatura_ref, "{{MES_ANO}}": f"{meta['mes']}/{meta['ano']}", "{{SERVICO}}": meta['servico'], "{{TOTAL}}": formatar_moeda_br(total), "{{EXTENSO}}": extenso}
+
+def valor_tabela(v):
+    return f"{v:,.2f}".replace('.', 'X').replace(',', '.').replace('X', ',')
+
+class TemplateFatura:
+    """Modelo de fatura analisado uma vez só.
+
+    Na compilação ficam guardados os parágrafos que têm tags, o parágrafo do
+    "REFERENTE A USUÁRIO" e duas linhas-protótipo da tabela (guia e TOTAL) já com
+    a fonte aplicada. Cada geração só relê o modelo e clona as linhas direto no
+    XML, sem `add_row()` nem formatação célula a célula.
+    """
+
+    def __init__(self, modelo):
+        from docx import Document
+        from docx.shared import Pt
+        if not isinstance(modelo, (bytes, bytearray)):
+            buf = BytesIO(); modelo.save(buf); modelo = buf.getvalue()
+        self.modelo = bytes(modelo)
+        doc = Document(BytesIO(self.modelo))
+        self.paragrafos_tags = []; self.paragrafo_usuario = None
+        for i, p in enumerate(doc.paragraphs):
+            texto = p.text
+            tags = [t for t in TAGS_FATURA if t in texto]
+            if tags: self.paragrafos_tags.append((i, tags))
+            if "REFERENTE A USUÁRIO" in texto: self.paragrafo_usuario = i
+        self.linha = self.linha_total = None
+        if doc.tables:
+            tabela = doc.tables[0]
+            # Protótipos montados pelo próprio python-docx: o XML gerado é o mesmo do add_row()
+            cells = tabela.add_row().cells
+            for c in cells:
+                c.text = "-"; c.paragraphs[0].runs[0].font.size = Pt(9)  # texto provisório só para criar o <w:t>
+            self.linha = self._destacar(tabela, cells)
+            cells = tabela.add_row().cells
+            cells[4].text = "TOTAL"; cells[5].text = "-"
+            self.linha_total = self._destacar(tabela, cells)
+
+    @staticmethod
+    def _destacar(tabela, cells):
+        tr = cells[0]._tc.getparent()
+        tabela._tbl.remove(tr)
+        return tr
+
+    def _linhas(self, df_dados):
+        from docx.oxml.ns import qn
+        for row in df_dados.to_dict("records"):
+            tr = copy.deepcopy(self.linha)
+            vals = [row.get("NOME DO PACIENTE", ""), row.get("NR DA GUIA", ""), row.get("DATA ATEND.", ""), row.get("PREC-CP/SIAPE", ""), row.get("CÓDIGO PROCED.", ""), valor_tabela(row.get("VALOR (R$)", 0.0))]
+            for t, v in zip(tr.iter(qn("w:t")), vals): t.text = str(v)
+            yield tr
+
+    def renderizar(self, df_dados, tags, tipo_usuario):
+        """Devolve o Document da fatura preenchido."""
+        with medir("docx.fatura", linhas=len(df_dados)):
+            return self._renderizar(df_dados, tags, tipo_usuario)
+
+    def _renderizar(self, df_dados, tags, tipo_usuario):
+        from docx import Document
+        from docx.oxml.ns import qn
+        doc = Document(BytesIO(self.modelo))
+        paragrafos = doc.paragraphs
+        for i, tags_paragrafo in self.paragrafos_tags:
+            _substituir(paragrafos[i], {k: str(tags[k]) for k in tags_paragrafo if k in tags})
+        if self.paragrafo_usuario is not None:
+            paragrafos[self.paragrafo_usuario].text = texto_referente(tipo_usuario)
+
+        if self.linha is not None:
+            tbl = doc.tables[0]._tbl
+            tbl.extend(self._linhas(df_dados))
+            total = copy.deepcopy(self.linha_total)
+            list(total.iter(qn("w:t")))[-1].text = str(tags["{{TOTAL}}"])
+            tbl.append(total)
+
+        _rodape(doc)
+        return doc
+
+    def gerar_bytes(self, df_dados, tags, tipo_usuario):
+        buf = BytesIO(); self.renderizar(df_dados, tags, tipo_usuario).save(buf)
+        return buf.getvalue()
+
+def _substituir(paragrafo, valores):
+    """Troca as tags dentro de cada run (mantém o negrito do rótulo); tag quebrada entre runs cai no p.text."""
+    for run in paragrafo.runs:
+        texto = run.text
+        for k, v in valores.items():
+            if k in texto: texto = texto.replace(k, v)
+        if texto != run.text: run.text = texto
+    texto = paragrafo.text
+    if any(k in texto for k in valores):
+        for k, v in valores.items(): texto = texto.replace(k, v)
+        paragrafo.text = texto
+
+def _rodape(doc):
+    from docx.shared import Pt
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    section = doc.sections[0]
+    footer = section.footer
+    p_footer = footer.paragraphs[0] if footer.paragraphs else footer.add_paragraph()
+
+    fuso_br = pytz.timezone('America/Sao_Paulo')
+    agora = datetime.now(fuso_br).strftime("%d/%m/%Y às %H:%M")
+    p_footer.text = f"Gestão Corpore - Documento gerado em: {agora}"
+    p_footer.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+    if not p_footer.runs: p_footer.add_run()
+    p_footer.runs[0].font.size = Pt(8)
+
+@functools.lru_cache(maxsize=1)
+def template_padrao():
+    return TemplateFatura(criar_template_padrao())
+
+def gerar_doc_word(df_dados, tags, tipo_usuario, template=None):
+    return (template or template_padrao()).renderizar(df_dados, tags, tipo_usuario)
+
+# ==========================================
+# 🧾 FATURA (PDF)
+# ==========================================
+# Desenhada direto no canvas do reportlab, como o protocolo: não passa pelo
+# DOCX, então imprimir ou juntar num PDF só não depende de LibreOffice.
+
+# (título, largura em cm) — somam os 18 cm úteis do A4 com margem de 1,5 cm
+COLUNAS_PDF = [("NOME DO PACIENTE", 5.4), ("NR DA GUIA", 2.0), ("DATA ATEND.", 2.4), ("PREC-CP/SIAPE", 2.4), ("CÓD PROCED.", 3.8), ("VALOR R$", 2.0)]
+
+def _caber(texto, largura, fonte, tamanho):
+    """(texto, tamanho) que cabem na célula: reduz a fonte até 6 pt e, se não bastar, corta com reticências."""
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    while tamanho > 6 and stringWidth(texto, fonte, tamanho) > largura: tamanho -= 0.5
+    if stringWidth(texto, fonte, tamanho) > largura:
+        while texto and stringWidth(texto + "…", fonte, tamanho) > largura: texto = texto[:-1]
+        texto += "…"
+    return texto, tamanho
+
+def _linhas_pdf(c, xs, y, linhas, fonte, altura):
+    """Linhas da tabela a partir de y (topo), com a grade; o valor (última coluna) vai à direita. Devolve o y de baixo."""
+    from reportlab.lib.units import cm
+    y_fim = y - altura * len(linhas)
+    # Grade inteira numa chamada só: por célula (c.rect) a geração fica várias vezes mais lenta
+    c.lines([(xs[0], y - altura * i, xs[-1], y - altura * i) for i in range(len(linhas) + 1)] + [(x, y, x, y_fim) for x in xs])
+    atual = None
+    for celulas in linhas:
+        y -= altura
+        for i, texto in enumerate(celulas):
+            if not texto: continue
+            x, largura = xs[i], xs[i + 1] - xs[i]
+            texto, tamanho = _caber(str(texto), largura - 0.2*cm, fonte, 8)
+            if atual != tamanho: c.setFont(fonte, tamanho); atual = tamanho
+            if i == len(celulas) - 1: c.drawRightString(x + largura - 0.1*cm, y + 0.16*cm, texto)
+            else: c.drawString(x + 0.1*cm, y + 0.16*cm, texto)
+    return y
+
+def gerar_pdf_fatura(df_dados, tags, tipo_usuario):
+    """Fatura em PDF (bytes) com as colunas e tags do DOCX: cabeçalho e títulos da tabela em toda página, TOTAL e extenso no fim."""
+    with medir("pdf.fatura", linhas=len(df_dados)): return _gerar_pdf_fatura(df_dados, tags, tipo_usuario)
+
+def _gerar_pdf_fatura(df_dados, tags, tipo_usuario):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.units import cm
+    from reportlab.lib.utils import simpleSplit
+    largura, altura = A4
+    topo, base, h = altura - 1.5*cm, 2*cm, 0.5*cm
+    xs = [1.5*cm]
+    for _, w in COLUNAS_PDF: xs.append(xs[-1] + w*cm)
+    y_tabela = topo - 2.2*cm
+
+    linhas = [[row.get("NOME DO PACIENTE", ""), row.get("NR DA GUIA", ""), row.get("DATA ATEND.", ""), row.get("PREC-CP/SIAPE", ""),
+               row.get("CÓDIGO PROCED.", ""), valor_tabela(row.get("VALOR (R$)", 0.0))] for row in df_dados.to_dict("records")]
+    linhas = [["" if pd.isna(v) else v for v in l] for l in linhas]
+    # Paginação calculada antes de desenhar: o rodapé já sai com "Página i de N"
+    por_pagina = int((y_tabela - base) // h) - 1
+    paginas = [linhas[i:i + por_pagina] for i in range(0, len(linhas), por_pagina)] or [[]]
+    extenso = simpleSplit(f"VALOR POR EXTENSO: {tags['{{EXTENSO}}']} ({tags['{{TOTAL}}']})", "Helvetica", 9, xs[-1] - xs[0])
+    fecho = h + 0.3*cm + len(extenso) * 0.45*cm
+    if (len(paginas[-1]) + 1) * h + fecho > y_tabela - base: paginas.append([])
+
+    fuso_br = pytz.timezone('America/Sao_Paulo')
+    gerado = datetime.now(fuso_br).strftime("%d/%m/%Y às %H:%M")
+    buffer = BytesIO(); c = canvas.Canvas(buffer, pagesize=A4)
+    c.setTitle(f"Fatura {tags['{{NUM_FATURA}}']}"); c.setLineWidth(0.5)
+    for n, pagina in enumerate(paginas, start=1):
+        c.setFont("Helvetica-Bold", 10); c.drawCentredString(largura / 2, topo, "Corpore Centro de Saúde Ltda - CNPJ 15.259.434/0001-88")
+        c.drawString(xs[0], topo - 0.9*cm, "FATURA Nº: ")
+        c.setFont("Helvetica", 10)
+        c.drawString(xs[0] + c.stringWidth("FATURA Nº: ", "Helvetica-Bold", 10), topo - 0.9*cm, f"{tags['{{NUM_FATURA}}']} – {tags['{{SERVICO}}']} – {tags['{{MES_ANO}}']}")
+        c.setFont("Helvetica", 8); c.drawString(xs[0], topo - 1.5*cm, texto_referente(tipo_usuario))
+
+        y = _linhas_pdf(c, xs, y_tabela, [[t for t, _ in COLUNAS_PDF]], "Helvetica-Bold", h)
+        y = _linhas_pdf(c, xs, y, pagina, "Helvetica", h)
+        if n == len(paginas):
+            y = _linhas_pdf(c, xs, y, [["", "", "", "", "TOTAL", tags["{{TOTAL}}"].replace("R$ ", "")]], "Helvetica-Bold", h) - 0.3*cm
+            c.setFont("Helvetica", 9)
+            for texto in extenso: y -= 0.45*cm; c.drawString(xs[0], y, texto)
+
+        c.setFont("Helvetica", 8)
+        c.drawRightString(xs[-1], 1.2*cm, f"Gestão Corpore - Documento gerado em: {gerado} · Página {n} de {len(paginas)}")
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+def gerar_pdf_fatura_base(fatura_ref, df_fat):
+    """PDF da fatura direto das linhas da base ('guias')."""
+    df_tabela, meta = tabela_fatura(df_fat)
+    tags = tags_fatura(fatura_ref, meta, df_tabela["VALOR (R$)"].sum() if not df_tabela.empty else 0.0)
+    return gerar_pdf_fatura(df_tabela, tags, meta['usuario'])
+
+# ==========================================
+# 🗃 CACHE DE DOCUMENTOS GERADOS
+# ==========================================
+
+def chave_conteudo(*partes):
+    """SHA-256 das partes; DataFrames entram pelo hash das linhas (muda se qualquer célula mudar)."""
+    h = hashlib.sha256()
+    for parte in partes:
+        if isinstance(parte, pd.DataFrame):
+            h.update("|".join(map(str, parte.columns)).encode("utf-8"))
+            h.update(pd.util.hash_pandas_object(parte, index=False).values.tobytes())
+        else:
+            h.update(repr(parte).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+class CacheArtefatos:
+    """Bytes de documentos gerados, por chave de conteúdo.
+
+    LRU em memória com `max_memoria` itens e cópia em disco limitada a
+    `limite_bytes` (os arquivos acessados há mais tempo saem primeiro), para a
+    2ª via continuar instantânea depois de um restart do servidor. A chave leva a
+    `versao` dos geradores: documento de um modelo antigo nunca volta do disco.
+    """
+
+    def __init__(self, pasta=None, max_memoria=ARTEFATOS_MEMORIA, limite_bytes=None, versao=VERSAO_DOCUMENTOS):
+        self.pasta = pasta or os.path.join(DIR_CACHE, "artefatos")
+        self.versao = versao
+        self.max_memoria = max_memoria
+        self.limite_bytes = int(ARTEFATOS_MB * 1024 * 1024) if limite_bytes is None else limite_bytes
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        if self.limite_bytes > 0:
+            try: os.makedirs(self.pasta, exist_ok=True)
+            except OSError: self.limite_bytes = 0
+
+    def _arquivo(self, chave):
+        return os.path.join(self.pasta, chave + ".bin")
+
+    def _guardar_memoria(self, chave, conteudo):
+        self._memoria[chave] = conteudo; self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.max_memoria: self._memoria.popitem(last=False)
+
+    def _ler_disco(self, chave):
+        if self.limite_bytes <= 0: return None
+        try:
+            with open(self._arquivo(chave), "rb") as f: conteudo = f.read()
+            os.utime(self._arquivo(chave))
+            return conteudo
+        except OSError:
+            return None
+
+    def _gravar_disco(self, chave, conteudo):
+        if self.limite_bytes <= 0: return
+        try:
+            temp = self._arquivo(chave) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp, "wb") as f: f.write(conteudo)
+            os.replace(temp, self._arquivo(chave))
+            self._evict()
+        except OSError:
+            pass  # sem disco o cache segue só em memória
+
+    def _evict(self):
+        arquivos = []
+        for nome in os.listdir(self.pasta):
+            if not nome.endswith(".bin"): continue
+            try: info = os.stat(os.path.join(self.pasta, nome))
+            except OSError: continue
+            arquivos.append((info.st_mtime, info.st_size, nome))
+        excesso = sum(a[1] for a in arquivos) - self.limite_bytes
+        for _, tamanho, nome in sorted(arquivos):
+            if excesso <= 0: break
+            try: os.remove(os.path.join(self.pasta, nome))
+            except OSError: pass
+            excesso -= tamanho
+
+    def obter(self, chave, gerar):
+        """Bytes do documento `chave`; chama `gerar()` só se ele não estiver no cache.
+
+        Disco e geração rodam fora da trava: uma 2ª via demorada não segura as outras sessões.
+        """
+        chave = f"v{self.versao}_{chave}"
+        with self._lock:
+            conteudo = self._memoria.get(chave)
+            if conteudo is not None:
+                self._memoria.move_to_end(chave); return conteudo
+        conteudo = self._ler_disco(chave)
+        if conteudo is None:
+            conteudo = gerar()
+            self._gravar_disco(chave, conteudo)
+        with self._lock: self._guardar_memoria(chave, conteudo)
+        return conteudo
+
+# ==========================================
+# 📦 PROTOCOLO (PDF)
+# ==========================================
+
+def gerar_pdf_protocolo(faturas_selecionadas, qtd_guias, total_faturas):
+    with medir("pdf.protocolo"): return _gerar_pdf_protocolo(faturas_selecionadas, qtd_guias, total_faturas)
+
+def _gerar_pdf_protocolo(faturas_selecionadas, qtd_guias, total_faturas):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.units import cm
+    buffer = BytesIO(); c = canvas.Canvas(buffer, pagesize=A4)
+    data_envio = datetime.now().strftime("%d/%m/%Y às %H:%M")
+    endereco_fusex = ["Aos Cuidados FUSEX", "Hospital Geral de Juiz de Fora - HGeJF", "Endereço: R. Gen. Deschamps Cavalcante, s/n - Fábrica", "Juiz de Fora - MG, 36080-220"]
+    def desenhar_via(y_inicial):
+        c.setFont("Helvetica-Bold", 14); c.drawString(2*cm, y_inicial, "CORPORE CENTRO DE SAÚDE LTDA")
+        c.setFont("Helvetica", 10); c.drawString(2*cm, y_inicial - 0.5*cm, "PROTOCOLO DE REMESSA DE FATURAS FUSEX")
+        c.setFont("Helvetica", 9); y_dest = y_inicial
+        for linha in endereco_fusex: c.drawRightString(19*cm, y_dest, linha); y_dest -= 0.4*cm
+        y_box = y_inicial - 2.8*cm; c.rect(2*cm, y_box - 2.5*cm, 17*cm, 2.5*cm)
+        c.setFont("Helvetica-Bold", 11); c.drawString(2.5*cm, y_box - 0.8*cm, f"QTD FATURAS: {len(faturas_selecionadas)}"); c.drawString(10*cm, y_box - 0.8*cm, f"TOTAL DE GUIAS: {qtd_guias}")
+        lista_faturas_str = [str(f) for f in faturas_selecionadas]; texto_faturas = ", ".join(lista_faturas_str)
+        if len(texto_faturas) > 90: texto_faturas = texto_faturas[:90] + "..."
+        c.setFont("Helvetica", 10); c.drawString(2.5*cm, y_box - 1.5*cm, f"Ref. Faturas: {texto_faturas}")
+        valor_fmt = f"{total_faturas:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.'); c.drawString(2.5*cm, y_box - 2.2*cm, f"Gestão Corpore: Walter Vilaça")
+        y_ass = y_box - 4.5*cm; c.line(2*cm, y_ass, 9*cm, y_ass); c.setFont("Helvetica", 8); c.drawString(2*cm, y_ass - 0.4*cm, "Despachado por (Corpore)")
+        c.line(11*cm, y_ass, 19*cm, y_ass); c.drawString(11*cm, y_ass - 0.4*cm, "Transportado por (Motoboy)")
+        y_ass2 = y_ass - 2.5*cm; c.line(2*cm, y_ass2, 19*cm, y_ass2); c.setFont("Helvetica-Bold", 9); c.drawString(2*cm, y_ass2 - 0.5*cm, "Recebido por (Carimbo/Assinatura HGeJF)")
+        c.setFont("Helvetica-Oblique", 7); c.drawRightString(19*cm, y_ass2 - 1.2*cm, f"Gerado via Sistema Corpore em: {data_envio}")
+    desenhar_via(27*cm); c.setDash(4, 4); c.line(1*cm, 14.85*cm, 20*cm, 14.85*cm); c.setFont("Helvetica", 6); c.drawCentredString(10.5*cm, 14.95*cm, "- - - Corte Aqui - - -"); c.setDash([]); desenhar_via(13*cm)
+    c.save(); buffer.seek(0); return buffer
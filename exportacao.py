@@ -0,0 +1,231 @@
+import os
+import time
+import glob
+import shutil
+import weakref
+import zipfile
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+import documentos
+import metricas
+from ingestao import obter_pool, descartar_pool
+
+FORMATO_ZIP = "zip"   # um DOCX por fatura + Protocolo.pdf
+FORMATO_PDF = "pdf"   # protocolo + faturas num PDF só (faturas desenhadas direto em PDF, sem DOCX)
+
+# Impressora: FUSEX_IMPRESSORA escolhe a fila do CUPS (lp -d); com FUSEX_IMPRESSORA_DIR
+# cada trabalho vira uma pasta ali em vez de ir para o lp (impressora de teste)
+IMPRESSORA = os.environ.get("FUSEX_IMPRESSORA", "")
+DIR_IMPRESSORA = os.environ.get("FUSEX_IMPRESSORA_DIR", "")
+
+STATUS_FILA = "⏳ Na fila"
+STATUS_OK = "✅ Gerada"
+STATUS_CANCELADO = "⛔ Cancelado"
+
+PREFIXO_PASTA = "fusex_export_"
+IDADE_MAX_PASTA = 2 * 3600  # pastas de exportação (dados de pacientes) esquecidas por sessões que caíram
+
+# ==========================================
+# 🖨 IMPRESSÃO
+# ==========================================
+
+def imprimir_arquivos(caminhos, titulo="Corpore"):
+    """Manda todos os arquivos num único trabalho de impressão. Devolve (ok, mensagem)."""
+    try:
+        if DIR_IMPRESSORA:
+            destino = os.path.join(DIR_IMPRESSORA, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{titulo}")
+            os.makedirs(destino, exist_ok=True)
+            for c in caminhos: shutil.copy(c, destino)
+            return True, f"Trabalho '{titulo}' ({len(caminhos)} arquivo(s)) enviado para {destino}"
+
+        # Comando para Windows (não junta arquivos num trabalho)
+        if os.name == 'nt':
+            for c in caminhos: os.startfile(c, "print")
+            return True, "Enviado para a impressora padrão (Windows)!"
+
+        # Comando para Linux/Mac (CUPS): um lp só, com todos os arquivos
+        cmd = ["lp", "-t", titulo] + (["-d", IMPRESSORA] if IMPRESSORA else []) + list(caminhos)
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+        return True, f"Enviado para a impressora (Linux/Mac): 1 trabalho com {len(caminhos)} arquivo(s)!"
+    except Exception as e:
+        return False, f"Erro na impressão direta: {str(e)}"
+
+# ==========================================
+# ⚙️ GERAÇÃO (roda nos processos do pool)
+# ==========================================
+
+def renderizar_fatura(fatura_ref, registros, meta, formato):
+    """(bytes do documento, segundos). O modelo DOCX compilado fica em cache em cada processo."""
+    t0 = time.perf_counter()
+    df_tabela = pd.DataFrame(registros)
+    tags = documentos.tags_fatura(fatura_ref, meta, df_tabela["VALOR (R$)"].sum() if not df_tabela.empty else 0.0)
+    if formato == FORMATO_PDF: conteudo = documentos.gerar_pdf_fatura(df_tabela, tags, meta['usuario'])
+    else: conteudo = documentos.template_padrao().gerar_bytes(df_tabela, tags, meta['usuario'])
+    return conteudo, time.perf_counter() - t0
+
+# ==========================================
+# 🗂 LOTE DE EXPORTAÇÃO
+# ==========================================
+
+def limpar_pastas_antigas(idade=IDADE_MAX_PASTA):
+    """Apaga as pastas de exportação sem uso há mais de `idade` segundos."""
+    limite = time.time() - idade
+    for pasta in glob.glob(os.path.join(tempfile.gettempdir(), PREFIXO_PASTA + "*")):
+        try:
+            if os.path.getmtime(pasta) < limite: shutil.rmtree(pasta, ignore_errors=True)
+        except OSError: pass
+
+class ExportacaoLote:
+    """Gera várias faturas em paralelo e junta tudo num ZIP ou num PDF só.
+
+    `faturas` é uma lista de (fatura_ref, df_tabela, meta), como devolvido por
+    documentos.tabela_fatura. Cada fatura é gravada em disco assim que fica
+    pronta (no ZIP, na hora), então a memória não cresce com o tamanho do lote.
+    `protocolo` = (faturas, qtd_guias, total) coloca o protocolo na frente.
+    A pasta temporária some em descartar(), quando a sessão solta o objeto ou
+    o processo termina; a de sessões que caíram, na próxima exportação.
+    """
+
+    def __init__(self, faturas, formato=FORMATO_ZIP, protocolo=None):
+        self.formato = formato
+        self.protocolo = protocolo
+        self._faturas = [(ref, df.to_dict("records"), meta) for ref, df, meta in faturas]
+        self.itens = [{"FATURA": ref, "STATUS": STATUS_FILA, "GUIAS": len(df), "TEMPO (s)": None} for ref, df, _ in faturas]
+        self.geradas = 0
+        self.concluido = False
+        self.arquivo = None
+        limpar_pastas_antigas()
+        self.pasta = tempfile.mkdtemp(prefix=PREFIXO_PASTA)
+        self._remover_pasta = weakref.finalize(self, shutil.rmtree, self.pasta, True)
+        self._partes = {}
+        self._lock = threading.Lock()
+        self._cancelar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, daemon=True)
+
+    @property
+    def nome_arquivo(self):
+        return "Faturas.pdf" if self.formato == FORMATO_PDF else "Faturas.zip"
+
+    @property
+    def mime(self):
+        return "application/pdf" if self.formato == FORMATO_PDF else "application/zip"
+
+    def iniciar(self):
+        self._thread.start()
+        return self
+
+    def cancelar(self):
+        self._cancelar.set()
+
+    @property
+    def cancelado(self):
+        return self._cancelar.is_set()
+
+    def progresso(self):
+        if not self.itens: return 1.0
+        return sum(1 for i in self.itens if i["STATUS"] != STATUS_FILA) / len(self.itens)
+
+    def status(self):
+        with self._lock:
+            return [dict(i) for i in self.itens]
+
+    def ler(self):
+        with open(self.arquivo, "rb") as f: return f.read()
+
+    def arquivo_impressao(self):
+        """Sempre um PDF (protocolo + faturas): no ZIP, as faturas são desenhadas em PDF na hora."""
+        if self.formato == FORMATO_PDF: return self.arquivo
+        destino = os.path.join(self.pasta, "Impressao.pdf")
+        if not os.path.exists(destino):
+            partes = []
+            for idx in sorted(self._partes):
+                ref, registros, meta = self._faturas[idx]
+                caminho = os.path.join(self.pasta, f"{idx:04d}_Fatura_{ref}.pdf")
+                with open(caminho, "wb") as f: f.write(renderizar_fatura(ref, registros, meta, FORMATO_PDF)[0])
+                partes.append(caminho)
+            self._juntar_pdf(destino, partes)
+        return destino
+
+    def imprimir(self):
+        if not self.arquivo: return False, "Nada para imprimir."
+        return imprimir_arquivos([self.arquivo_impressao()], f"Faturas ({len(self._partes)})")
+
+    def descartar(self):
+        self.cancelar()
+        self._faturas = []
+        self._remover_pasta()
+
+    def _marcar(self, idx, status, segundos=None):
+        with self._lock:
+            self.itens[idx]["STATUS"] = status
+            if segundos is not None: self.itens[idx]["TEMPO (s)"] = round(segundos, 2)
+
+    def _submeter(self, pendentes, idx):
+        ref, registros, meta = self._faturas[idx]
+        try:
+            fut = obter_pool("exportacao").submit(renderizar_fatura, ref, registros, meta, self.formato)
+        except BrokenProcessPool:
+            descartar_pool("exportacao")
+            fut = obter_pool("exportacao").submit(renderizar_fatura, ref, registros, meta, self.formato)
+        pendentes[fut] = idx
+
+    def _gravar_parte(self, idx, conteudo, zf):
+        ref = str(self._faturas[idx][0])
+        if zf is not None:
+            zf.writestr(f"Fatura_{ref}.docx", conteudo); self._partes[idx] = None; return
+        caminho = os.path.join(self.pasta, f"{idx:04d}_Fatura_{ref}.pdf")
+        with open(caminho, "wb") as f: f.write(conteudo)
+        self._partes[idx] = caminho
+
+    def _juntar_pdf(self, destino, partes):
+        import fitz
+        saida = fitz.open()
+        caminhos = ([os.path.join(self.pasta, "Protocolo.pdf")] if self.protocolo else []) + partes
+        for c in caminhos:
+            with fitz.open(c) as parte: saida.insert_pdf(parte)
+        saida.save(destino); saida.close()
+
+    def _executar(self):
+        pendentes = {}
+        destino = os.path.join(self.pasta, self.nome_arquivo)
+        zf = None
+        try:
+            for idx in range(len(self._faturas)): self._submeter(pendentes, idx)
+
+            if self.protocolo:
+                buf = documentos.gerar_pdf_protocolo(*self.protocolo)
+                with open(os.path.join(self.pasta, "Protocolo.pdf"), "wb") as f: f.write(buf.getvalue())
+            if self.formato == FORMATO_ZIP:
+                zf = zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED)
+                if self.protocolo: zf.write(os.path.join(self.pasta, "Protocolo.pdf"), "Protocolo.pdf")
+
+            while pendentes and not self._cancelar.is_set():
+                feitos, _ = wait(pendentes, timeout=0.5, return_when=FIRST_COMPLETED)
+                for fut in feitos:
+                    idx = pendentes.pop(fut)
+                    try: conteudo, segundos = fut.result()
+                    except BrokenProcessPool:
+                        descartar_pool("exportacao"); self._marcar(idx, "❌ Erro: processo de geração interrompido"); continue
+                    except Exception as e:
+                        self._marcar(idx, f"❌ Erro: {str(e)}"); continue
+                    metricas.registrar(f"exportacao.{self.formato}", segundos, guias=self.itens[idx]["GUIAS"])
+                    self._gravar_parte(idx, conteudo, zf)
+                    self.geradas += 1
+                    self._marcar(idx, STATUS_OK, segundos)
+
+            if zf is not None: zf.close(); zf = None
+            if not self.cancelado and self._partes:
+                if self.formato == FORMATO_PDF: self._juntar_pdf(destino, [self._partes[i] for i in sorted(self._partes)])
+                self.arquivo = destino
+        except Exception as e:
+            for idx in pendentes.values(): self._marcar(idx, f"❌ Erro: {str(e)}")
+            pendentes = {}
+        finally:
+            for fut, idx in pendentes.items():
+                fut.cancel(); self._marcar(idx, STATUS_CANCELADO)
+            if zf is not None: zf.close()
+            self.concluido = True
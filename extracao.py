@@ -0,0 +1,245 @@
+import os
+import re
+import gc
+import sys
+import math
+import time
+import sqlite3
+from io import BytesIO
+import servico_ocr
+from cache_extracao import obter_cache, sha256_bytes
+from campos import dados_vazios, extrair_campos_com_confianca
+
+# Abaixo disso consideramos que o PDF não tem camada de texto (guia escaneada)
+MIN_CARACTERES_TEXTO = 20
+
+# Versões do cache de extração: aumente VERSAO_TEXTO ao mudar a leitura do PDF/OCR
+# e VERSAO_CAMPOS ao mudar as regex de extrair_campos (reaproveita o texto já lido)
+VERSAO_TEXTO = "2"
+VERSAO_CAMPOS = "3"
+
+# Faixas da página (x0, y0, x1, y1 em frações) enviadas ao OCR nas guias escaneadas:
+# o cabeçalho traz Nº da guia, paciente e Idt/Prec CP; o rodapé traz o Total.
+REGIOES_OCR = [(0.0, 0.0, 1.0, 0.40), (0.0, 0.65, 1.0, 1.0)]
+# Se as faixas não trouxerem o Nº da guia e o Total, a página inteira vai para o OCR
+RE_ANCORA_GUIA = re.compile(r'(?:Nr|Numero)[:\.]?\s*(\d+)', re.IGNORECASE)
+RE_ANCORA_TOTAL = re.compile(r'Total\s*:?\s*([\d\.,]+)', re.IGNORECASE)
+
+# Rasterização para o OCR: tons de cinza, direto dos pixels do PyMuPDF (sem PNG).
+# A resolução cai para imagens grandes (limite de pixels) e quando o processo passa
+# do orçamento de memória; abaixo de DPI_MIN o easyOCR começa a errar dígitos.
+# pdfplumber entra no primeiro PDF; PyMuPDF e numpy só na primeira página escaneada.
+DPI_OCR = 150
+DPI_MIN = 100
+MAX_PIXELS_OCR = int(os.environ.get("FUSEX_OCR_MAX_PIXELS", str(4_000_000)))
+ORCAMENTO_MB = float(os.environ.get("FUSEX_OCR_MEMORIA_MB", "1024"))
+
+# ==========================================
+# 🔍 OCR / PDF
+# ==========================================
+
+_reader = None
+
+def load_ocr_reader():
+    """Modelo do próprio processo, só quando o serviço de OCR da máquina não está no ar."""
+    global _reader
+    if _reader is None:
+        import easyocr
+        _reader = easyocr.Reader(['pt'], gpu=False, quantize=True)
+    return _reader
+
+def ler_imagens(imagens):
+    """OCR de várias imagens: pelo serviço da máquina (sobe na 1ª página escaneada) ou, sem ele, localmente."""
+    if servico_ocr.disponivel() or servico_ocr.subir_e_esperar():
+        try: return servico_ocr.ler_imagens(imagens)
+        except Exception: pass  # serviço caiu no meio do pedido: lê aqui mesmo
+    reader = load_ocr_reader()
+    return ["\n".join(reader.readtext(img, detail=0, paragraph=True)) for img in imagens]
+
+# --- MEMÓRIA ---
+def rss_mb():
+    """Memória residente atual do processo (MB); pico do processo onde não há /proc."""
+    try:
+        with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return pico / 2**20 if sys.platform == "darwin" else pico / 1024
+        except ImportError:
+            return 0.0
+
+def _dpi_para(rect):
+    """DPI da rasterização: DPI_OCR, menos se a imagem passar de MAX_PIXELS_OCR ou o processo do orçamento."""
+    polegadas2 = (rect.width / 72) * (rect.height / 72)
+    dpi = min(DPI_OCR, math.sqrt(MAX_PIXELS_OCR / polegadas2)) if polegadas2 > 0 else DPI_OCR
+    if ORCAMENTO_MB > 0 and rss_mb() > ORCAMENTO_MB:
+        gc.collect()  # só quando estourou o orçamento, não a cada página
+        if rss_mb() > ORCAMENTO_MB: dpi = DPI_MIN
+    return max(DPI_MIN, int(dpi))
+
+def _renderizar(pagina, clip=None):
+    """Imagem em tons de cinza (array uint8 altura x largura) direto dos pixels do PyMuPDF."""
+    import numpy as np
+    import fitz  # PyMuPDF
+    dpi = _dpi_para(clip if clip is not None else pagina.rect)
+    pix = pagina.get_pixmap(dpi=dpi, clip=clip, colorspace=fitz.csGRAY, alpha=False)
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    del pix
+    return img, dpi
+
+def _ocr_pagina(pagina):
+    img, dpi = _renderizar(pagina)
+    return ler_imagens([img])[0], dpi
+
+def _ocr_regioes(pagina):
+    import fitz
+    r = pagina.rect; imagens = []; dpis = []
+    for x0, y0, x1, y1 in REGIOES_OCR:
+        clip = fitz.Rect(r.x0 + x0 * r.width, r.y0 + y0 * r.height, r.x0 + x1 * r.width, r.y0 + y1 * r.height)
+        img, dpi = _renderizar(pagina, clip); imagens.append(img); dpis.append(dpi)
+    # As faixas da página vão num pedido só (o serviço pode ler juntas)
+    return "\n".join(ler_imagens(imagens)), min(dpis)
+
+def extrair_texto_paginas(arquivo_bytes, fazer_ocr=True, relatorio=None):
+    """Extrai o texto página a página: mantém a camada de texto de quem tem e só manda
+    para o OCR as páginas que são só imagem. Devolve (textos por página, índices das páginas OCR).
+
+    Com fazer_ocr=False as páginas sem texto ficam vazias (usado pela fila de texto do lote).
+    Se `relatorio` for uma lista, recebe {"pagina", "fonte", "segundos", "dpi", "rss_mb"} de
+    cada página (rss_mb = memória do processo ao terminar a página).
+    """
+    import pdfplumber
+    textos = []; sem_texto = []; tempos = []; memoria = []
+    with pdfplumber.open(arquivo_bytes) as pdf:
+        for i, page in enumerate(pdf.pages):
+            t0 = time.perf_counter()
+            t = page.extract_text() or ""
+            page.close()  # solta os objetos da página: PDF de 50 páginas não acumula tudo
+            textos.append(t); tempos.append(time.perf_counter() - t0); memoria.append(rss_mb())
+            if len(t.strip()) < MIN_CARACTERES_TEXTO: sem_texto.append(i)
+    fontes = ["texto"] * len(textos); dpis = [None] * len(textos)
+
+    if sem_texto and fazer_ocr:
+        # Uma página por vez: renderiza, manda para o OCR e descarta antes da próxima
+        # getvalue() de um BytesIO criado a partir de bytes não copia o PDF (read() copiava)
+        import fitz
+        doc = fitz.open(stream=arquivo_bytes.getvalue(), filetype="pdf")
+        for i in sem_texto:
+            t0 = time.perf_counter()
+            textos[i], dpis[i] = _ocr_regioes(doc[i]); fontes[i] = "ocr (regiões)"
+            tempos[i] += time.perf_counter() - t0; memoria[i] = rss_mb()
+        # Âncoras conferidas no documento todo: o Nº costuma estar na 1ª página e o Total na última
+        texto_doc = "\n".join(textos)
+        if not (RE_ANCORA_GUIA.search(texto_doc) and RE_ANCORA_TOTAL.search(texto_doc)):
+            for i in sem_texto:
+                t0 = time.perf_counter()
+                textos[i], dpis[i] = _ocr_pagina(doc[i]); fontes[i] = "ocr (página inteira)"
+                tempos[i] += time.perf_counter() - t0; memoria[i] = max(memoria[i], rss_mb())
+        doc.close()
+
+    if relatorio is not None:
+        for i, (fonte, seg) in enumerate(zip(fontes, tempos)):
+            relatorio.append({"pagina": i + 1, "fonte": fonte if (fazer_ocr or i not in sem_texto) else "sem texto",
+                              "segundos": round(seg, 3), "dpi": dpis[i], "rss_mb": round(memoria[i], 1)})
+    return textos, (sem_texto if fazer_ocr else [])
+
+def juntar_paginas(textos):
+    return "".join(t + "\n" for t in textos if t)
+
+def resumo_paginas(relatorio):
+    """Ex.: 'p1 texto 0.04s | p2 ocr (regiões) 150dpi 3.10s'."""
+    return " | ".join(f"p{r['pagina']} {r['fonte']}{' %ddpi' % r['dpi'] if r.get('dpi') else ''} {r['segundos']:.2f}s" for r in relatorio)
+
+def pico_memoria(relatorio):
+    """Maior memória do processo (MB) durante a leitura do PDF."""
+    return max((r.get("rss_mb") or 0.0 for r in relatorio), default=None)
+
+def ler_bytes(arquivo):
+    if isinstance(arquivo, (bytes, bytearray)): return bytes(arquivo)
+    if hasattr(arquivo, "getvalue"): return arquivo.getvalue()
+    arquivo.seek(0); return arquivo.read()
+
+# --- CACHE (falha no cache nunca derruba a extração) ---
+def _cache_texto(sha):
+    cache = obter_cache()
+    if cache is None: return None
+    try: return cache.obter_texto(sha, VERSAO_TEXTO)
+    except sqlite3.Error: return None
+
+def _cache_dados(sha):
+    cache = obter_cache()
+    if cache is None: return None
+    try: return cache.obter_dados(sha, VERSAO_CAMPOS)
+    except sqlite3.Error: return None
+
+def _guardar_cache(sha, texto=None, usou_ocr=False, dados=None):
+    cache = obter_cache()
+    if cache is None: return
+    try:
+        if texto is not None: cache.salvar_texto(sha, VERSAO_TEXTO, texto, usou_ocr)
+        if dados is not None: cache.salvar_dados(sha, VERSAO_CAMPOS, dados)
+    except sqlite3.Error: pass
+
+def extrair_texto_hibrido(arquivo_bytes, relatorio=None):
+    conteudo = ler_bytes(arquivo_bytes); sha = sha256_bytes(conteudo)
+    em_cache = _cache_texto(sha)
+    if em_cache is not None: return em_cache
+
+    try: textos, paginas_ocr = extrair_texto_paginas(BytesIO(conteudo), relatorio=relatorio)
+    except Exception as e: return f"ERRO_OCR: {str(e)}", False
+    texto_final = juntar_paginas(textos); usou_ocr = bool(paginas_ocr)
+    _guardar_cache(sha, texto_final, usou_ocr)
+    return texto_final, usou_ocr
+
+def extrair_campos(text):
+    """Aplica os padrões do layout da guia (campos.LAYOUTS) sobre o texto já extraído."""
+    return extrair_campos_com_confianca(text)[0]
+
+def _parsear(sha, texto, usou_ocr=None):
+    """Extrai os campos e guarda no cache; usou_ocr=None quando o texto já veio do cache."""
+    dados, confianca = extrair_campos_com_confianca(texto)
+    if usou_ocr is None: _guardar_cache(sha, dados={"dados": dados, "confianca": confianca})
+    else: _guardar_cache(sha, texto, usou_ocr, {"dados": dados, "confianca": confianca})
+    return dados, confianca
+
+def extrair_dados_pdf(arquivo):
+    dados = dados_vazios()
+    try:
+        conteudo = ler_bytes(arquivo); sha = sha256_bytes(conteudo)
+        em_cache = _cache_dados(sha)
+        if em_cache is not None: return em_cache["dados"]
+        text, _ = extrair_texto_hibrido(conteudo)
+        if text.startswith("ERRO_OCR"): return extrair_campos(text)
+        dados, _ = _parsear(sha, text)
+    except: pass
+    return dados
+
+# ==========================================
+# ⚙️ WORKERS DO LOTE (rodam em processos separados)
+# ==========================================
+
+def processar_camada_texto(conteudo):
+    """Fila de texto: devolve (dados, origem, relatório por página, confiança por campo), ou
+    None se alguma página não tem camada de texto e o PDF precisa ir para a fila de OCR."""
+    sha = sha256_bytes(conteudo)
+    em_cache = _cache_dados(sha)
+    if em_cache is not None: return em_cache["dados"], "cache", [], em_cache["confianca"]
+    em_cache = _cache_texto(sha)
+    if em_cache is not None:
+        dados, confianca = _parsear(sha, em_cache[0])
+        return dados, "cache", [], confianca
+
+    relatorio = []
+    textos, _ = extrair_texto_paginas(BytesIO(conteudo), fazer_ocr=False, relatorio=relatorio)
+    if any(r["fonte"] == "sem texto" for r in relatorio): return None
+    dados, confianca = _parsear(sha, juntar_paginas(textos), False)
+    return dados, "texto", relatorio, confianca
+
+def processar_ocr(conteudo):
+    """Fila de OCR: PDFs com páginas só imagem (as páginas com texto não passam pelo OCR)."""
+    sha = sha256_bytes(conteudo)
+    relatorio = []
+    textos, _ = extrair_texto_paginas(BytesIO(conteudo), relatorio=relatorio)
+    dados, confianca = _parsear(sha, juntar_paginas(textos), True)
+    return dados, "ocr", relatorio, confianca
@@ -0,0 +1,72 @@
+"""Faturamento sem Streamlit: ler guias, gravar faturas e gerar os documentos.
+
+Usado pelas telas do fusex2.py e pelo fusex_cli.py. Cada função recebe o
+backend (armazenamento.criar_armazenamento) em vez de ler a sessão; cache
+de tela e mensagens ficam com quem chama.
+"""
+import os
+import pandas as pd
+from armazenamento import montar_registros, avisos_duplicidade
+import documentos
+
+COLUNAS_TABELA = ["NOME DO PACIENTE", "NR DA GUIA", "DATA ATEND.", "PREC-CP/SIAPE", "CÓDIGO PROCED.", "VALOR (R$)"]
+
+# ==========================================
+# 📥 LEITURA DAS GUIAS
+# ==========================================
+
+def ler_pasta(pasta):
+    """(nome, bytes) de cada PDF da pasta, em ordem alfabética (a ordem da fatura)."""
+    nomes = sorted(n for n in os.listdir(pasta) if n.lower().endswith(".pdf") and os.path.isfile(os.path.join(pasta, n)))
+    arquivos = []
+    for nome in nomes:
+        with open(os.path.join(pasta, nome), "rb") as f: arquivos.append((nome, f.read()))
+    return arquivos
+
+def guias_do_lote(lote):
+    """Guias lidas por um LoteIngestao já concluído, na ordem dos arquivos (não na de término)."""
+    ordem = {}
+    for i, item in enumerate(lote.status()):
+        if item["NR DA GUIA"]: ordem.setdefault(item["NR DA GUIA"], i)
+    guias = sorted(lote.coletar_novos(), key=lambda g: ordem.get(g["NR DA GUIA"], len(ordem)))
+    return pd.DataFrame(guias, columns=COLUNAS_TABELA)
+
+def com_avisos_duplicidade(consulta, df, fatura_atual=None):
+    """Cópia do df com a coluna DUPLICIDADE: uma consulta indexada (localizar_guias) por tabela."""
+    nrs = df["NR DA GUIA"].tolist() if "NR DA GUIA" in df.columns else []
+    try: achadas = consulta.localizar_guias(nrs)
+    except Exception: achadas = {}
+    return df.assign(DUPLICIDADE=avisos_duplicidade(nrs, achadas, fatura_atual))
+
+# ==========================================
+# 💾 GRAVAÇÃO
+# ==========================================
+
+def salvar_fatura(arm, df_novo, meta):
+    """Grava as guias (colunas do editor) e devolve a fatura_ref. Sem meta['fatura'], o número
+    sai do sequencial da competência no banco (ArmazenamentoLocal.nova_fatura)."""
+    registros = montar_registros(df_novo, meta['fatura'] or "", meta)
+    if meta['fatura']:
+        arm.anexar(registros); return meta['fatura']
+    if not hasattr(arm, "nova_fatura"): raise ValueError("Este backend não numera faturas: informe o número da fatura")
+    return arm.nova_fatura(meta['ano'], meta['mes'], registros)
+
+def atualizar_fatura(arm, fatura_ref, df_editado, meta, edicao=None):
+    """Com `edicao` (versão e linhas como foram abertas), grava só o que mudou; devolve os conflitos."""
+    registros = montar_registros(df_editado, fatura_ref, meta)
+    if edicao is None:
+        arm.atualizar_fatura(fatura_ref, registros); return []
+    return arm.editar_fatura(fatura_ref, edicao['versao'], edicao['base'].to_dict("records"), registros)[1]
+
+# ==========================================
+# 📄 DOCUMENTOS
+# ==========================================
+
+def documentos_fatura(fatura_ref, df_fat, formatos=("docx", "pdf")):
+    """{extensão: bytes} da fatura inteira como está gravada (df_fat = linhas da base, de guias_das_faturas):
+    ao acrescentar guias a uma fatura existente, o documento sai com todas, não só as novas."""
+    df_tabela, meta = documentos.tabela_fatura(df_fat)
+    tags = documentos.tags_fatura(fatura_ref, meta, df_tabela["VALOR (R$)"].sum() if not df_tabela.empty else 0.0)
+    gerar = {"docx": lambda: documentos.template_padrao().gerar_bytes(df_tabela, tags, meta['usuario']),
+             "pdf": lambda: documentos.gerar_pdf_fatura_base(fatura_ref, df_fat)}
+    return {ext: gerar[ext]() for ext in formatos}
@@ -1,55 +1,62 @@
+import time
+_t0_script = time.perf_counter()  # início deste rerun; o 1º do processo mede também os imports
 import streamlit as st
-from streamlit_gsheets import GSheetsConnection
-import pandas as pd
-from docx import Document
-from docx.shared import Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from num2words import num2words
 import os
 import sys
-import subprocess
 import tempfile
 from datetime import datetime
-import pytz 
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import cm
 from io import BytesIO
-import re
-import pdfplumber
-import fitz  # PyMuPDF
-import easyocr 
-import numpy as np
-import gc
-import bcrypt
-import time
+import servico_ocr
+import metricas
+# pandas, gspread, PyMuPDF, python-docx, reportlab, easyOCR... são importados no primeiro uso
+# de cada funcionalidade (dentro das funções): a tela de login não carrega nenhum deles.
 
 # --- CONFIGURAÇÃO INICIAL ---
 st.set_page_config(page_title="Corpore - Acesso Seguro", layout="wide", page_icon="🏥")
 
-# --- CONEXÃO GOOGLE SHEETS ---
-conn = st.connection("gsheets", type=GSheetsConnection)
+# --- ARMAZENAMENTO (SQLite local + GOOGLE SHEETS) ---
+@st.cache_resource
+def armazenamento():
+    """Backend dos dados, compartilhado entre as sessões (FUSEX_BACKEND: local+sheets, local ou sheets).
+    Criado no primeiro acesso aos dados (a 1ª tentativa de login), não ao abrir a página."""
+    from armazenamento import criar_armazenamento, MODO_ARMAZENAMENTO
+    conn = None
+    if MODO_ARMAZENAMENTO != "local":
+        from streamlit_gsheets import GSheetsConnection
+        conn = st.connection("gsheets", type=GSheetsConnection)
+    return criar_armazenamento(MODO_ARMAZENAMENTO, conn)
+
+@st.cache_resource
+def servico_ocr_da_maquina():
+    """Com FUSEX_OCR_NO_BOOT=1 o serviço de OCR sobe junto com o servidor; sem isso, na 1ª página escaneada."""
+    return servico_ocr.iniciar_em_segundo_plano()
+
+@st.cache_resource
+def cache_guias():
+    """Guias lidas uma vez para todas as abas/sessões; invalidada a cada gravação."""
+    from armazenamento import CacheGuias
+    return CacheGuias(lambda: armazenamento().carregar())
+
+@st.cache_resource
+def cache_artefatos():
+    """DOCX já gerados (2ª via), compartilhados entre as sessões."""
+    from documentos import CacheArtefatos
+    return CacheArtefatos()
+
+@st.cache_resource
+def diretorio_usuarios():
+    """Usuários em memória para todas as sessões: login não relê a aba 'usuarios' a cada tentativa."""
+    from usuarios import DiretorioUsuarios
+    return DiretorioUsuarios(lambda: armazenamento().carregar_usuarios(),
+                             lambda registro: armazenamento().anexar_usuario(registro))
 
 # ==========================================
 # 🛠 FUNÇÕES UTILITÁRIAS
 # ==========================================
 
-def limpar_data_sem_ano(texto):
-    """Remove o ano de datas, mantendo dd/mm ou intervalos."""
-    if pd.isna(texto): return ""
-    texto = str(texto)
-    texto = re.sub(r'/\d{4}', '', texto)
-    texto = re.sub(r'/\d{2}(?!\d)', '', texto)
-    return texto.strip()
-
-def formatar_moeda_br(valor):
-    try:
-        return f"R$ {float(valor):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-    except:
-        return "R$ 0,00"
-
-def enviar_impressao_direta(buffer_arquivo, nome_arquivo="temp_print.docx"):
+def enviar_impressao_direta(buffer_arquivo, nome_arquivo="temp_print.pdf"):
     """Salva o arquivo temporariamente e manda imprimir via terminal do SO"""
+    from exportacao import imprimir_arquivos
     try:
         temp_dir = tempfile.gettempdir()
         caminho_temp = os.path.join(temp_dir, nome_arquivo)
@@ -57,61 +64,25 @@ def enviar_impressao_direta(buffer_arquivo, nome_arquivo="temp_print.docx"):
         # Salva o buffer em disco
         with open(caminho_temp, "wb") as f:
             f.write(buffer_arquivo.getvalue())
-            
-        # Comando para Windows
-        if os.name == 'nt':
-            os.startfile(caminho_temp, "print")
-            return True, "Enviado para a impressora padrão (Windows)!"
-        
-        # Comando para Linux/Mac (CUPS)
-        else:
-            subprocess.run(["lp", caminho_temp], check=True)
-            return True, "Enviado para a impressora (Linux/Mac)!"
-            
     except Exception as e:
         return False, f"Erro na impressão direta: {str(e)}"
+    return imprimir_arquivos([caminho_temp], nome_arquivo)
 
 # ==========================================
 # 🔐 SEGURANÇA E USUÁRIOS
 # ==========================================
 
-def carregar_usuarios():
-    try:
-        df = conn.read(worksheet="usuarios", ttl=0)
-        return df
-    except:
-        return pd.DataFrame(columns=["username", "name", "password_hash", "created_at"])
-
 def salvar_novo_usuario(username, name, password):
-    df_users = carregar_usuarios()
-    if not df_users.empty and username in df_users['username'].values:
-        return False, "Usuário já existe!"
-    
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-    novo_usuario = pd.DataFrame([{
-        "username": username, "name": name, "password_hash": hashed,
-        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }])
-    
-    df_final = pd.concat([df_users, novo_usuario], ignore_index=True)
     try:
-        conn.update(worksheet="usuarios", data=df_final)
-        return True, "Usuário criado com sucesso!"
+        return diretorio_usuarios().cadastrar(username, name, password)
     except Exception as e:
-        return False, f"Erro ao salvar: {e}"
+        return False, f"Erro ao consultar usuários: {e}"
 
 def autenticar_usuario(username, password):
-    df_users = carregar_usuarios()
-    if df_users.empty: return False, "Nenhum usuário cadastrado."
-    
-    user_row = df_users[df_users['username'] == username]
-    if user_row.empty: return False, "Usuário não encontrado."
-    
-    stored_hash = user_row.iloc[0]['password_hash']
-    if bcrypt.checkpw(password.encode('utf-8'), stored_hash.encode('utf-8')):
-        return True, user_row.iloc[0]['name']
-    else:
-        return False, "Senha incorreta."
+    try:
+        return diretorio_usuarios().autenticar(username, password)
+    except Exception as e:
+        return False, f"Erro ao consultar usuários: {e}"
 
 def tela_login():
     st.markdown("## 🏥 Corpore Centro de Saúde")
@@ -127,8 +98,8 @@ def tela_login():
                 else:
                     sucesso, msg = autenticar_usuario(user, senha)
                     if sucesso:
-                        st.session_state['logado'] = True; st.session_state['usuario_nome'] = msg
-                        st.success("Login realizado!"); time.sleep(1); st.rerun()
+                        st.session_state['logado'] = True; st.session_state['usuario_nome'] = msg; st.session_state['usuario'] = user
+                        st.rerun()
                     else: st.error(msg)
     
     with tab2:
@@ -148,245 +119,165 @@ def tela_login():
                     else: st.error(msg)
 
 def logout():
-    st.session_state['logado'] = False; st.session_state['usuario_nome'] = ""; st.rerun()
+    st.session_state['logado'] = False; st.session_state['usuario_nome'] = ""; st.session_state['usuario'] = ""; st.rerun()
 
 # ==========================================
 # 🏥 SISTEMA PRINCIPAL
 # ==========================================
 
 def sistema_principal():
+    # Só depois do login: a tela de login não paga por estes imports
+    import pandas as pd
+    from campos import limpar_data_sem_ano
+    from documentos import gerar_doc_word, gerar_pdf_protocolo, gerar_pdf_fatura, gerar_pdf_fatura_base, template_padrao, tabela_fatura, tags_fatura, formatar_moeda_br, chave_conteudo, MIME_DOCX, MIME_PDF
+    from armazenamento import ConsultaMemoria
+    import faturamento
+
+    @st.fragment(run_every=5)
+    def painel_sincronizacao(sinc):
+        """Fila do Sheets (gravações já feitas no banco local), atualizada sozinha enquanto o usuário trabalha."""
+        pendencias = sinc.pendencias()
+        if not pendencias:
+            st.caption("☁️ Sheets sincronizado"); return
+        if sinc.ultimo_erro: st.warning(f"☁️ Sheets com erro, {len(pendencias)} fatura(s) aguardando: {sinc.ultimo_erro}")
+        else: st.caption(f"☁️ Enviando {len(pendencias)} fatura(s) para o Sheets...")
+        with st.expander("Fila do Sheets"):
+            agora = time.time()
+            st.dataframe(pd.DataFrame([{"FATURA": p["fatura_ref"], "TENTATIVAS": p["tentativas"],
+                                        "PRÓXIMA EM (s)": max(0, round(p["proxima"] - agora)), "ERRO": p["erro"] or ""} for p in pendencias]), hide_index=True)
+            if st.button("🔄 Tentar agora"): sinc.sincronizar_agora()
+
     with st.sidebar:
         st.write(f"Olá, **{st.session_state['usuario_nome']}**! 👋")
         if st.button("Sair / Logout"): logout()
         st.divider()
+        sinc = getattr(armazenamento(), "sincronizador", None)
+        if sinc is not None: painel_sincronizacao(sinc)
+        estado_ocr = servico_ocr.estado_servico()
+        if estado_ocr and estado_ocr["latencia_p50"] is not None:
+            st.caption(f"🔍 OCR: fila {estado_ocr['fila']} | p50 {estado_ocr['latencia_p50']}s | p95 {estado_ocr['latencia_p95']}s por página")
+        if metricas.eh_admin(st.session_state.get('usuario')):
+            with st.expander("⏱ Desempenho (este servidor)"):
+                st.dataframe(pd.DataFrame(metricas.resumo()), hide_index=True)
+                st.caption(" | ".join(f"{k}: {v}" for k, v in metricas.contadores().items()) or "Sem contadores ainda.")
+                st.caption(f"Log: {metricas.CAMINHO_LOG or 'desligado'}")
+                st.caption("🚀 Início do processo: " + (" | ".join(f"{k}: {v['segundos']}s (carregados: {', '.join(v['modulos']) or 'nenhum pesado'})"
+                                                               for k, v in metricas.inicio().items()) or "sem medição"))
 
     st.title("🏥 Gestão de Faturas e Guias")
 
     # --- BANCO DE DADOS (SHEETS) ---
-    def carregar_dados_sheets():
-        try:
-            df = conn.read(worksheet="guias", ttl=5)
-            if not df.empty and 'fatura_ref' in df.columns:
-                df['fatura_ref'] = df['fatura_ref'].astype(str).str.replace("'", "", regex=False)
-            return df
-        except:
-            return pd.DataFrame(columns=["fatura_ref", "mes_competencia", "ano_competencia", "tipo_usuario", "servicos_fatura", "paciente_nome", "nr_guia", "prec_cp", "data_atend", "cod_proced", "valor", "data_lancamento"])
+    def consulta():
+        """Consultas indexadas no banco local; só com Sheets, sobre as guias em cache (não alterar no lugar)."""
+        arm = armazenamento()
+        return arm if hasattr(arm, "consultar") else ConsultaMemoria(cache_guias())
+
+    def com_avisos_duplicidade(df, fatura_atual=None):
+        """Cópia do df com a coluna DUPLICIDADE (só leitura no editor)."""
+        return faturamento.com_avisos_duplicidade(consulta(), df, fatura_atual)
+
+    def escolher_fatura(rotulo, chave, container=st):
+        """Busca + lista curta: o navegador só recebe as faturas que batem com a busca."""
+        busca = container.text_input("🔎 Buscar fatura", key=f"busca_{chave}", placeholder="ex.: 11.2")
+        opcoes = consulta().faturas(busca)
+        if not opcoes:
+            container.caption("Nenhuma fatura encontrada."); return None
+        return container.selectbox(rotulo, opcoes, key=chave)
+
+    def navegar_base():
+        """Filtros aplicados no servidor; só a página visível vai para o navegador."""
+        f1, f2, f3 = st.columns(3)
+        filtros = {"paciente": f1.text_input("Paciente", key="f_paciente"),
+                   "nr_guia": f2.text_input("Nº da guia (início)", key="f_nr"),
+                   "prec_cp": f3.text_input("Prec-CP/SIAPE (início)", key="f_prec")}
+        f4, f5, f6, f7 = st.columns(4)
+        filtros["ano"] = f4.number_input("Ano (0 = todos)", 0, 2100, 0, key="f_ano") or None
+        filtros["mes"] = f5.selectbox("Mês", [""] + list(meses.keys()), key="f_mes")
+        filtros["tipo_usuario"] = f6.selectbox("Convênio", ["", "FUSEX", "PASS", "S.CIVIL"], key="f_conv")
+        por_pagina = f7.selectbox("Por página", [25, 50, 100, 200], index=1, key="f_por_pagina")
+
+        pagina = st.session_state.get("f_pagina", 1)
+        pagina_df, total = consulta().consultar(filtros, pagina, por_pagina)
+        paginas = max(1, -(-total // por_pagina))
+        if pagina > paginas:
+            # Filtro novo encolheu o resultado: volta para a primeira página
+            st.session_state["f_pagina"] = pagina = 1
+            pagina_df, total = consulta().consultar(filtros, pagina, por_pagina)
+        st.dataframe(pagina_df, hide_index=True)
+        c_pag, c_info = st.columns([1, 3])
+        c_pag.number_input("Página", 1, paginas, key="f_pagina")
+        c_info.caption(f"{total} guias encontradas · página {pagina} de {paginas}")
+
+    def carregar_agregados():
+        """Cubo do dashboard: mantido pelo banco local a cada escrita; sem ele, calculado uma vez por carga."""
+        agregados = getattr(armazenamento(), "agregados", None)
+        return agregados() if agregados else cache_guias().agregados()
 
     def salvar_no_sheets(df_novo, meta_dados):
-        try: df_existente = conn.read(worksheet="guias", ttl=5)
-        except: df_existente = pd.DataFrame()
-        
-        data_hoje = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        lista_novos = []
-        fatura_ref_safe = f"'{meta_dados['fatura']}"
-
-        for _, row in df_novo.iterrows():
-            try: val = float(row['VALOR (R$)'])
-            except: val = 0.0
-            
-            prec_valor = row.get('PREC-CP/SIAPE', '')
-            if pd.isna(prec_valor): prec_valor = ""
-
-            lista_novos.append({
-                "fatura_ref": fatura_ref_safe,
-                "mes_competencia": meta_dados['mes'],
-                "ano_competencia": meta_dados['ano'],
-                "tipo_usuario": meta_dados['usuario'],
-                "servicos_fatura": meta_dados['servico'],
-                "paciente_nome": row['NOME DO PACIENTE'],
-                "nr_guia": row['NR DA GUIA'],
-                "prec_cp": str(prec_valor),
-                "data_atend": limpar_data_sem_ano(row['DATA ATEND.']), 
-                "cod_proced": row['CÓDIGO PROCED.'],
-                "valor": val,
-                "data_lancamento": data_hoje
-            })
-        
-        df_append = pd.DataFrame(lista_novos)
-        if not df_existente.empty:
-            df_final = pd.concat([df_existente, df_append], ignore_index=True)
-        else:
-            df_final = df_append
-        
-        try: conn.update(worksheet="guias", data=df_final)
-        except: conn.update(worksheet=0, data=df_final)
-
-    def atualizar_fatura_sheets(fatura_ref, df_editado, meta_dados):
-        df_completo = carregar_dados_sheets()
-        df_limpo = df_completo[df_completo['fatura_ref'] != fatura_ref]
-        
-        data_hoje = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        lista_novos = []
-        fatura_ref_safe = f"'{fatura_ref}"
-
-        for _, row in df_editado.iterrows():
-            try: val = float(row['VALOR (R$)'])
-            except: val = 0.0
-            
-            prec_cp_val = row.get('PREC-CP/SIAPE', '')
-            if not prec_cp_val and 'prec_cp' in row: prec_cp_val = row['prec_cp']
-
-            lista_novos.append({
-                "fatura_ref": fatura_ref_safe,
-                "mes_competencia": meta_dados['mes'],
-                "ano_competencia": meta_dados['ano'], 
-                "tipo_usuario": meta_dados['usuario'],
-                "servicos_fatura": meta_dados['servico'], 
-                "paciente_nome": row['NOME DO PACIENTE'],
-                "nr_guia": row['NR DA GUIA'], 
-                "prec_cp": str(prec_cp_val),
-                "data_atend": limpar_data_sem_ano(row['DATA ATEND.']), 
-                "cod_proced": row['CÓDIGO PROCED.'], 
-                "valor": val, 
-                "data_lancamento": data_hoje
-            })
-            
-        df_append = pd.DataFrame(lista_novos)
-        df_limpo['fatura_ref'] = df_limpo['fatura_ref'].apply(lambda x: f"'{x}" if not str(x).startswith("'") else x)
-        df_final = pd.concat([df_limpo, df_append], ignore_index=True)
-        conn.update(worksheet="guias", data=df_final)
-
-    # --- OCR / PDF ---
-    @st.cache_resource
-    def load_ocr_reader():
-        return easyocr.Reader(['pt'], gpu=False, quantize=True)
-
-    def extrair_texto_hibrido(arquivo_bytes):
-        texto_final = ""; usou_ocr = False
-        with pdfplumber.open(arquivo_bytes) as pdf:
-            for page in pdf.pages:
-                t = page.extract_text()
-                if t: texto_final += t + "\n"
-        
-        if len(texto_final.strip()) < 20:
-            try:
-                reader = load_ocr_reader() 
-                arquivo_bytes.seek(0)
-                doc = fitz.open(stream=arquivo_bytes.read(), filetype="pdf")
-                texto_ocr = ""
-                for pagina in doc:
-                    pix = pagina.get_pixmap(dpi=150) 
-                    img_data = pix.tobytes("png")
-                    resultado = reader.readtext(img_data, detail=0, paragraph=True)
-                    texto_ocr += "\n".join(resultado) + "\n"
-                    del pix, img_data; gc.collect()
-                texto_final = texto_ocr; usou_ocr = True
-            except Exception as e: return f"ERRO_OCR: {str(e)}", False
-        return texto_final, usou_ocr
-
-    def extrair_dados_pdf(arquivo):
-        dados = {"NOME DO PACIENTE": "", "NR DA GUIA": "", "DATA ATEND.": "", "PREC-CP/SIAPE": "", "CÓDIGO PROCED.": "", "VALOR (R$)": 0.0}
-        try:
-            arquivo.seek(0)
-            text, _ = extrair_texto_hibrido(arquivo)
-            
-            match_guia = re.search(r'(?:Nr|Numero)[:\.]?\s*(\d+)', text, flags=re.IGNORECASE)
-            if match_guia: dados["NR DA GUIA"] = match_guia.group(1)
-            
-            match_data = re.search(r'Data:\s*(\d{2}/\d{2}/\d{4})', text, flags=re.IGNORECASE)
-            if match_data: dados["DATA ATEND."] = limpar_data_sem_ano(match_data.group(1))
-            else:
-                datas = re.findall(r'\d{2}/\d{2}/\d{4}', text)
-                if datas: dados["DATA ATEND."] = limpar_data_sem_ano(datas[0])
-            
-            match_titular = re.search(r'Titular:\s*\(.*?\)\s*\n?(.+)', text, flags=re.IGNORECASE)
-            match_dependente = re.search(r'Dependente:\s*\(.*?\)\s*\n?(.+)', text, flags=re.IGNORECASE)
-            if match_dependente: dados["NOME DO PACIENTE"] = match_dependente.group(1).strip()
-            elif match_titular: dados["NOME DO PACIENTE"] = match_titular.group(1).strip()
-            if "UG Origem" in dados["NOME DO PACIENTE"]: dados["NOME DO PACIENTE"] = dados["NOME DO PACIENTE"].split("UG Origem")[0].strip()
-            
-            match_idt = re.search(r'Idt:\s*([\d-]+)', text, flags=re.IGNORECASE)
-            if match_idt: dados["PREC-CP/SIAPE"] = match_idt.group(1)
-            else:
-                match_prec = re.search(r'Prec CP:\s*(\d+)', text, flags=re.IGNORECASE)
-                if match_prec: dados["PREC-CP/SIAPE"] = match_prec.group(1)
-            
-            codigos = re.findall(r'(?<!\d)(\d{8})(?!\d)', text)
-            if codigos:
-                codigos_validos = [c for c in codigos if not c.startswith("202")]
-                dados["CÓDIGO PROCED."] = ", ".join(sorted(set(codigos_validos)))
-            
-            match_total = re.search(r'Total\s*:?\s*([\d\.,]+)', text, flags=re.IGNORECASE)
-            if match_total:
-                 try: dados["VALOR (R$)"] = float(match_total.group(1).replace('.', '').replace(',', '.'))
-                 except: pass
-        except: pass
-        return dados
-
-    # --- DOCX E PDF ---
-    def gerar_doc_word(doc, df_dados, tags, tipo_usuario):
-        for p in doc.paragraphs:
-            for key, val in tags.items(): 
-                if key in p.text: p.text = p.text.replace(key, str(val))
-            if "REFERENTE A USUÁRIO" in p.text:
-                opcoes = ["FUSEX", "PASS (S.CIVIL)", "FATOR DE CUSTO", "Ex-Combatente"]
-                texto_base = "REFERENTE A USUÁRIO:   "
-                for op in opcoes: 
-                    marcador = "( X )" if tipo_usuario == op else "( )"
-                    if tipo_usuario == "PASS" and op == "PASS (S.CIVIL)": marcador = "( X )"
-                    if tipo_usuario == "S.CIVIL" and op == "PASS (S.CIVIL)": marcador = "( X )"
-                    texto_base += f"{op} {marcador}    "
-                p.text = texto_base
-        
-        if doc.tables:
-            tabela = doc.tables[0]
-            for _, row in df_dados.iterrows():
-                cells = tabela.add_row().cells
-                valor_fmt = f"{row.get('VALOR (R$)', 0.0):,.2f}".replace('.', 'X').replace(',', '.').replace('X', ',')
-                vals = [row.get("NOME DO PACIENTE", ""), row.get("NR DA GUIA", ""), row.get("DATA ATEND.", ""), row.get("PREC-CP/SIAPE", ""), row.get("CÓDIGO PROCED.", ""), valor_fmt]
-                for i, v in enumerate(vals): 
-                    cells[i].text = str(v)
-                    if cells[i].paragraphs: cells[i].paragraphs[0].runs[0].font.size = Pt(9)
-            row_total = tabela.add_row().cells
-            row_total[4].text = "TOTAL"; row_total[5].text = tags["{{TOTAL}}"]
-
-        section = doc.sections[0]
-        footer = section.footer
-        p_footer = footer.paragraphs[0] if footer.paragraphs else footer.add_paragraph()
-        
-        fuso_br = pytz.timezone('America/Sao_Paulo')
-        agora = datetime.now(fuso_br).strftime("%d/%m/%Y às %H:%M")
-        p_footer.text = f"Gestão Corpore - Documento gerado em: {agora}"
-        p_footer.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-        if not p_footer.runs: p_footer.add_run()
-        p_footer.runs[0].font.size = Pt(8)
-        return doc
-
-    def criar_template_padrao():
-        doc = Document()
-        style = doc.styles['Normal']; style.font.name = 'Arial'; style.font.size = Pt(10)
-        p = doc.add_paragraph('Corpore Centro de Saúde Ltda - CNPJ 15.259.434/0001-88')
-        p.alignment = WD_ALIGN_PARAGRAPH.CENTER; p.runs[0].bold = True
-        doc.add_paragraph('')
-        p_fat = doc.add_paragraph(); p_fat.add_run('FATURA Nº: ').bold = True; p_fat.add_run('{{NUM_FATURA}} – {{SERVICO}} – {{MES_ANO}}')
-        doc.add_paragraph('REFERENTE A USUÁRIO:   FUSEX( ) ...') 
-        table = doc.add_table(rows=1, cols=6); table.style = 'Table Grid'
-        hdr = ["NOME DO PACIENTE", "NR DA GUIA", "DATA ATEND.", "PREC-CP/SIAPE", "CÓD PROCED.", "VALOR R$"]
-        for i, h in enumerate(hdr): table.rows[0].cells[i].text = h
-        doc.add_paragraph(''); p_ext = doc.add_paragraph(); p_ext.add_run('VALOR POR EXTENSO: ').bold = True; p_ext.add_run('{{EXTENSO}} ({{TOTAL}})')
-        return doc
-
-    def gerar_pdf_protocolo(faturas_selecionadas, qtd_guias, total_faturas):
-        buffer = BytesIO(); c = canvas.Canvas(buffer, pagesize=A4)
-        data_envio = datetime.now().strftime("%d/%m/%Y às %H:%M")
-        endereco_fusex = ["Aos Cuidados FUSEX", "Hospital Geral de Juiz de Fora - HGeJF", "Endereço: R. Gen. Deschamps Cavalcante, s/n - Fábrica", "Juiz de Fora - MG, 36080-220"]
-        def desenhar_via(y_inicial):
-            c.setFont("Helvetica-Bold", 14); c.drawString(2*cm, y_inicial, "CORPORE CENTRO DE SAÚDE LTDA")
-            c.setFont("Helvetica", 10); c.drawString(2*cm, y_inicial - 0.5*cm, "PROTOCOLO DE REMESSA DE FATURAS FUSEX")
-            c.setFont("Helvetica", 9); y_dest = y_inicial
-            for linha in endereco_fusex: c.drawRightString(19*cm, y_dest, linha); y_dest -= 0.4*cm
-            y_box = y_inicial - 2.8*cm; c.rect(2*cm, y_box - 2.5*cm, 17*cm, 2.5*cm)
-            c.setFont("Helvetica-Bold", 11); c.drawString(2.5*cm, y_box - 0.8*cm, f"QTD FATURAS: {len(faturas_selecionadas)}"); c.drawString(10*cm, y_box - 0.8*cm, f"TOTAL DE GUIAS: {qtd_guias}")
-            lista_faturas_str = [str(f) for f in faturas_selecionadas]; texto_faturas = ", ".join(lista_faturas_str)
-            if len(texto_faturas) > 90: texto_faturas = texto_faturas[:90] + "..."
-            c.setFont("Helvetica", 10); c.drawString(2.5*cm, y_box - 1.5*cm, f"Ref. Faturas: {texto_faturas}")
-            valor_fmt = f"{total_faturas:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.'); c.drawString(2.5*cm, y_box - 2.2*cm, f"Gestão Corpore: Walter Vilaça")
-            y_ass = y_box - 4.5*cm; c.line(2*cm, y_ass, 9*cm, y_ass); c.setFont("Helvetica", 8); c.drawString(2*cm, y_ass - 0.4*cm, "Despachado por (Corpore)")
-            c.line(11*cm, y_ass, 19*cm, y_ass); c.drawString(11*cm, y_ass - 0.4*cm, "Transportado por (Motoboy)")
-            y_ass2 = y_ass - 2.5*cm; c.line(2*cm, y_ass2, 19*cm, y_ass2); c.setFont("Helvetica-Bold", 9); c.drawString(2*cm, y_ass2 - 0.5*cm, "Recebido por (Carimbo/Assinatura HGeJF)")
-            c.setFont("Helvetica-Oblique", 7); c.drawRightString(19*cm, y_ass2 - 1.2*cm, f"Gerado via Sistema Corpore em: {data_envio}")
-        desenhar_via(27*cm); c.setDash(4, 4); c.line(1*cm, 14.85*cm, 20*cm, 14.85*cm); c.setFont("Helvetica", 6); c.drawCentredString(10.5*cm, 14.95*cm, "- - - Corte Aqui - - -"); c.setDash([]); desenhar_via(13*cm)
-        c.save(); buffer.seek(0); return buffer
+        try: return faturamento.salvar_fatura(armazenamento(), df_novo, meta_dados)
+        finally: cache_guias().invalidar()
+
+    def atualizar_fatura_sheets(fatura_ref, df_editado, meta_dados, edicao=None):
+        try: return faturamento.atualizar_fatura(armazenamento(), fatura_ref, df_editado, meta_dados, edicao)
+        finally: cache_guias().invalidar()
+
+    # --- LOTE DE PDFs ---
+    # Enquanto roda, o painel é um fragmento que se redesenha a cada 1s; ao terminar, um rerun
+    # completo troca pelo resumo estático (sem run_every, a página para de fazer reruns)
+    def coletar_lote(lote):
+        """Joga as guias lidas no df_input conforme cada arquivo termina."""
+        novos = lote.coletar_novos()
+        if novos:
+            novo = pd.DataFrame(novos)
+            novo["DATA ATEND."] = novo["DATA ATEND."].astype(str)
+            st.session_state['df_input'] = pd.concat([st.session_state['df_input'], novo], ignore_index=True)
+        st.progress(lote.progresso(), text=f"{lote.lidas} guias lidas de {len(lote.itens)} arquivos")
+        st.dataframe(pd.DataFrame(lote.status()), hide_index=True)
+
+    @st.fragment(run_every=1)
+    def andamento_lote_ingestao():
+        lote = st.session_state.get('lote_ingestao')
+        if lote is None: return
+        if lote.concluido: st.rerun()  # a tabela de edição recebe as guias novas e o painel vira o resumo
+        coletar_lote(lote)
+        if st.button("⛔ Cancelar lote"): lote.cancelar()
+
+    def painel_lote_ingestao():
+        lote = st.session_state.get('lote_ingestao')
+        if lote is None: return
+        if not lote.concluido: andamento_lote_ingestao(); return
+        coletar_lote(lote)
+        if lote.cancelado: st.warning(f"Lote cancelado. {lote.lidas} guias lidas!")
+        else: st.success(f"{lote.lidas} guias lidas!")
+        if st.button("Limpar status do lote"):
+            del st.session_state['lote_ingestao']; st.rerun()
+
+    @st.fragment(run_every=1)
+    def andamento_exportacao():
+        exp = st.session_state.get('exportacao')
+        if exp is None: return
+        if exp.concluido: st.rerun()
+        st.progress(exp.progresso(), text=f"{exp.geradas} de {len(exp.itens)} faturas geradas")
+        st.dataframe(pd.DataFrame(exp.status()), hide_index=True)
+        if st.button("⛔ Cancelar exportação"): exp.cancelar()
+
+    def painel_exportacao():
+        """Andamento da exportação em lote; no fim, download e impressão num trabalho só."""
+        exp = st.session_state.get('exportacao')
+        if exp is None: return
+        if not exp.concluido: andamento_exportacao(); return
+        st.progress(exp.progresso(), text=f"{exp.geradas} de {len(exp.itens)} faturas geradas")
+        st.dataframe(pd.DataFrame(exp.status()), hide_index=True)
+        if exp.cancelado: st.warning(f"Exportação cancelada. {exp.geradas} faturas geradas.")
+        if exp.arquivo:
+            c_down, c_print = st.columns(2)
+            c_down.download_button(f"📥 Baixar {exp.nome_arquivo}", exp.ler, exp.nome_arquivo, exp.mime)
+            if c_print.button("🖨️ Imprimir lote (1 trabalho)"):
+                ok, msg_imp = exp.imprimir()
+                if ok: st.success(msg_imp)
+                else: st.error(msg_imp)
+        if st.button("Limpar exportação"):
+            exp.descartar(); del st.session_state['exportacao']; st.rerun()
 
     # --- INTERFACE (ABAS) ---
     tab1, tab2, tab3, tab4 = st.tabs(["📝 Nova Fatura", "✏ Editar (Nuvem)", "📊 Relatórios e 2ª Via", "📦 Protocolo"])
@@ -407,71 +298,91 @@ def sistema_principal():
 
         c1, c2, c3 = st.columns(3)
         mes_nome = c1.selectbox("Mês", list(meses.keys()), index=datetime.now().month - 1)
-        seq = c1.number_input("Sequencial", 1, 100, 1)
-        fatura_ref = f"{meses[mes_nome]}.{seq}"
-        c1.info(f"Fatura: **{fatura_ref}**")
-        
         ano = c2.number_input("Ano", 2024, 2030, 2025)
+        # Número reservado no banco só ao salvar: duas sessões em paralelo nunca recebem o mesmo
+        numerar = hasattr(armazenamento(), "nova_fatura")
+        if not numerar or c1.checkbox("Número manual", help="Para acrescentar guias a uma fatura que já existe"):
+            seq = c1.number_input("Sequencial", 1, 100, 1)
+            fatura_ref = f"{meses[mes_nome]}.{seq}"
+            c1.info(f"Fatura: **{fatura_ref}**")
+        else:
+            fatura_ref = None
+            c1.info(f"Fatura: **{armazenamento().proxima_fatura(ano, mes_nome)}** (confirmada ao salvar)")
+        
         servico = c2.multiselect("Serviço", ["Consulta", "Fisioterapia", "Fonoaudiologia", "Psicologia", "Terapia Ocupacional", "Terapias Especiais TEA/TGD"], default=["Fisioterapia"])
         servico_txt = ", ".join(servico)
         usuario = c3.radio("Convênio", ["FUSEX", "PASS", "S.CIVIL"])
         
         uploaded = st.file_uploader("Arraste os PDFs", type="pdf", accept_multiple_files=True)
-        if uploaded and st.button("Processar PDFs"):
-            lista = []; bar = st.progress(0)
-            for i, f in enumerate(uploaded):
-                d = extrair_dados_pdf(f)
-                if d["NR DA GUIA"]: lista.append(d)
-                bar.progress((i+1)/len(uploaded))
-            if lista:
-                novo = pd.DataFrame(lista)
-                novo["DATA ATEND."] = novo["DATA ATEND."].astype(str)
-                st.session_state['df_input'] = pd.concat([st.session_state['df_input'], novo], ignore_index=True)
-                st.success(f"{len(lista)} guias lidas!")
+        lote_ativo = st.session_state.get('lote_ingestao')
+        em_andamento = lote_ativo is not None and not lote_ativo.concluido
+        if uploaded and st.button("Processar PDFs", disabled=em_andamento):
+            from ingestao import LoteIngestao
+            st.session_state['lote_ingestao'] = LoteIngestao([(f.name, f.getvalue()) for f in uploaded], consulta().localizar_guias).iniciar()
+        if st.session_state.get('lote_ingestao') is not None: painel_lote_ingestao()
         
         st.session_state['df_input']['DATA ATEND.'] = st.session_state['df_input']['DATA ATEND.'].astype(str).replace('nan', '')
         st.session_state['df_input']['VALOR (R$)'] = pd.to_numeric(st.session_state['df_input']['VALOR (R$)'], errors='coerce').fillna(0.0)
 
         df_editor = st.data_editor(
-            st.session_state['df_input'], 
+            com_avisos_duplicidade(st.session_state['df_input']), 
             num_rows="dynamic",
+            disabled=["DUPLICIDADE"],
             column_config={
                 "VALOR (R$)": st.column_config.NumberColumn("Valor (R$)", format="R$ %.2f"),
-                "DATA ATEND.": st.column_config.TextColumn("Data (dd/mm)", help="Texto livre: 05/11 ou 05/11 a 08/11")
+                "DATA ATEND.": st.column_config.TextColumn("Data (dd/mm)", help="Texto livre: 05/11 ou 05/11 a 08/11"),
+                "DUPLICIDADE": st.column_config.TextColumn("Duplicidade")
             }
-        )
+        ).drop(columns=["DUPLICIDADE"])
         
         total = df_editor['VALOR (R$)'].sum()
         st.metric("Total", formatar_moeda_br(total))
         
-        if st.button("💾 Salvar na Nuvem"):
+        # Conferência no salvar (a tabela pode ter sido editada depois dos avisos)
+        avisos = [a for a in com_avisos_duplicidade(df_editor)["DUPLICIDADE"] if a]
+        pode_salvar = True
+        if avisos:
+            st.warning(f"{len(avisos)} guia(s) repetida(s) ou já faturada(s). Confira a coluna Duplicidade antes de salvar.")
+            pode_salvar = st.checkbox("Salvar mesmo assim (refaturamento intencional)")
+        if fatura_ref and consulta().fatura_existe(fatura_ref):
+            st.warning(f"A fatura {fatura_ref} já existe: as guias serão acrescentadas a ela.")
+            pode_salvar = st.checkbox(f"Acrescentar à fatura {fatura_ref}") and pode_salvar
+        if st.button("💾 Salvar na Nuvem", disabled=not pode_salvar):
             df_editor['DATA ATEND.'] = df_editor['DATA ATEND.'].astype(str).apply(limpar_data_sem_ano)
             meta = {'fatura': fatura_ref, 'mes': mes_nome, 'ano': ano, 'usuario': usuario, 'servico': servico_txt}
-            salvar_no_sheets(df_editor, meta)
+            fatura_ref = salvar_no_sheets(df_editor, meta)
             
-            doc = criar_template_padrao()
-            extenso = num2words(total, lang='pt_BR', to='currency').upper()
-            tags = {"{{NUM_FATURA}}": fatura_ref, "{{MES_ANO}}": f"{mes_nome}/{ano}", "{{SERVICO}}": servico_txt, "{{TOTAL}}": formatar_moeda_br(total), "{{EXTENSO}}": extenso}
-            doc = gerar_doc_word(doc, df_editor, tags, usuario)
-            buf = BytesIO(); doc.save(buf); buf.seek(0)
+            tags = tags_fatura(fatura_ref, meta, total)
+            buf = BytesIO(); gerar_doc_word(df_editor, tags, usuario).save(buf); buf.seek(0)
             
-            st.download_button("📥 Download DOCX", buf, f"Fatura_{fatura_ref}.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
-            st.success("Salvo com sucesso!")
+            c_docx, c_pdf = st.columns(2)
+            c_docx.download_button("📥 Download DOCX", buf, f"Fatura_{fatura_ref}.docx", MIME_DOCX)
+            c_pdf.download_button("📥 Download PDF", gerar_pdf_fatura(df_editor, tags, usuario), f"Fatura_{fatura_ref}.pdf", MIME_PDF)
+            if sinc is not None: st.success(f"Fatura {fatura_ref} salva! O envio ao Sheets segue em segundo plano (acompanhe na barra lateral).")
+            else: st.success(f"Fatura {fatura_ref} salva com sucesso!")
 
     # === ABA 2: EDITAR ===
     with tab2:
         st.header("✏ Editar Faturas")
-        df_nuvem = carregar_dados_sheets()
-        if not df_nuvem.empty:
-            faturas = df_nuvem['fatura_ref'].unique()
-            sel_fat = st.selectbox("Editar fatura:", faturas)
-            
-            if sel_fat:
-                df_filtrado = df_nuvem[df_nuvem['fatura_ref'] == sel_fat].copy()
+        if st.session_state.get('aviso_edicao'): st.success(st.session_state.pop('aviso_edicao'))
+        if st.session_state.get('conflitos_edicao'):
+            st.warning("Outra sessão salvou esta fatura enquanto você editava. Estas linhas ficaram como ela deixou; confira e edite de novo:")
+            st.dataframe(pd.DataFrame(st.session_state.pop('conflitos_edicao')), hide_index=True)
+        sel_fat = escolher_fatura("Editar fatura:", "sel_editar")
+        if sel_fat:
+            # Fatura aberta fica presa na sessão (linhas + versão) até salvar: é a base do compare-and-swap
+            edicao = None
+            if hasattr(armazenamento(), "editar_fatura"):
+                edicao = st.session_state.get('edicao')
+                if edicao is None or edicao['ref'] != sel_fat:
+                    base, versao = armazenamento().fatura_para_edicao(sel_fat)
+                    st.session_state['edicao'] = edicao = {'ref': sel_fat, 'versao': versao, 'base': base}
+            df_filtrado = (edicao['base'] if edicao else consulta().guias_das_faturas([sel_fat])).copy()
+            if not df_filtrado.empty:
                 meta_orig = {'mes': df_filtrado.iloc[0]['mes_competencia'], 'ano': df_filtrado.iloc[0]['ano_competencia'], 'usuario': df_filtrado.iloc[0]['tipo_usuario'], 'servico': df_filtrado.iloc[0]['servicos_fatura']}
                 st.info(f"Editando: {meta_orig['servico']} | {meta_orig['usuario']}")
                 
-                cols_possiveis = ["paciente_nome", "nr_guia", "prec_cp", "data_atend", "cod_proced", "valor"]
+                cols_possiveis = ["paciente_nome", "nr_guia", "prec_cp", "data_atend", "cod_proced", "valor", "id"]
                 cols_reais = [c for c in cols_possiveis if c in df_filtrado.columns]
                 
                 df_edit = df_filtrado[cols_reais].rename(columns={"paciente_nome": "NOME DO PACIENTE", "nr_guia": "NR DA GUIA", "prec_cp": "PREC-CP/SIAPE", "data_atend": "DATA ATEND.", "cod_proced": "CÓDIGO PROCED.", "valor": "VALOR (R$)"})
@@ -480,83 +391,87 @@ def sistema_principal():
                 df_edit["DATA ATEND."] = df_edit["DATA ATEND."].astype(str).replace('nan', '')
 
                 df_final_edit = st.data_editor(
-                    df_edit, 
+                    com_avisos_duplicidade(df_edit, sel_fat), 
                     num_rows="dynamic",
+                    disabled=["DUPLICIDADE"],
                     column_config={
                         "VALOR (R$)": st.column_config.NumberColumn("Valor (R$)", format="R$ %.2f"),
-                        "DATA ATEND.": st.column_config.TextColumn("Data (dd/mm)")
-                    }
-                )
+                        "DATA ATEND.": st.column_config.TextColumn("Data (dd/mm)"),
+                        "DUPLICIDADE": st.column_config.TextColumn("Duplicidade"),
+                        "id": None
+                    },
+                    key=f"editor_{sel_fat}_{edicao['versao'] if edicao else ''}"
+                ).drop(columns=["DUPLICIDADE"])
                 
                 if st.button("🔄 Atualizar Fatura"):
                     df_final_edit['DATA ATEND.'] = df_final_edit['DATA ATEND.'].astype(str).apply(limpar_data_sem_ano)
-                    atualizar_fatura_sheets(sel_fat, df_final_edit, meta_orig)
-                    st.success("Atualizado!"); time.sleep(1); st.rerun()
+                    conflitos = atualizar_fatura_sheets(sel_fat, df_final_edit, meta_orig, edicao)
+                    st.session_state.pop('edicao', None)  # reabre com o estado gravado
+                    if conflitos: st.session_state['conflitos_edicao'] = conflitos
+                    st.session_state['aviso_edicao'] = f"Fatura {sel_fat} atualizada!" + (" Enviando ao Sheets em segundo plano." if sinc is not None else "")
+                    st.rerun()
 
     # === ABA 3: RELATÓRIOS E 2ª VIA ===
     with tab3:
         st.header("📊 Relatórios")
-        df = carregar_dados_sheets()
-        if not df.empty:
-            df['valor'] = pd.to_numeric(df['valor'], errors='coerce')
-            
+        cubo = carregar_agregados()
+        if not cubo.empty:
             st.subheader("🖨️ Emissão de 2ª Via")
-            faturas_2via = df['fatura_ref'].unique()
             col_sel, col_btn = st.columns([2, 1])
-            sel_2via = col_sel.selectbox("Selecione a fatura para 2ª Via", faturas_2via)
+            sel_2via = escolher_fatura("Selecione a fatura para 2ª Via", "sel_2via", col_sel)
             
             if sel_2via:
                 # Reconstrói os dados
-                df_fat = df[df['fatura_ref'] == sel_2via]
-                meta_fat = {
-                    'mes': df_fat.iloc[0]['mes_competencia'],
-                    'ano': df_fat.iloc[0]['ano_competencia'],
-                    'usuario': df_fat.iloc[0]['tipo_usuario'],
-                    'servico': df_fat.iloc[0]['servicos_fatura']
-                }
+                df_guias = consulta().guias_das_faturas([sel_2via])
+                df_tabela, meta_fat = tabela_fatura(df_guias)
                 
-                df_tabela = df_fat[["paciente_nome", "nr_guia", "data_atend", "prec_cp", "cod_proced", "valor"]].copy()
-                df_tabela.columns = ["NOME DO PACIENTE", "NR DA GUIA", "DATA ATEND.", "PREC-CP/SIAPE", "CÓDIGO PROCED.", "VALOR (R$)"]
+                artefatos = cache_artefatos()
+                def docx_2via():
+                    """Gerado só no clique (download/impressão); fatura sem alteração sai do cache."""
+                    def gerar():
+                        tags_fat = tags_fatura(sel_2via, meta_fat, df_tabela["VALOR (R$)"].sum())
+                        return template_padrao().gerar_bytes(df_tabela, tags_fat, meta_fat['usuario'])
+                    return artefatos.obter(chave_conteudo("2via", sel_2via, meta_fat, df_tabela), gerar)
+                def pdf_2via():
+                    return artefatos.obter(chave_conteudo("2via.pdf", sel_2via, meta_fat, df_tabela), lambda: gerar_pdf_fatura_base(sel_2via, df_guias))
                 
-                total_fat = df_tabela["VALOR (R$)"].sum()
-                extenso_fat = num2words(total_fat, lang='pt_BR', to='currency').upper()
-                tags_fat = {"{{NUM_FATURA}}": sel_2via, "{{MES_ANO}}": f"{meta_fat['mes']}/{meta_fat['ano']}", "{{SERVICO}}": meta_fat['servico'], "{{TOTAL}}": formatar_moeda_br(total_fat), "{{EXTENSO}}": extenso_fat}
-
-                # Gera o DOCX em memória
-                doc_2via = criar_template_padrao()
-                doc_2via = gerar_doc_word(doc_2via, df_tabela, tags_fat, meta_fat['usuario'])
-                buf_2via = BytesIO()
-                doc_2via.save(buf_2via)
-                buf_2via.seek(0)
+                c_down, c_pdf, c_print = st.columns(3)
+                c_down.download_button("📥 Baixar 2ª Via (DOCX)", docx_2via, f"2Via_{sel_2via}.docx", MIME_DOCX)
+                c_pdf.download_button("📥 Baixar 2ª Via (PDF)", pdf_2via, f"2Via_{sel_2via}.pdf", MIME_PDF)
                 
-                c_down, c_print = st.columns(2)
-                c_down.download_button("📥 Baixar 2ª Via (DOCX)", buf_2via, f"2Via_{sel_2via}.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
-                
-                # RECURSO DE IMPRESSÃO DIRETA
+                # RECURSO DE IMPRESSÃO DIRETA (PDF: o lp imprime sem converter o DOCX)
                 if c_print.button("🖨️ Imprimir Direto (Terminal)"):
-                    buf_2via.seek(0) # Reseta ponteiro
-                    ok, msg_imp = enviar_impressao_direta(buf_2via, f"Print_{sel_2via}.docx")
+                    ok, msg_imp = enviar_impressao_direta(BytesIO(pdf_2via()), f"Print_{sel_2via}.pdf")
                     if ok: st.success(msg_imp)
                     else: st.error(msg_imp)
             
             st.divider()
-            # Dashboard Original
-            total_geral = df['valor'].sum()
+            # Dashboard (servido pelo cubo: uma linha por fatura, não por guia)
             c1, c2 = st.columns(2)
-            c1.metric("Faturamento Total Acumulado", formatar_moeda_br(total_geral))
-            c1.metric("Total de Guias Processadas", len(df))
-            st.bar_chart(df.groupby("mes_competencia")["valor"].sum())
+            c1.metric("Faturamento Total Acumulado", formatar_moeda_br(cubo['valor'].sum()))
+            c1.metric("Total de Guias Processadas", int(cubo['guias'].sum()))
+            # Competência como AAAA-MM: o eixo sai em ordem cronológica, não alfabética
+            ano_num = pd.to_numeric(cubo['ano'], errors='coerce').fillna(0).astype(int)
+            mes_num = cubo['mes'].map(meses).fillna(0).astype(int)
+            cubo = cubo.assign(competencia=ano_num.astype(str) + "-" + mes_num.map("{:02d}".format))
+            st.bar_chart(cubo.groupby("competencia")["valor"].sum().sort_index())
+            c_conv, c_serv = st.columns(2)
+            c_conv.caption("Por convênio"); c_conv.bar_chart(cubo.groupby("tipo_usuario")["valor"].sum())
+            c_serv.caption("Por serviço"); c_serv.bar_chart(cubo.groupby("servico")["valor"].sum())
             with st.expander("Ver Base de Dados Completa"):
-                st.dataframe(df)
+                navegar_base()
 
     # === ABA 4: PROTOCOLO ===
     with tab4:
         st.header("📦 Protocolo")
-        df = carregar_dados_sheets()
-        if not df.empty:
-            sel = st.multiselect("Selecione Faturas:", df['fatura_ref'].unique())
+        if consulta().faturas(limite=1):
+            busca_prot = st.text_input("🔎 Buscar fatura", key="busca_protocolo", placeholder="ex.: 11.")
+            # As já escolhidas continuam na lista mesmo fora da busca
+            escolhidas = st.session_state.get("sel_protocolo", [])
+            opcoes = list(dict.fromkeys(escolhidas + consulta().faturas(busca_prot)))
+            sel = st.multiselect("Selecione Faturas:", opcoes, key="sel_protocolo")
             if sel:
-                sub = df[df['fatura_ref'].isin(sel)]
+                sub = consulta().guias_das_faturas(sel)
                 tot = sub['valor'].sum()
                 qtd = sub['nr_guia'].nunique()
                 st.info(f"Total: {formatar_moeda_br(tot)} ({qtd} guias)")
@@ -564,12 +479,28 @@ def sistema_principal():
                     pdf = gerar_pdf_protocolo(sel, qtd, tot)
                     st.download_button("📥 PDF", pdf, "Protocolo.pdf", "application/pdf")
 
+                st.subheader("🗂 Exportar faturas selecionadas")
+                formato = st.radio("Formato", ["ZIP (DOCX + protocolo)", "PDF único (protocolo + faturas)"], horizontal=True)
+                exp_ativa = st.session_state.get('exportacao')
+                if st.button("Exportar lote", disabled=exp_ativa is not None and not exp_ativa.concluido):
+                    from exportacao import ExportacaoLote, FORMATO_ZIP, FORMATO_PDF
+                    fmt = FORMATO_PDF if formato.startswith("PDF") else FORMATO_ZIP
+                    por_fatura = dict(list(sub.groupby('fatura_ref', sort=False)))
+                    faturas = [(ref, *tabela_fatura(por_fatura[ref])) for ref in sel if ref in por_fatura]
+                    if exp_ativa is not None: exp_ativa.descartar()
+                    st.session_state['exportacao'] = ExportacaoLote(faturas, fmt, (sel, qtd, tot)).iniciar()
+            if st.session_state.get('exportacao') is not None: painel_exportacao()
+
 # ==========================================
 # 🏁 MAIN
 # ==========================================
 
 if __name__ == "__main__":
+    if servico_ocr.SUBIR_NO_BOOT: servico_ocr_da_maquina()
     if 'logado' not in st.session_state: st.session_state['logado'] = False
-    if st.session_state['logado']: sistema_principal()
-    else: tela_login()
+    with metricas.rerun():
+        if st.session_state['logado']:
+            sistema_principal(); metricas.marcar_inicio("inicio.sistema", _t0_script)
+        else:
+            tela_login(); metricas.marcar_inicio("inicio.tela_login", _t0_script)
 
@@ -0,0 +1,139 @@
+"""Faturamento em lote sem navegador: pasta de guias em PDF -> faturas gravadas + documentos.
+
+Uso:
+    python fusex_cli.py guias/ --mes Novembro --ano 2025 --usuario FUSEX --servico Fisioterapia
+    python fusex_cli.py guias/ --mes Novembro --ano 2025 --por-fatura 40 --formatos pdf --saida /srv/faturas
+    python fusex_cli.py guias/ --mes Novembro --ano 2025 --simular      # só lê e confere, não grava
+
+Feito para o fechamento do mês rodar à noite (cron) no servidor do app, com
+as mesmas variáveis de ambiente (FUSEX_BACKEND, FUSEX_DB, FUSEX_OCR_*): os
+PDFs são lidos em paralelo (ingestao.LoteIngestao; OCR só nos escaneados),
+guias repetidas no lote ou já faturadas ficam de fora, as faturas são
+gravadas com o número do sequencial da competência e a pasta de saída
+recebe o DOCX/PDF de cada fatura, o Protocolo.pdf e o Lote.csv com o
+resultado de cada arquivo. Com Sheets, as faturas entram na fila de envio;
+a CLI espera até --espera-sheets segundos e o que sobrar o app envia.
+As credenciais do Sheets vêm do .streamlit/secrets.toml ao lado deste
+arquivo (o mesmo do app), de qualquer pasta que o cron rode a CLI.
+
+Sai com 1 se algum arquivo deu erro ou ficou sem número de guia.
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+import pandas as pd
+from campos import limpar_data_sem_ano
+from armazenamento import criar_armazenamento, CacheGuias, ConsultaMemoria, MODO_ARMAZENAMENTO, MESES
+from documentos import gerar_pdf_protocolo, formatar_moeda_br
+from ingestao import LoteIngestao
+import faturamento
+
+PASTA_APP = os.path.dirname(os.path.abspath(__file__))
+
+def abrir_armazenamento(modo):
+    """Mesmo backend do app; com Sheets, a conexão vem do .streamlit/secrets.toml da pasta do app."""
+    conn = None
+    if modo != "local":
+        import streamlit as st
+        from streamlit_gsheets import GSheetsConnection
+        # O Streamlit procura os secrets na pasta atual (e em ~/.streamlit): lê da pasta do app e volta,
+        # para a pasta das guias, --saida e FUSEX_DB relativos continuarem valendo a partir de onde a CLI rodou
+        atual = os.getcwd()
+        os.chdir(PASTA_APP)
+        try: conn = st.connection("gsheets", type=GSheetsConnection)
+        finally: os.chdir(atual)
+    return criar_armazenamento(modo, conn)
+
+def ler_guias(arquivos, consulta):
+    """Roda o lote e devolve (guias na ordem dos arquivos, status de cada arquivo)."""
+    lote = LoteIngestao(arquivos, localizar=consulta.localizar_guias).iniciar()
+    while not lote.esperar(5):
+        print(f"  ... {lote.progresso():.0%} dos arquivos, {lote.lidas} guias lidas", flush=True)
+    return faturamento.guias_do_lote(lote), pd.DataFrame(lote.status())
+
+def separar_duplicadas(guias, consulta):
+    """(guias a faturar, guias de fora): repetida no lote fica a 1ª; já faturada sai."""
+    guias = guias[guias["NR DA GUIA"].astype(str).str.strip() != ""]
+    repetidas = guias[guias.duplicated("NR DA GUIA")].assign(DUPLICIDADE="⚠️ repetida no lote")
+    com_aviso = faturamento.com_avisos_duplicidade(consulta, guias.drop_duplicates("NR DA GUIA"))
+    ja_faturadas = com_aviso[com_aviso["DUPLICIDADE"] != ""]
+    return com_aviso[com_aviso["DUPLICIDADE"] == ""].drop(columns=["DUPLICIDADE"]), pd.concat([repetidas, ja_faturadas])
+
+def esperar_sheets(arm, limite):
+    sinc = getattr(arm, "sincronizador", None)
+    if sinc is None: return
+    sinc.sincronizar_agora()
+    fim = time.time() + limite
+    while sinc.pendentes() and time.time() < fim: time.sleep(1)
+    if sinc.pendentes(): print(f"☁️ {sinc.pendentes()} fatura(s) ainda na fila do Sheets ({sinc.ultimo_erro or 'enviando'}): o app termina o envio.")
+    else: print("☁️ Sheets sincronizado")
+
+def main():
+    ap = argparse.ArgumentParser(description="Lê uma pasta de guias FUSEX em PDF, grava as faturas e gera os documentos.")
+    ap.add_argument("pasta", help="pasta com os PDFs das guias")
+    ap.add_argument("--mes", required=True, choices=MESES, help="mês da competência")
+    ap.add_argument("--ano", type=int, required=True, help="ano da competência")
+    ap.add_argument("--usuario", default="FUSEX", choices=["FUSEX", "PASS", "S.CIVIL"], help="convênio, como no app")
+    ap.add_argument("--servico", default="Fisioterapia", help="serviço(s) da fatura, como no app")
+    ap.add_argument("--fatura", help="acrescenta tudo a esta fatura (ex.: 11.3) em vez de numerar faturas novas")
+    ap.add_argument("--por-fatura", type=int, default=0, help="máximo de guias por fatura (0 = uma fatura só)")
+    ap.add_argument("--formatos", nargs="+", choices=["docx", "pdf"], default=["docx", "pdf"])
+    ap.add_argument("--saida", help="pasta dos documentos (padrão: faturas_AAAAMMDD-HHMM)")
+    ap.add_argument("--incluir-duplicadas", action="store_true", help="fatura também guias repetidas ou já faturadas")
+    ap.add_argument("--simular", action="store_true", help="lê e confere as guias, mas não grava nem gera documentos")
+    ap.add_argument("--espera-sheets", type=float, default=120, help="segundos esperando o envio ao Sheets")
+    args = ap.parse_args()
+
+    arquivos = faturamento.ler_pasta(args.pasta)
+    if not arquivos: print(f"Nenhum PDF em {args.pasta}"); sys.exit(1)
+    arm = abrir_armazenamento(MODO_ARMAZENAMENTO)
+    if not args.fatura and not args.simular and not hasattr(arm, "nova_fatura"):
+        ap.error(f"o backend {MODO_ARMAZENAMENTO} não numera faturas: informe --fatura")
+    cache = None if hasattr(arm, "consultar") else CacheGuias(arm.carregar)
+    consulta = arm if cache is None else ConsultaMemoria(cache)
+
+    t0 = time.perf_counter()
+    print(f"🔍 Lendo {len(arquivos)} PDF(s) de {args.pasta}")
+    guias, status = ler_guias(arquivos, consulta)
+    guias["DATA ATEND."] = guias["DATA ATEND."].astype(str).apply(limpar_data_sem_ano)
+    problemas = status[status["STATUS"].str.startswith("❌") | (status["NR DA GUIA"] == "")]
+    print(f"   {len(guias)} guias lidas em {time.perf_counter() - t0:.1f}s; {len(problemas)} arquivo(s) com problema")
+
+    if args.incluir_duplicadas: fora = guias.iloc[0:0]
+    else: guias, fora = separar_duplicadas(guias, consulta)
+    for _, g in fora.iterrows(): print(f"   fora: guia {g['NR DA GUIA']} ({g['NOME DO PACIENTE']}) {g['DUPLICIDADE']}")
+
+    saida = args.saida or f"faturas_{datetime.now().strftime('%Y%m%d-%H%M')}"
+    os.makedirs(saida, exist_ok=True)
+    status.to_csv(os.path.join(saida, "Lote.csv"), index=False)
+    if args.simular or guias.empty:
+        print("Simulação: nada gravado." if args.simular else "Nenhuma guia para faturar.")
+        sys.exit(1 if len(problemas) else 0)
+
+    tamanho = args.por_fatura if args.por_fatura > 0 and not args.fatura else len(guias)
+    meta = {'fatura': args.fatura, 'mes': args.mes, 'ano': args.ano, 'usuario': args.usuario, 'servico': args.servico}
+    refs = []
+    print(f"💾 Gravando ({MODO_ARMAZENAMENTO})")
+    for i in range(0, len(guias), tamanho):
+        parte = guias.iloc[i:i + tamanho].reset_index(drop=True)
+        ref = faturamento.salvar_fatura(arm, parte, meta)
+        refs.append(ref)
+        # Documento da fatura como ficou gravada (com --fatura, inclui as guias que ela já tinha)
+        if cache is not None: cache.invalidar()
+        df_fat = consulta.guias_das_faturas([ref])
+        for ext, conteudo in faturamento.documentos_fatura(ref, df_fat, args.formatos).items():
+            with open(os.path.join(saida, f"Fatura_{ref}.{ext}"), "wb") as f: f.write(conteudo)
+        total = f" (a fatura tem {len(df_fat)} no total, {formatar_moeda_br(df_fat['valor'].sum())})" if len(df_fat) != len(parte) else ""
+        print(f"   fatura {ref}: {len(parte)} guias, {formatar_moeda_br(parte['VALOR (R$)'].sum())}{total}")
+
+    protocolo = gerar_pdf_protocolo(refs, guias["NR DA GUIA"].nunique(), guias["VALOR (R$)"].sum())
+    with open(os.path.join(saida, "Protocolo.pdf"), "wb") as f: f.write(protocolo.getvalue())
+    print(f"📄 Documentos em {os.path.abspath(saida)}")
+    esperar_sheets(arm, args.espera_sheets)
+    print(f"Concluído em {time.perf_counter() - t0:.1f}s")
+    sys.exit(1 if len(problemas) else 0)
+
+if __name__ == "__main__":
+    main()
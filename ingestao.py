@@ -0,0 +1,174 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import extracao
+import metricas
+
+# Processos de OCR seguram o modelo do easyOCR na memória: poucos por padrão
+WORKERS_TEXTO = max(1, (os.cpu_count() or 2) - 1)
+WORKERS_OCR = int(os.environ.get("FUSEX_OCR_WORKERS", "1"))
+
+STATUS_FILA = "⏳ Na fila"
+STATUS_FILA_OCR = "🔍 Na fila de OCR"
+STATUS_OK = {"texto": "✅ Lida (texto)", "ocr": "✅ Lida (OCR)", "cache": "✅ Lida (cache)"}
+STATUS_SEM_GUIA = "⚠️ Nº da guia não encontrado"
+STATUS_REPETIDA = "⚠️ Guia repetida no lote"
+STATUS_CANCELADO = "⛔ Cancelado"
+
+# ==========================================
+# ⚙️ POOLS DE PROCESSOS (compartilhados entre lotes)
+# ==========================================
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def obter_pool(fila):
+    """Pool da fila 'texto' ou 'ocr'. Reaproveitado entre lotes para manter o modelo de OCR quente."""
+    with _pools_lock:
+        if fila not in _pools:
+            # spawn: não herda threads/estado do servidor Streamlit
+            ctx = multiprocessing.get_context("spawn")
+            n = WORKERS_OCR if fila == "ocr" else WORKERS_TEXTO
+            _pools[fila] = ProcessPoolExecutor(max_workers=max(1, n), mp_context=ctx)
+        return _pools[fila]
+
+def descartar_pool(fila):
+    """Remove um pool quebrado (ex.: worker morto por falta de memória); o próximo lote recria."""
+    with _pools_lock:
+        pool = _pools.pop(fila, None)
+    if pool: pool.shutdown(wait=False, cancel_futures=True)
+
+# ==========================================
+# 📥 LOTE DE INGESTÃO
+# ==========================================
+
+class LoteIngestao:
+    """Processa uma lista de PDFs (nome, bytes) em segundo plano.
+
+    Todo PDF entra na fila de texto; os que não têm camada de texto são
+    reenviados para a fila de OCR. As guias lidas ficam disponíveis em
+    `coletar_novos()` à medida que cada arquivo termina. Com `localizar`
+    (ex.: armazenamento.localizar_guias), cada guia lida é conferida contra
+    as já faturadas.
+    """
+
+    def __init__(self, arquivos, localizar=None):
+        self._conteudos = [conteudo for _, conteudo in arquivos]
+        self.itens = [{"ARQUIVO": nome, "STATUS": STATUS_FILA, "NR DA GUIA": "", "CONFIANÇA": "", "TEMPO (s)": None, "PICO RAM (MB)": None, "PÁGINAS": ""} for nome, _ in arquivos]
+        self.lidas = 0
+        self.concluido = False
+        self._novos = []
+        self._localizar = localizar
+        self._vistas = set()
+        self._lock = threading.Lock()
+        self._cancelar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+        return self
+
+    def cancelar(self):
+        self._cancelar.set()
+
+    def esperar(self, timeout=None):
+        """Bloqueia até o lote terminar (ou o timeout); devolve se terminou. Para uso fora da tela (fusex_cli)."""
+        self._thread.join(timeout)
+        return self.concluido
+
+    @property
+    def cancelado(self):
+        return self._cancelar.is_set()
+
+    def progresso(self):
+        if not self.itens: return 1.0
+        finais = sum(1 for i in self.itens if i["STATUS"] not in (STATUS_FILA, STATUS_FILA_OCR))
+        return finais / len(self.itens)
+
+    def coletar_novos(self):
+        """Devolve (e esvazia) as guias lidas desde a última coleta."""
+        with self._lock:
+            novos, self._novos = self._novos, []
+        return novos
+
+    def status(self):
+        with self._lock:
+            return [dict(i) for i in self.itens]
+
+    def _marcar(self, idx, status, dados=None, relatorio=None, confianca=None):
+        with self._lock:
+            self.itens[idx]["STATUS"] = status
+            if confianca:
+                # Mostra o campo mais fraco, que é o que o usuário deve conferir
+                campo, nota = min(confianca.items(), key=lambda kv: kv[1])
+                self.itens[idx]["CONFIANÇA"] = f"{nota:.0%} ({campo})" if nota < 0.9 else f"{nota:.0%}"
+            if relatorio:
+                self.itens[idx]["TEMPO (s)"] = round(sum(r["segundos"] for r in relatorio), 2)
+                self.itens[idx]["PÁGINAS"] = extracao.resumo_paginas(relatorio)
+                self.itens[idx]["PICO RAM (MB)"] = extracao.pico_memoria(relatorio)
+            if dados is not None:
+                self.itens[idx]["NR DA GUIA"] = dados["NR DA GUIA"]
+                if dados["NR DA GUIA"]:
+                    self._novos.append(dados); self.lidas += 1
+
+    def _duplicidade(self, nr):
+        """Aviso de guia repetida no lote ou já faturada; None se estiver tudo certo."""
+        if nr in self._vistas: return STATUS_REPETIDA
+        self._vistas.add(nr)
+        if self._localizar is None: return None
+        try: achadas = self._localizar([nr]).get(str(nr))
+        except Exception: return None  # conferência é best-effort: não trava a leitura
+        if achadas: return f"⚠️ Já faturada: {', '.join(sorted({a['fatura_ref'] for a in achadas}))}"
+        return None
+
+    def _registrar_tempos(self, origem, relatorio):
+        """Os tempos vêm dos processos do lote; o painel de desempenho fica neste processo."""
+        if not relatorio: return
+        for r in relatorio:
+            metricas.registrar("ocr.pagina" if r["fonte"].startswith("ocr") else "pdf.pagina", r["segundos"], dpi=r.get("dpi"), rss_mb=r.get("rss_mb"))
+        metricas.registrar("extracao.arquivo", sum(r["segundos"] for r in relatorio), origem=origem, paginas=len(relatorio))
+
+    def _submeter(self, pendentes, idx, fila):
+        funcao = extracao.processar_ocr if fila == "ocr" else extracao.processar_camada_texto
+        try:
+            fut = obter_pool(fila).submit(funcao, self._conteudos[idx])
+        except BrokenProcessPool:
+            descartar_pool(fila)
+            fut = obter_pool(fila).submit(funcao, self._conteudos[idx])
+        pendentes[fut] = (idx, fila)
+
+    def _executar(self):
+        pendentes = {}
+        try:
+            for idx in range(len(self.itens)): self._submeter(pendentes, idx, "texto")
+
+            while pendentes and not self._cancelar.is_set():
+                feitos, _ = wait(pendentes, timeout=0.5, return_when=FIRST_COMPLETED)
+                for fut in feitos:
+                    idx, fila = pendentes.pop(fut)
+                    try: resultado = fut.result()
+                    except BrokenProcessPool:
+                        descartar_pool(fila); self._marcar(idx, "❌ Erro: processo de leitura interrompido"); continue
+                    except Exception as e:
+                        self._marcar(idx, f"❌ Erro: {str(e)}"); continue
+
+                    if resultado is None:
+                        self._marcar(idx, STATUS_FILA_OCR); self._submeter(pendentes, idx, "ocr"); continue
+                    dados, origem, relatorio, confianca = resultado
+                    self._registrar_tempos(origem, relatorio)
+                    if dados["NR DA GUIA"]:
+                        aviso = self._duplicidade(dados["NR DA GUIA"])
+                        self._marcar(idx, aviso or STATUS_OK[origem], dados, relatorio, confianca)
+                    else:
+                        self._marcar(idx, STATUS_SEM_GUIA, dados, relatorio, confianca)
+        except Exception as e:
+            for idx, _ in pendentes.values(): self._marcar(idx, f"❌ Erro: {str(e)}")
+            pendentes = {}
+        finally:
+            # Cancelamento: o que ainda está na fila não roda; o que já está rodando é descartado
+            for fut, (idx, _) in pendentes.items():
+                fut.cancel(); self._marcar(idx, STATUS_CANCELADO)
+            self._conteudos = []
+            self.concluido = True
@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Log estruturado (uma linha JSON por medição); FUSEX_METRICAS_LOG="" desliga o arquivo
+CAMINHO_LOG = os.environ.get("FUSEX_METRICAS_LOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados", "metricas.jsonl"))
+# Passando do limite, o log vira metricas.jsonl.1 (a anterior é descartada): no máximo 2x isso em disco
+TAMANHO_MAX_LOG = int(float(os.environ.get("FUSEX_METRICAS_LOG_MB", "20")) * 1024 * 1024)
+AMOSTRAS_POR_ETAPA = 1000
+# Usuários que veem o painel de desempenho na barra lateral
+ADMINS = {u.strip() for u in os.environ.get("FUSEX_ADMINS", "").split(",") if u.strip()}
+# Dependências pesadas: cada uma só deve carregar no primeiro uso da sua funcionalidade
+MODULOS_PESADOS = ["pandas", "numpy", "gspread", "streamlit_gsheets", "pdfplumber", "fitz", "docx", "reportlab", "num2words", "easyocr", "torch"]
+
+_amostras = {}
+_contadores = {}
+_lock = threading.Lock()
+_log = None
+_log_lock = threading.Lock()
+_rerun = threading.local()
+_inicio = {}
+
+# ==========================================
+# ⏱ MEDIÇÕES
+# ==========================================
+
+def _rotacionar():
+    """Vários processos escrevem no mesmo log: só renomeia se o arquivo aberto ainda é o atual
+    (se outro processo já rodou, este só reabre)."""
+    global _log
+    try:
+        if os.fstat(_log.fileno()).st_ino == os.stat(CAMINHO_LOG).st_ino: os.replace(CAMINHO_LOG, CAMINHO_LOG + ".1")
+    except FileNotFoundError: pass
+    _log.close(); _log = None
+
+def _escrever_log(registro):
+    global _log
+    if not CAMINHO_LOG: return
+    with _log_lock:
+        try:
+            if _log is None:
+                os.makedirs(os.path.dirname(CAMINHO_LOG) or ".", exist_ok=True)
+                _log = open(CAMINHO_LOG, "a", encoding="utf-8", buffering=1)
+            _log.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+            if _log.tell() > TAMANHO_MAX_LOG: _rotacionar()
+        except OSError:
+            pass  # métrica nunca derruba o app
+
+def registrar(etapa, segundos, **extra):
+    """Guarda uma duração já medida (ex.: tempo por página que veio de um processo do lote)."""
+    with _lock:
+        _amostras.setdefault(etapa, deque(maxlen=AMOSTRAS_POR_ETAPA)).append(segundos)
+    _escrever_log({"ts": round(time.time(), 3), "etapa": etapa, "segundos": round(segundos, 4), "pid": os.getpid(), **extra})
+
+@contextmanager
+def medir(etapa, **extra):
+    t0 = time.perf_counter()
+    try: yield
+    finally: registrar(etapa, time.perf_counter() - t0, **extra)
+
+def contar(nome, n=1):
+    """Contador global; também soma no rerun em andamento desta thread (ver rerun())."""
+    with _lock: _contadores[nome] = _contadores.get(nome, 0) + n
+    atual = getattr(_rerun, "contadores", None)
+    if atual is not None: atual[nome] = atual.get(nome, 0) + n
+
+@contextmanager
+def rerun(nome="rerun"):
+    """Mede um rerun do Streamlit e quantas leituras remotas ele fez (contagem por thread do script)."""
+    _rerun.contadores = {}
+    t0 = time.perf_counter()
+    try: yield
+    finally:
+        contadores = _rerun.contadores; _rerun.contadores = None
+        registrar(nome, time.perf_counter() - t0, **contadores)
+        with _lock:
+            _amostras.setdefault("rerun.leituras_remotas (qtd)", deque(maxlen=AMOSTRAS_POR_ETAPA)).append(contadores.get("leituras_remotas", 0))
+
+# ==========================================
+# 🚀 INÍCIO DO PROCESSO
+# ==========================================
+
+def modulos_pesados():
+    """Quais de MODULOS_PESADOS já foram importados neste processo."""
+    return [m for m in MODULOS_PESADOS if m in sys.modules]
+
+def marcar_inicio(etapa, t0):
+    """Primeira vez que `etapa` termina neste processo (o 1º rerun é o que paga os imports)."""
+    with _lock:
+        if etapa in _inicio: return
+        _inicio[etapa] = marca = {"segundos": round(time.perf_counter() - t0, 3), "modulos": modulos_pesados()}
+    registrar(etapa, marca["segundos"], modulos=marca["modulos"])
+
+def inicio():
+    with _lock: return {k: dict(v) for k, v in _inicio.items()}
+
+# ==========================================
+# 📊 RESUMO
+# ==========================================
+
+def _percentil(ordenados, q):
+    return ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))]
+
+def resumo():
+    """Uma linha por etapa: n, p50, p95 e máximo das últimas AMOSTRAS_POR_ETAPA medições."""
+    with _lock: copias = {k: sorted(v) for k, v in _amostras.items() if v}
+    return [{"ETAPA": k, "N": len(v), "P50": round(_percentil(v, 0.5), 3), "P95": round(_percentil(v, 0.95), 3), "MÁX": round(v[-1], 3)}
+            for k, v in sorted(copias.items())]
+
+def contadores():
+    with _lock: return dict(_contadores)
+
+def eh_admin(username):
+    return bool(username) and username in ADMINS
@@ -0,0 +1,369 @@
+"""Serviço local de OCR: um modelo easyOCR quente por máquina.
+
+Uso:
+    python servico_ocr.py            # sobe o serviço (carrega o modelo antes de aceitar conexões)
+    python servico_ocr.py --estado   # mostra fila e latência de um serviço já rodando
+
+As sessões do Streamlit e os processos do lote mandam as imagens das páginas por
+um socket local; o serviço junta páginas de várias origens e, quando têm o mesmo
+tamanho, lê todas numa única chamada `readtext_batched`.
+
+Protocolo sem pickle: cada mensagem é um cabeçalho JSON (precedido do tamanho)
+seguido dos bytes crus das imagens. Na conexão, cliente e serviço provam um ao
+outro que conhecem a chave da instalação (HMAC sobre desafios aleatórios). No
+Linux/Mac o socket fica numa pasta 0700 do usuário; no Windows, em 127.0.0.1.
+"""
+import os
+import sys
+import hmac
+import json
+import stat
+import time
+import queue
+import socket
+import struct
+import hashlib
+import secrets
+import argparse
+import tempfile
+import functools
+import threading
+import subprocess
+from collections import deque
+
+PORTA_WINDOWS = int(os.environ.get("FUSEX_OCR_PORTA", "47813"))
+# Chave aleatória por instalação, criada na 1ª vez (arquivo 0600); FUSEX_OCR_CHAVE sobrepõe
+ARQUIVO_CHAVE = os.environ.get("FUSEX_OCR_CHAVE_ARQUIVO", os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados", "ocr.chave"))
+# FUSEX_OCR_SERVICO=0 faz cada processo usar o próprio modelo (comportamento antigo)
+USAR_SERVICO = os.environ.get("FUSEX_OCR_SERVICO", "1") == "1"
+# O serviço sobe na primeira página escaneada; FUSEX_OCR_NO_BOOT=1 sobe junto com o servidor
+SUBIR_NO_BOOT = os.environ.get("FUSEX_OCR_NO_BOOT", "0") == "1"
+TIMEOUT_SUBIDA = 300  # carga do modelo (torch + easyOCR) numa máquina fria
+
+LOTE_MAX = 8          # páginas por chamada ao modelo
+JANELA_LOTE = 0.05    # segundos esperando outras páginas para completar o lote
+TIMEOUT_CLIENTE = 600
+TIMEOUT_APRESENTACAO = 5
+LIMITE_CABECALHO = 1 << 20
+LIMITE_MENSAGEM = 512 << 20
+
+# ==========================================
+# 🔑 ENDEREÇO, CHAVE E PROTOCOLO
+# ==========================================
+
+def pasta_privada():
+    """Pasta 0700 do usuário para o socket e a trava (FUSEX_OCR_DIR escolhe outra)."""
+    pasta = os.environ.get("FUSEX_OCR_DIR") or os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), f"fusex-ocr-{os.getuid()}")
+    try: os.mkdir(pasta, 0o700)
+    except FileExistsError: pass
+    info = os.lstat(pasta)
+    # Pasta criada antes por outro usuário (ou link) seria a porta para trocar o socket
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{pasta} não é uma pasta privada deste usuário")
+    return pasta
+
+def endereco():
+    if os.name == 'nt': return ("127.0.0.1", PORTA_WINDOWS)
+    return os.path.join(pasta_privada(), "ocr.sock")
+
+@functools.lru_cache(maxsize=1)
+def _chave():
+    if os.environ.get("FUSEX_OCR_CHAVE"): return os.environ["FUSEX_OCR_CHAVE"].encode("utf-8")
+    if not os.path.exists(ARQUIVO_CHAVE):
+        os.makedirs(os.path.dirname(ARQUIVO_CHAVE), exist_ok=True)
+        # Grava num temporário 0600 e publica com link: quem perder a corrida lê a chave de quem ganhou
+        temp = f"{ARQUIVO_CHAVE}.{os.getpid()}.tmp"
+        fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f: f.write(secrets.token_hex(32))
+        try: os.link(temp, ARQUIVO_CHAVE)
+        except FileExistsError: pass
+        finally: os.remove(temp)
+    with open(ARQUIVO_CHAVE, encoding="utf-8") as f: return f.read().strip().encode("utf-8")
+
+def _prova(papel, desafio):
+    return hmac.new(_chave(), papel + bytes.fromhex(desafio), hashlib.sha256).hexdigest()
+
+def _ler_exato(sock, n):
+    buf = bytearray(n); vista = memoryview(buf); lidos = 0
+    while lidos < n:
+        k = sock.recv_into(vista[lidos:])
+        if not k: raise EOFError("conexão fechada")
+        lidos += k
+    return bytes(buf)
+
+def _enviar(sock, cabecalho, blobs=()):
+    cab = json.dumps(dict(cabecalho, blobs=[len(b) for b in blobs])).encode("utf-8")
+    sock.sendall(struct.pack(">I", len(cab)) + cab)
+    for b in blobs: sock.sendall(b)
+
+def _receber(sock):
+    """(cabeçalho, blobs). Tamanhos conferidos antes de alocar: mensagem absurda derruba só a conexão."""
+    (n,) = struct.unpack(">I", _ler_exato(sock, 4))
+    if n > LIMITE_CABECALHO: raise ValueError("cabeçalho grande demais")
+    cab = json.loads(_ler_exato(sock, n))
+    tamanhos = cab.pop("blobs", [])
+    if any(not isinstance(t, int) or t < 0 for t in tamanhos) or sum(tamanhos) > LIMITE_MENSAGEM:
+        raise ValueError("mensagem grande demais")
+    return cab, [_ler_exato(sock, t) for t in tamanhos]
+
+def _empacotar(imagens):
+    """Imagens -> (descrições, bytes): PNG vai como está; array uint8 vai cru, com a forma."""
+    descricoes, blobs = [], []
+    for img in imagens:
+        if isinstance(img, (bytes, bytearray)):
+            descricoes.append({"formato": "png"}); blobs.append(bytes(img))
+        else:
+            import numpy as np
+            img = np.ascontiguousarray(img, dtype=np.uint8)
+            descricoes.append({"formato": "array", "forma": list(img.shape)}); blobs.append(img.tobytes())
+    return descricoes, blobs
+
+# ==========================================
+# 🖥 SERVIDOR
+# ==========================================
+
+class Pedido:
+    def __init__(self, descricao, conteudo):
+        self.descricao = descricao
+        self.conteudo = conteudo
+        self.chegada = time.monotonic()
+        self.texto = None
+        self.erro = None
+        self.pronto = threading.Event()
+
+class ServicoOCR:
+    def __init__(self, reader):
+        self.reader = reader
+        self.fila = queue.Queue()
+        self.latencias = deque(maxlen=1000)
+        self.paginas = 0
+        self.chamadas = 0
+        self.inicio = time.time()
+
+    # --- LOTES ---
+    def _decodificar(self, pedido):
+        import numpy as np
+        if pedido.descricao.get("formato") == "png":
+            import cv2
+            return cv2.imdecode(np.frombuffer(pedido.conteudo, np.uint8), cv2.IMREAD_COLOR)
+        forma = tuple(int(d) for d in pedido.descricao["forma"])
+        if len(forma) not in (2, 3): raise ValueError(f"forma de imagem inválida: {forma}")
+        return np.frombuffer(pedido.conteudo, np.uint8).reshape(forma)
+
+    def _concluir(self, pedidos):
+        agora = time.monotonic()
+        for p in pedidos:
+            self.latencias.append(agora - p.chegada); self.paginas += 1
+            p.pronto.set()
+
+    def _ler(self, pedidos):
+        # Só dá para juntar numa chamada imagens do mesmo tamanho (redimensionar distorce o texto)
+        grupos = {}
+        for p in pedidos:
+            try: img = self._decodificar(p)
+            except Exception as e:
+                p.erro = f"imagem inválida: {e}"; self._concluir([p]); continue
+            grupos.setdefault(img.shape, []).append((p, img))
+        for itens in grupos.values():
+            try:
+                if len(itens) == 1:
+                    resultados = [self.reader.readtext(itens[0][1], detail=0, paragraph=True)]
+                else:
+                    resultados = self.reader.readtext_batched([img for _, img in itens], detail=0, paragraph=True)
+                self.chamadas += 1
+                for (p, _), r in zip(itens, resultados): p.texto = "\n".join(r)
+            except Exception as e:
+                for p, _ in itens: p.erro = str(e)
+            self._concluir([p for p, _ in itens])
+
+    def _loop_lotes(self):
+        while True:
+            pedidos = [self.fila.get()]
+            try:
+                limite = time.monotonic() + JANELA_LOTE
+                while len(pedidos) < LOTE_MAX:
+                    restante = limite - time.monotonic()
+                    if restante <= 0: break
+                    try: pedidos.append(self.fila.get(timeout=restante))
+                    except queue.Empty: break
+                self._ler(pedidos)
+            except Exception as e:
+                # Nenhum pedido fica sem resposta e a thread dos lotes segue viva
+                pendentes = [p for p in pedidos if not p.pronto.is_set()]
+                for p in pendentes: p.erro = p.erro or str(e)
+                self._concluir(pendentes)
+
+    # --- CONEXÕES ---
+    def estado(self):
+        lat = sorted(self.latencias)
+        def pct(q): return round(lat[min(len(lat) - 1, int(q * len(lat)))], 3) if lat else None
+        return {"fila": self.fila.qsize(), "paginas": self.paginas, "chamadas_modelo": self.chamadas,
+                "paginas_por_chamada": round(self.paginas / self.chamadas, 2) if self.chamadas else None,
+                "latencia_p50": pct(0.5), "latencia_p95": pct(0.95), "no_ar_desde": self.inicio, "pid": os.getpid()}
+
+    def _apresentar(self, sock):
+        """Desafio-resposta: o cliente prova a chave e recebe a prova do serviço."""
+        sock.settimeout(TIMEOUT_APRESENTACAO)
+        desafio = secrets.token_hex(16)
+        _enviar(sock, {"desafio": desafio})
+        cab, _ = _receber(sock)
+        if not hmac.compare_digest(str(cab.get("prova", "")), _prova(b"cliente", desafio)): raise PermissionError("chave errada")
+        _enviar(sock, {"prova": _prova(b"servico", str(cab["desafio"]))})
+        sock.settimeout(None)
+
+    def _atender(self, sock):
+        try:
+            self._apresentar(sock)
+            while True:
+                try: msg, blobs = _receber(sock)
+                except EOFError: break
+                if msg.get("tipo") == "estado":
+                    _enviar(sock, self.estado()); continue
+                descricoes = msg.get("imagens", [])
+                if len(descricoes) != len(blobs):
+                    _enviar(sock, {"erro": "imagens e conteúdos não batem"}); continue
+                pedidos = [Pedido(d, b) for d, b in zip(descricoes, blobs)]
+                for p in pedidos: self.fila.put(p)
+                for p in pedidos: p.pronto.wait()
+                erros = [p.erro for p in pedidos if p.erro]
+                if erros: _enviar(sock, {"erro": erros[0]})
+                else: _enviar(sock, {"textos": [p.texto for p in pedidos]})
+        except Exception:
+            pass  # cliente com chave errada, mensagem inválida ou que desistiu: só esta conexão cai
+        finally:
+            sock.close()
+
+    def servir(self):
+        alvo = endereco()
+        if os.name == 'nt':
+            servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            servidor.bind(alvo)
+        else:
+            if os.path.exists(alvo): os.remove(alvo)  # socket que sobrou de um serviço que caiu
+            servidor = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            anterior = os.umask(0o077)  # o socket já nasce 0600, sem janela antes do chmod
+            try: servidor.bind(alvo)
+            finally: os.umask(anterior)
+        servidor.listen(64)
+        threading.Thread(target=self._loop_lotes, daemon=True).start()
+        print(f"Serviço de OCR pronto em {alvo} (pid {os.getpid()})", flush=True)
+        with servidor:
+            while True:
+                try: sock, _ = servidor.accept()
+                except OSError: continue
+                threading.Thread(target=self._atender, args=(sock,), daemon=True).start()
+
+# ==========================================
+# 🔌 CLIENTE
+# ==========================================
+
+_local = threading.local()
+
+def _conectar():
+    if os.name == 'nt':
+        sock = socket.create_connection(endereco(), timeout=TIMEOUT_APRESENTACAO)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(TIMEOUT_APRESENTACAO)
+        sock.connect(endereco())
+    try:
+        cab, _ = _receber(sock)
+        desafio = secrets.token_hex(16)
+        _enviar(sock, {"prova": _prova(b"cliente", str(cab["desafio"])), "desafio": desafio})
+        resposta, _ = _receber(sock)
+        if not hmac.compare_digest(str(resposta.get("prova", "")), _prova(b"servico", desafio)):
+            raise PermissionError("Serviço de OCR não provou a chave da instalação")
+    except Exception:
+        sock.close(); raise
+    return sock
+
+def _conexao():
+    c = getattr(_local, "conexao", None)
+    if c is None:
+        c = _conectar(); _local.conexao = c
+    return c
+
+def _descartar_conexao():
+    c = getattr(_local, "conexao", None)
+    _local.conexao = None
+    if c is not None:
+        try: c.close()
+        except OSError: pass
+
+def _pedir(msg, blobs=(), timeout=TIMEOUT_CLIENTE):
+    c = _conexao()
+    try:
+        c.settimeout(timeout)
+        _enviar(c, msg, blobs)
+        try: return _receber(c)[0]
+        except socket.timeout: raise TimeoutError("Serviço de OCR não respondeu")
+    except Exception:
+        _descartar_conexao(); raise
+
+def disponivel():
+    if not USAR_SERVICO: return False
+    try: _conexao(); return True
+    except (OSError, EOFError, ValueError, KeyError): return False
+
+def ler_imagens(imagens):
+    """Manda as páginas (PNG ou array) para o serviço; levanta erro se ele não estiver no ar."""
+    descricoes, blobs = _empacotar(imagens)
+    resposta = _pedir({"tipo": "ocr", "imagens": descricoes}, blobs)
+    if "erro" in resposta: raise RuntimeError(f"Serviço de OCR: {resposta['erro']}")
+    return resposta["textos"]
+
+def estado_servico():
+    try: return _pedir({"tipo": "estado"}, timeout=5)
+    except Exception: return None
+
+def _subir():
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__)], stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+def iniciar_em_segundo_plano():
+    """Sobe o serviço desta máquina se ainda não estiver no ar (a trava garante um só por máquina)."""
+    if not USAR_SERVICO or disponivel(): return False
+    _subir()
+    return True
+
+_subida_falhou = False
+
+def subir_e_esperar(timeout=TIMEOUT_SUBIDA):
+    """Sobe o serviço (se preciso) e espera o modelo carregar. False se ele não subir (ex.: sem
+    easyocr): quem chamou lê no próprio processo, e este processo não tenta de novo."""
+    global _subida_falhou
+    if not USAR_SERVICO or _subida_falhou: return False
+    if disponivel(): return True
+    proc = _subir()
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        time.sleep(0.2)
+        if disponivel(): return True
+        # Código 0 = outro processo já está subindo o serviço (trava): continua esperando
+        if proc.poll() not in (None, 0): break
+    _subida_falhou = True
+    return False
+
+def main():
+    ap = argparse.ArgumentParser(description="Serviço local de OCR (easyOCR pré-carregado).")
+    ap.add_argument("--estado", action="store_true", help="mostra o estado do serviço em execução")
+    args = ap.parse_args()
+    if args.estado:
+        print(estado_servico() or "Serviço de OCR fora do ar."); return
+
+    if os.name != 'nt':
+        # Trava por máquina: se outro serviço já está subindo/rodando, este sai sem carregar o modelo
+        import fcntl
+        trava = open(os.path.join(pasta_privada(), "ocr.lock"), "w")
+        try: fcntl.flock(trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError: print("Serviço de OCR já está rodando nesta máquina."); return
+
+    _chave()  # cria a chave da instalação antes de aceitar conexões
+    import easyocr
+    t0 = time.perf_counter()
+    reader = easyocr.Reader(['pt'], gpu=False, quantize=True)
+    print(f"Modelo carregado em {time.perf_counter() - t0:.1f}s", flush=True)
+    ServicoOCR(reader).servir()
+
+if __name__ == "__main__":
+    main()
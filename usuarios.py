@@ -0,0 +1,90 @@
+import time
+import threading
+from datetime import datetime
+import bcrypt
+import pandas as pd
+from metricas import medir
+
+TTL_USUARIOS = 30
+# Recarga forçada (usuário não achado / cadastro) no máximo a cada tantos segundos
+INTERVALO_RECARGA = 5
+
+def gerar_hash(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+def conferir_senha(password, stored_hash):
+    try: return bcrypt.checkpw(password.encode('utf-8'), str(stored_hash).encode('utf-8'))
+    except ValueError: return False  # hash inválido/vazio na planilha
+
+class DiretorioUsuarios:
+    """Mapa username -> (nome, hash) em memória, compartilhado entre as sessões.
+
+    `carregar` devolve o DataFrame de usuários (leitura remota), feita no máximo
+    uma vez por TTL; `anexar` grava um usuário novo sem reescrever os outros.
+    """
+
+    def __init__(self, carregar, anexar, ttl=TTL_USUARIOS):
+        self._carregar = carregar
+        self._anexar = anexar
+        self.ttl = ttl
+        self._mapa = None
+        self._carregado_em = 0.0
+        self._lock = threading.Lock()
+        self._recarga = threading.Lock()  # uma leitura remota por vez
+
+    def _ler(self):
+        df = self._carregar()
+        mapa = {}
+        if df is not None and not df.empty:
+            for r in df.to_dict("records"):
+                if pd.isna(r.get("username")): continue
+                mapa[str(r["username"])] = (r.get("name", ""), r.get("password_hash", ""))
+        return mapa
+
+    def _vencido(self, forcar):
+        idade = time.monotonic() - self._carregado_em
+        return self._mapa is None or idade > self.ttl or (forcar and idade > INTERVALO_RECARGA)
+
+    def usuarios(self, forcar=False):
+        """A leitura remota roda fora do _lock: logins com o mapa em memória não esperam pela rede."""
+        with self._lock:
+            if not self._vencido(forcar): return self._mapa
+            mapa = self._mapa
+        # Já recarregando em outra sessão: o TTL venceu, mas o mapa atual serve (sem mapa ou forçado, espera)
+        if not self._recarga.acquire(blocking=mapa is None or forcar): return mapa
+        try:
+            with self._lock:
+                if not self._vencido(forcar): return self._mapa  # outra sessão recarregou enquanto esta esperava
+            novo = self._ler()
+            with self._lock:
+                self._mapa = novo; self._carregado_em = time.monotonic()
+            return novo
+        finally:
+            self._recarga.release()
+
+    def invalidar(self):
+        with self._lock: self._mapa = None
+
+    def autenticar(self, username, password):
+        """(True, nome) ou (False, mensagem)."""
+        mapa = self.usuarios()
+        if not mapa: return False, "Nenhum usuário cadastrado."
+        if username not in mapa:
+            # Pode ter sido cadastrado em outro servidor depois da última leitura
+            mapa = self.usuarios(forcar=True)
+            if username not in mapa: return False, "Usuário não encontrado."
+        nome, stored_hash = mapa[username]
+        with medir("login.bcrypt"): ok = conferir_senha(password, stored_hash)
+        if ok: return True, nome
+        return False, "Senha incorreta."
+
+    def cadastrar(self, username, name, password):
+        if username in self.usuarios(forcar=True): return False, "Usuário já existe!"
+        hashed = gerar_hash(password)
+        registro = {"username": username, "name": name, "password_hash": hashed,
+                    "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        try: self._anexar(registro)
+        except Exception as e: return False, f"Erro ao salvar: {e}"
+        with self._lock:
+            if self._mapa is not None: self._mapa[username] = (name, hashed)
+        return True, "Usuário criado com sucesso!"